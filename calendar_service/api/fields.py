@@ -1,6 +1,9 @@
 import json
 
-from rest_framework import serializers
+from django.utils import six
+from rest_framework import serializers, relations
+
+from api.reverse import reverse
 
 
 class JSONSerializerField(serializers.Field):
@@ -8,4 +11,25 @@ class JSONSerializerField(serializers.Field):
     def to_internal_value(self, data):
         return json.loads(data)
     def to_representation(self, value):
-        return json.dumps(value)
\ No newline at end of file
+        return json.dumps(value)
+
+
+class HyperlinkedRelatedField(relations.HyperlinkedRelatedField):
+    """ HyperlinkedRelatedField building its urls from url templates """
+    def __init__(self, view_name=None, **kwargs):
+        super(HyperlinkedRelatedField, self).__init__(view_name, **kwargs)
+        self.reverse = reverse
+
+
+class HyperlinkedIdentityField(relations.HyperlinkedIdentityField):
+    """ HyperlinkedIdentityField building its urls from url templates """
+    def __init__(self, view_name=None, **kwargs):
+        super(HyperlinkedIdentityField, self).__init__(view_name, **kwargs)
+        self.reverse = reverse
+
+    def get_name(self, obj):
+        # the name only labels the link in the browsable api, objects loaded
+        # with sparse fields are not read further for it
+        if getattr(obj, '_deferred', False):
+            return six.text_type(obj.pk)
+        return super(HyperlinkedIdentityField, self).get_name(obj)
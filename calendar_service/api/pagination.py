@@ -0,0 +1,144 @@
+from base64 import b64decode, b64encode
+from itertools import dropwhile, islice
+
+from dateutil import parser
+from django.utils.six.moves.urllib import parse as urlparse
+from django.utils.translation import ugettext_lazy as _
+from rest_framework.compat import OrderedDict
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def occurrence_position(occ):
+    ''' the (original_start, id) pair occurrence streams are ordered and resumed by,
+    generated occurrences have no id and sort before persisted ones of the same slot '''
+    return (occ.original_start, occ.pk or 0)
+
+
+class KeysetPagination(BasePagination):
+    '''
+    Forward only cursor pagination on a (datetime, id) position. The cursor
+    is an opaque encoding of the position of the last object of the page,
+    subclasses read the page after it off their queryset with
+    paginate_queryset and tell the position of an object with get_position.
+    '''
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = 1000
+    invalid_cursor_message = _('Invalid cursor')
+
+    def decode_cursor(self, request):
+        ''' returns the position encoded in the cursor of the request, None without a cursor '''
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = urlparse.parse_qs(querystring)
+            moment = parser.parse(tokens['s'][0])
+            pk = _positive_int(tokens.get('i', ['0'])[0])
+        except (TypeError, ValueError, KeyError, OverflowError):
+            raise NotFound(self.invalid_cursor_message)
+        if moment.tzinfo is None:
+            raise NotFound(self.invalid_cursor_message)
+        return (moment, pk)
+
+    def encode_cursor(self, position):
+        moment, pk = position
+        tokens = {'s': moment.isoformat()}
+        if pk:
+            tokens['i'] = str(pk)
+        querystring = urlparse.urlencode(sorted(tokens.items()))
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_position(self, obj):
+        raise NotImplementedError('get_position() must be implemented.')
+
+    def set_page(self, objects):
+        # one more than the page tells if there is a next page
+        page = list(islice(objects, self.page_size + 1))
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]))
+
+    def get_previous_link(self):
+        return None
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class OccurrenceCursorPagination(KeysetPagination):
+    '''
+    Pages through a stream of occurrences ordered by occurrence_position. The
+    view reads the cursor with decode_cursor before expanding so that the
+    next page resumes the expansion right after the last occurrence sent
+    instead of from the beginning of the series.
+    '''
+
+    def get_position(self, occ):
+        return occurrence_position(occ)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ''' reads one page off ``queryset``, any iterable of occurrences ordered by
+        occurrence_position that the view resumed at the slot of the cursor,
+        skipping the occurrences of that slot already sent '''
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        position = self.decode_cursor(request)
+        occurrences = iter(queryset)
+        if position is not None:
+            occurrences = dropwhile(lambda occ: occurrence_position(occ) <= position, occurrences)
+        return self.set_page(occurrences)
+
+
+class EventKeysetPagination(KeysetPagination):
+    '''
+    Pages through events ordered by (start, id), seeking past the cursor in
+    the query so that a deep page costs what the first one does.
+    '''
+    ordering = ('start', 'id')
+
+    def get_position(self, event):
+        return (event.start, event.pk)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        position = self.decode_cursor(request)
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            start, pk = position
+            # the range on start alone lets the (start, id) indexes seek
+            queryset = queryset.filter(start__gte=start).exclude(start=start, pk__lte=pk)
+        return self.set_page(queryset[:self.page_size + 1])
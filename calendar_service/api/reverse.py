@@ -0,0 +1,124 @@
+"""
+URL building for the API serializers.
+
+A response lists many objects with several hyperlinks each, and reverse()
+looks the route up and matches its pattern for every single one of them. A
+URLTemplate resolves a route once per process and keeps its format strings,
+the ``reverse`` below fills them in and returns the very same URLs
+rest_framework.reverse.reverse does, which it falls back to for anything the
+templates do not cover (namespaced routes, prefixes with arguments,
+versioned requests). The templates mirror the resolver internals of the
+Django versions in TEMPLATE_DJANGO_VERSIONS, other versions always fall back.
+"""
+from __future__ import unicode_literals
+import re
+
+import django
+from django.core.urlresolvers import NoReverseMatch, get_resolver, get_script_prefix, get_urlconf
+from django.utils import six
+from django.utils.encoding import force_text, iri_to_uri
+from django.utils.http import RFC3986_SUBDELIMS, urlquote
+from django.utils.regex_helper import normalize
+from rest_framework import reverse as drf_reverse
+
+# the versions whose RegexURLResolver._reverse_with_prefix URLTemplate follows
+TEMPLATE_DJANGO_VERSIONS = ((1, 8),)
+
+# the resolved templates by urlconf, script prefix, view name and arguments
+_templates = {}
+
+
+class URLTemplate(object):
+    """
+    The ways a named route can be built from a given set of arguments, the
+    format string and pattern of each, tried in the order Django tries them.
+    """
+
+    def __init__(self, view_name, params, prefix='/', urlconf=None):
+        self.view_name = view_name
+        self.params = params
+        prefix_norm, prefix_args = normalize(urlquote(prefix))[0]
+        self.candidates = []
+        if prefix_args or django.VERSION[:2] not in TEMPLATE_DJANGO_VERSIONS:
+            return
+        try:
+            possibilities = get_resolver(urlconf).reverse_dict.getlist(view_name)
+        except AttributeError:
+            return
+        for possibility, pattern, defaults in possibilities:
+            for result, route_params in possibility:
+                if isinstance(params, int):
+                    if params != len(route_params):
+                        continue
+                elif defaults:
+                    # keyword arguments are matched against defaults too,
+                    # leave such routes to reverse()
+                    self.candidates = []
+                    return
+                elif set(params) != set(route_params):
+                    continue
+                self.candidates.append((
+                    prefix_norm.replace('%', '%%') + result,
+                    list(route_params),
+                    re.compile('^%s%s' % (re.escape(prefix_norm), pattern), re.UNICODE)))
+
+    def __call__(self, args=None, kwargs=None):
+        """
+        Returns the path reverse() returns for the route with ``args`` or
+        ``kwargs``, raises NoReverseMatch if the route does not accept them.
+        """
+        for candidate_pat, route_params, regex in self.candidates:
+            if args:
+                subs = dict(zip(route_params, [force_text(v) for v in args]))
+            else:
+                subs = dict((k, force_text(v)) for (k, v) in kwargs.items())
+            if regex.search(candidate_pat % subs):
+                url = candidate_pat % dict((k, urlquote(v, safe=RFC3986_SUBDELIMS + str('/~:@')))
+                                           for (k, v) in subs.items())
+                if url.startswith('//'):
+                    url = '/%%2F%s' % url[2:]
+                return force_text(iri_to_uri(url))
+        raise NoReverseMatch("Reverse for '%s' with arguments '%s' and keyword arguments '%s' not found." % (
+            self.view_name, args, kwargs))
+
+
+def get_url_template(view_name, params):
+    """
+    Returns the URLTemplate of ``view_name`` for ``params``, the number of
+    positional arguments or a frozenset of the keyword arguments, None if
+    there is no template for them and reverse() has to be called instead.
+    """
+    key = (get_urlconf(), get_script_prefix(), view_name, params)
+    if key not in _templates:
+        template = URLTemplate(view_name, params, key[1], key[0])
+        _templates[key] = template if template.candidates else None
+    return _templates[key]
+
+
+def _absolute_url(request, url):
+    # build_absolute_uri of a path, the scheme and host are looked up once
+    # per request
+    base = getattr(request, '_url_template_base', None)
+    if base is None:
+        base = '%s://%s' % (request.scheme, request.get_host())
+        request._url_template_base = base
+    return iri_to_uri(base + url)
+
+
+def reverse(viewname, args=None, kwargs=None, request=None, format=None, **extra):
+    """
+    rest_framework.reverse.reverse, building the URLs of named routes from
+    their URLTemplate.
+    """
+    if format is not None:
+        kwargs = dict(kwargs or {}, format=format)
+    template = None
+    if (isinstance(viewname, six.string_types) and ':' not in viewname and not extra and
+            not (args and kwargs) and getattr(request, 'versioning_scheme', None) is None):
+        template = get_url_template(viewname, len(args) if args else frozenset(kwargs or ()))
+    if template is None:
+        return drf_reverse.reverse(viewname, args, kwargs, request, None, **extra)
+    url = template(args, kwargs or {})
+    if request:
+        url = _absolute_url(request, url)
+    return drf_reverse.preserve_builtin_query_params(url, request)
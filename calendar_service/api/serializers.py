@@ -1,21 +1,38 @@
 
 from django.core.urlresolvers import NoReverseMatch
 from rest_framework import serializers, fields
-from rest_framework.reverse import reverse
 
-from api.fields import JSONSerializerField
+from api.fields import JSONSerializerField, HyperlinkedRelatedField, HyperlinkedIdentityField
+from api.reverse import reverse
 from schedule.models.calendars import Calendar
 from schedule.models.events import Event, Occurrence
 from schedule.models.rules import Rule
 from api.utils import get_detail_routes
 
 
-class CalendarSerializer(serializers.HyperlinkedModelSerializer):
+class HyperlinkedModelSerializer(serializers.HyperlinkedModelSerializer):
+    ''' HyperlinkedModelSerializer building the urls of its fields from url templates,
+    serializing only the ``fields`` or all but the ``exclude`` field names it is given '''
+    serializer_related_field = HyperlinkedRelatedField
+    serializer_url_field = HyperlinkedIdentityField
+    
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        exclude = kwargs.pop('exclude', None)
+        super(HyperlinkedModelSerializer, self).__init__(*args, **kwargs)
+        if fields is None and exclude is None:
+            return
+        for name in list(self.fields):
+            if (fields is not None and name not in fields) or (exclude is not None and name in exclude):
+                self.fields.pop(name)
+
+
+class CalendarSerializer(HyperlinkedModelSerializer):
     class Meta:
         model = Calendar
 
 
-class EventSerializer(serializers.HyperlinkedModelSerializer):
+class EventSerializer(HyperlinkedModelSerializer):
     occurrences = fields.SerializerMethodField()
     rule_params = JSONSerializerField(required=False) # required to make json field writable via api
 
@@ -23,10 +40,14 @@ class EventSerializer(serializers.HyperlinkedModelSerializer):
         model = Event
         
     def get_occurrences(self, event):
+        # the view may have expanded the occurrences to embed in place of the link
+        if 'occurrences' in self._context:
+            occurrences = self._context['occurrences'].get(event.id, [])
+            return OccurrenceSerializer(occurrences, many=True, context=self._context).data
         return reverse('event-detail', args=[event.id], request=self._context['request']) + 'occurrences/'
 
 
-class OccurrenceSerializer(serializers.HyperlinkedModelSerializer):
+class OccurrenceSerializer(HyperlinkedModelSerializer):
     id = fields.IntegerField(read_only=True)
     url = fields.SerializerMethodField()
     methods = fields.SerializerMethodField()
@@ -56,6 +77,6 @@ class OccurrenceSerializer(serializers.HyperlinkedModelSerializer):
         return reverse('occurrence-detail', args=lookups.values(), request=self._context['request'])
 
 
-class RuleSerializer(serializers.HyperlinkedModelSerializer):
+class RuleSerializer(HyperlinkedModelSerializer):
     class Meta:
         model = Rule
@@ -1,11 +1,21 @@
 from datetime import timedelta
 import json
 
+from django.core.urlresolvers import NoReverseMatch, set_script_prefix
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from model_mommy import mommy
 from rest_framework.reverse import reverse
-from rest_framework.test import APITestCase
+from rest_framework.test import APIRequestFactory, APITestCase
 
+from api import reverse as api_reverse_module
+from api.pagination import occurrence_position
+from api.reverse import reverse as api_reverse
+from api.views import BulkOccurrenceViewSet
+
+from schedule.models.calendars import Calendar
 from schedule.models.events import Event
 from schedule.models.rules import Rule
 
@@ -98,4 +108,348 @@ class CalendarAPITestCase(APITestCase):
             'description': 'WEEKLY',
         }
         response = self.client.post(url, data=data)
-        self.assertEqual(response.status_code, 201, response.content)
\ No newline at end of file
+        self.assertEqual(response.status_code, 201, response.content)
+
+class OccurrenceCursorTestCase(APITestCase):
+    
+    def setUp(self):
+        start = timezone.now().replace(microsecond=0)
+        self.event = mommy.make(
+            Event,
+            rule=mommy.make(Rule, frequency="DAILY"),
+            start=start,
+            end=start + timedelta(hours=1)
+        )
+        self.url = reverse('occurrence-list', args=[self.event.id])
+    
+    def read_pages(self, params):
+        starts = []
+        url = self.url
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, response.content)
+            page = json.loads(response.content)
+            self.assertIsNone(page['previous'])
+            starts += [occ['start'] for occ in page['results']]
+            url, params = page['next'], None
+        return starts
+    
+    def test_stream_pages(self):
+        # persist and move an occurrence so that the stream holds one with an id
+        occurrences = list(self.event.get_occurrences(self.event.start, self.event.start + timedelta(days=5)))
+        occurrences[2].move(occurrences[2].start + timedelta(hours=3), occurrences[2].end + timedelta(hours=3))
+        start = self.event.start.isoformat()
+        response = self.client.get(self.url, {'start': start, 'limit': 4})
+        first = json.loads(response.content)
+        self.assertEqual(len(first['results']), 4)
+        self.assertEqual(first['results'][2]['id'], occurrences[2].id)
+        response = self.client.get(first['next'])
+        second = json.loads(response.content)
+        self.assertEqual(len(second['results']), 4)
+        
+        response = self.client.get(self.url, {'start': start, 'limit': 8})
+        whole = json.loads(response.content)['results']
+        self.assertEqual([occ['start'] for occ in whole],
+                         [occ['start'] for occ in first['results'] + second['results']])
+    
+    def test_window_pages(self):
+        self.event.end_recurring_period = self.event.start + timedelta(days=24)
+        self.event.save()
+        starts = self.read_pages({'start': self.event.start.isoformat(),
+                                  'end': (self.event.start + timedelta(days=30)).isoformat()})
+        self.assertEqual(len(starts), 25)
+        self.assertEqual(len(set(starts)), 25)
+        
+        # the stream ends with the series
+        self.assertEqual(self.read_pages({'start': self.event.start.isoformat(), 'limit': 10}), starts)
+
+    def test_resumed_window_pages(self):
+        start, end = self.event.start + timedelta(days=1), self.event.start + timedelta(days=30)
+        occurrences = self.event.get_occurrences(start, end)
+        # moved back across the page breaks, out of the window and cancelled
+        occurrences[15].move(occurrences[2].start + timedelta(hours=3), occurrences[2].end + timedelta(hours=3))
+        occurrences[8].move(start - timedelta(days=3), start - timedelta(days=3, hours=-1))
+        occurrences[12].cancel()
+        starts = self.read_pages({'start': start.isoformat(), 'end': end.isoformat()})
+        expected = sorted(self.event.get_occurrences(start, end), key=occurrence_position)
+        self.assertEqual(starts, [occ.start.isoformat().replace('+00:00', 'Z') for occ in expected])
+
+        # resuming expands no slot before the cursor
+        after = occurrences[20].original_start
+        resumed = list(self.event.resume_occurrences(start, end, after))
+        self.assertEqual(resumed[0].original_start, after)
+        self.assertEqual(resumed, [occ for occ in expected if occ.original_start >= after])
+
+    def test_page_size(self):
+        response = self.client.get(self.url, {'limit': 5000})
+        self.assertEqual(len(json.loads(response.content)['results']), 1000)
+        
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'limit': 5, 'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404, response.content)
+
+
+class BulkOccurrencesTestCase(APITestCase):
+    
+    def setUp(self):
+        self.start = timezone.now().replace(microsecond=0)
+        self.calendar = mommy.make(Calendar)
+        self.rule = mommy.make(Rule, frequency="DAILY")
+        self.events = [
+            mommy.make(Event, rule=self.rule, calendar=self.calendar,
+                       start=self.start + timedelta(hours=i), end=self.start + timedelta(hours=i + 1))
+            for i in range(3)]
+        self.other = mommy.make(Event, rule=self.rule, start=self.start, end=self.start + timedelta(hours=1))
+        self.params = {'start': self.start.isoformat(), 'end': (self.start + timedelta(days=7)).isoformat()}
+    
+    def single_event_occurrences(self, event):
+        response = self.client.get(reverse('occurrence-list', args=[event.id]), self.params)
+        return json.loads(response.content)['results']
+    
+    def test_bulk_occurrences(self):
+        url = reverse('bulk-occurrence-list')
+        params = dict(self.params, event='%d,%d' % (self.events[0].id, self.other.id))
+        with self.assertNumQueries(2):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        occurrences = json.loads(response.content)
+        expected = self.single_event_occurrences(self.events[0]) + self.single_event_occurrences(self.other)
+        self.assertEqual(sorted((occ['event'], occ['start']) for occ in occurrences),
+                         sorted((occ['event'], occ['start']) for occ in expected))
+        
+        response = self.client.get(url, dict(self.params, calendar=self.calendar.id))
+        self.assertEqual(len(json.loads(response.content)),
+                         sum(len(self.single_event_occurrences(event)) for event in self.events))
+        
+        response = self.client.get(url, self.params)
+        self.assertEqual(response.status_code, 400, response.content)
+        response = self.client.get(url, dict(self.params, event='a,b'))
+        self.assertEqual(response.status_code, 400, response.content)
+
+    def test_bulk_limits(self):
+        url = reverse('bulk-occurrence-list')
+        params = dict(self.params, calendar=self.calendar.id)
+        response = self.client.get(url, dict(params, end=(self.start + timedelta(days=32)).isoformat()))
+        self.assertEqual(response.status_code, 400, response.content)
+        view = BulkOccurrenceViewSet
+        limits = (view.max_events, view.max_occurrences)
+        try:
+            view.max_events = 2
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400, response.content)
+            response = self.client.get(url, dict(self.params, event='1,2,3'))
+            self.assertEqual(response.status_code, 400, response.content)
+            total = sum(len(self.single_event_occurrences(event)) for event in self.events)
+            view.max_events, view.max_occurrences = 3, total - 1
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400, response.content)
+            view.max_occurrences = total
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(len(json.loads(response.content)), total)
+        finally:
+            view.max_events, view.max_occurrences = limits
+        
+    def test_embedded_occurrences(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('event-list'), dict(self.params, embed='occurrences'))
+        self.assertEqual(response.status_code, 200, response.content)
+        events = dict(('http://testserver' + reverse('event-detail', args=[event.id]), event)
+                      for event in self.events + [self.other])
+        for event in json.loads(response.content)['results']:
+            occurrences = self.single_event_occurrences(events[event['url']])
+            self.assertTrue(occurrences)
+            self.assertEqual([occ['start'] for occ in event['occurrences']],
+                             sorted(occ['start'] for occ in occurrences))
+
+
+class URLTemplateTestCase(APITestCase):
+    
+    def setUp(self):
+        self.calendar = mommy.make(Calendar)
+        self.event = mommy.make(
+            Event,
+            rule=mommy.make(Rule, frequency="WEEKLY"),
+            calendar=self.calendar,
+            start=timezone.now().replace(microsecond=0),
+            end=timezone.now().replace(microsecond=0) + timedelta(hours=2)
+        )
+    
+    def assertSameURL(self, *args, **kwargs):
+        for request in (None, APIRequestFactory().get('/api/'), APIRequestFactory().get('/api/', {'format': 'json'})):
+            try:
+                expected = reverse(*args, request=request, **kwargs)
+            except NoReverseMatch:
+                self.assertRaises(NoReverseMatch, api_reverse, *args, request=request, **kwargs)
+            else:
+                url = api_reverse(*args, request=request, **kwargs)
+                self.assertEqual(url, expected)
+                self.assertEqual(type(url), type(expected))
+    
+    def test_reverse(self):
+        self.assertSameURL('event-list')
+        self.assertSameURL('event-detail', args=[self.event.id])
+        self.assertSameURL('event-detail', kwargs={'pk': self.event.id})
+        self.assertSameURL('event-detail', kwargs={'pk': self.event.id}, format='json')
+        self.assertSameURL('calendar-detail', args=[self.calendar.id])
+        self.assertSameURL('rule-detail', args=[self.event.rule_id])
+        for lookup in (7, self.event.start, self.event.start.replace(microsecond=5), u'a b@c~d', u'caf\xe9'):
+            for name in ('occurrence-detail', 'occurrence-cancel', 'occurrence-uncancel'):
+                self.assertSameURL(name, args=[self.event.id, lookup])
+        self.assertSameURL('occurrence-detail', args=['x', 7])
+        self.assertSameURL('event-detail', args=[1, 2, 3])
+        self.assertSameURL('rest_framework:login')
+
+    def test_prefix_metacharacters(self):
+        set_script_prefix('/a.b/')
+        try:
+            self.assertEqual(api_reverse('event-detail', args=[self.event.id]), '/a.b/api/events/%d/' % self.event.id)
+        finally:
+            set_script_prefix('/')
+
+    def test_other_django_versions(self):
+        versions = api_reverse_module.TEMPLATE_DJANGO_VERSIONS
+        api_reverse_module.TEMPLATE_DJANGO_VERSIONS = ()
+        api_reverse_module._templates.clear()
+        try:
+            self.assertIsNone(api_reverse_module.get_url_template('event-detail', 1))
+            self.assertSameURL('event-detail', args=[self.event.id])
+        finally:
+            api_reverse_module.TEMPLATE_DJANGO_VERSIONS = versions
+            api_reverse_module._templates.clear()
+    
+    def test_serialized_urls(self):
+        response = self.client.get(reverse('event-list'), {'format': 'json'})
+        event = json.loads(response.content)['results'][0]
+        request = APIRequestFactory().get('/api/', {'format': 'json'})
+        self.assertEqual(event['url'], reverse('event-detail', args=[self.event.id], request=request))
+        self.assertEqual(event['rule'], reverse('rule-detail', args=[self.event.rule_id], request=request))
+        self.assertEqual(event['calendar'], reverse('calendar-detail', args=[self.calendar.id], request=request))
+        
+        response = self.client.get(reverse('occurrence-list', args=[self.event.id]))
+        occurrence = json.loads(response.content)['results'][0]
+        request = APIRequestFactory().get('/api/')
+        args = [self.event.id, parse_datetime(occurrence['start'])]
+        self.assertEqual(occurrence['url'], reverse('occurrence-detail', args=args, request=request))
+        self.assertEqual(occurrence['methods'], {
+            'cancel': reverse('occurrence-cancel', args=args, request=request),
+            'uncancel': reverse('occurrence-uncancel', args=args, request=request),
+        })
+
+
+class SparseFieldsTestCase(APITestCase):
+    
+    def setUp(self):
+        start = timezone.now().replace(microsecond=0)
+        self.event = mommy.make(
+            Event,
+            rule=mommy.make(Rule, frequency="WEEKLY"),
+            calendar=mommy.make(Calendar),
+            description='x' * 1000,
+            start=start,
+            end=start + timedelta(hours=2)
+        )
+    
+    def get(self, url, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return json.loads(response.content), [query['sql'] for query in queries]
+    
+    def test_fields(self):
+        page, queries = self.get(reverse('event-list'), {'fields': 'url,title,start,rule'})
+        self.assertEqual(sorted(page['results'][0]), ['rule', 'start', 'title', 'url'])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('description', queries[0])
+        self.assertNotIn('end_recurring_period', queries[0])
+        self.assertEqual(page['results'][0]['rule'], reverse(
+            'rule-detail', args=[self.event.rule_id], request=APIRequestFactory().get('/')))
+        
+        event, queries = self.get(reverse('event-detail', args=[self.event.id]), {'fields': 'title'})
+        self.assertEqual(event, {'title': self.event.title})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('description', queries[0])
+    
+    def test_exclude(self):
+        page, queries = self.get(reverse('event-list'), {'exclude': 'description,rule_params'})
+        self.assertNotIn('description', page['results'][0])
+        self.assertNotIn('rule_params', page['results'][0])
+        self.assertIn('calendar', page['results'][0])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('description', queries[0])
+        self.assertIn('calendar_id', queries[0])
+    
+    def test_occurrences(self):
+        page, __ = self.get(reverse('occurrence-list', args=[self.event.id]), {'fields': 'start,end'})
+        self.assertEqual(sorted(page['results'][0]), ['end', 'start'])
+        occurrences, __ = self.get(reverse('bulk-occurrence-list'),
+                                   {'event': self.event.id, 'exclude': 'url,methods'})
+        self.assertNotIn('methods', occurrences[0])
+        self.assertIn('event', occurrences[0])
+    
+    def test_embedded_occurrences(self):
+        page, queries = self.get(reverse('event-list'), {'fields': 'title,occurrences', 'embed': 'occurrences'})
+        self.assertEqual(sorted(page['results'][0]), ['occurrences', 'title'])
+        self.assertTrue(page['results'][0]['occurrences'])
+        self.assertEqual(len(queries), 2)
+    
+    def test_writes_ignore_fields(self):
+        response = self.client.patch(
+            reverse('event-detail', args=[self.event.id]) + '?fields=title', {'description': 'short'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(json.loads(response.content)['description'], 'short')
+
+
+class EventKeysetTestCase(APITestCase):
+    
+    def setUp(self):
+        self.start = timezone.now().replace(microsecond=0)
+        self.calendars = [mommy.make(Calendar), mommy.make(Calendar)]
+        self.rule = mommy.make(Rule, frequency="DAILY")
+        # events sharing a start are ordered by id
+        self.events = [
+            mommy.make(Event, calendar=self.calendars[i % 2], rule=self.rule if i % 3 == 0 else None,
+                       end_recurring_period=self.start + timedelta(days=i // 2 + 2, hours=12) if i % 3 == 0 else None,
+                       start=self.start + timedelta(days=i // 2), end=self.start + timedelta(days=i // 2, hours=1))
+            for i in range(12)]
+        self.url = reverse('event-list')
+        self.ids = dict(('http://testserver' + reverse('event-detail', args=[event.id]), event.id)
+                        for event in self.events)
+    
+    def read_pages(self, params):
+        ids = []
+        url = self.url
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, response.content)
+            page = json.loads(response.content)
+            ids += [self.ids[event['url']] for event in page['results']]
+            url, params = page['next'], None
+        return ids
+    
+    def test_pages(self):
+        ids = self.read_pages({'limit': 5, 'fields': 'url'})
+        self.assertEqual(ids, [event.id for event in sorted(self.events, key=lambda e: (e.start, e.id))])
+        
+        # a deep page costs one query like the first one
+        response = self.client.get(self.url, {'limit': 5})
+        with self.assertNumQueries(1):
+            response = self.client.get(json.loads(response.content)['next'])
+        self.assertEqual(len(json.loads(response.content)['results']), 5)
+    
+    def test_filters(self):
+        ids = self.read_pages({'limit': 4, 'fields': 'url', 'calendar': self.calendars[1].id})
+        self.assertEqual(ids, [event.id for event in self.events[1::2]])
+        ids = self.read_pages({'fields': 'url', 'rule': self.rule.id})
+        self.assertEqual(ids, [event.id for event in self.events[::3]])
+        
+        # [a, b) by the effective bounds, the daily series reach into later days
+        a = self.start + timedelta(days=2)
+        b = self.start + timedelta(days=3)
+        ids = self.read_pages({'fields': 'url', 'intersects': '%s,%s' % (a.isoformat(), b.isoformat())})
+        self.assertEqual(sorted(ids), sorted(event.id for event in self.events
+                                             if event.effective_first_start < b and event.effective_last_end > a))
+        self.assertEqual(sorted(ids), [self.events[i].id for i in (0, 3, 4, 5)])
+        
+        response = self.client.get(self.url, {'intersects': a.isoformat()})
+        self.assertEqual(response.status_code, 400, response.content)
@@ -8,6 +8,7 @@ router = routers.DefaultRouter()
 router.register(r'calendars', views.CalendarViewSet)
 router.register(r'events', views.EventViewSet)
 router.register(r'rules', views.RuleViewSet)
+router.register(r'occurrences', views.BulkOccurrenceViewSet, base_name='bulk-occurrence')
 
 occurrence_router = routers.SimpleRouter()
 occurrence_router.register(r'occurrences', views.OccurrenceViewSet)
@@ -1,23 +1,160 @@
 from datetime import timedelta
+from itertools import islice
 
 from dateutil import parser
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Q
 from django.http.response import HttpResponseBadRequest
 from django.utils import timezone
 from django.utils.functional import cached_property
 from rest_framework import viewsets
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.decorators import detail_route
-from rest_framework.exceptions import MethodNotAllowed
+from rest_framework.exceptions import MethodNotAllowed, ParseError
 from rest_framework.response import Response
 
+from api.pagination import EventKeysetPagination, OccurrenceCursorPagination
 from api.serializers import CalendarSerializer, EventSerializer, RuleSerializer, \
     OccurrenceSerializer
 from schedule.models.calendars import Calendar
 from schedule.models.events import Event, Occurrence
 from schedule.models.rules import Rule
+from schedule.cache import cached_occurrences
+from schedule.horizon import materialized_occurrences
 
 
-class CalendarViewSet(viewsets.ModelViewSet):
+def window_occurrences(events, start, end, limit=None):
+    """
+    Returns the occurrences of ``events`` between start and end, read from the
+    materialized horizon or the occurrence cache when they cover the window,
+    otherwise expanded in one batch with a single persisted occurrence query.
+    With ``limit`` only the first that many are returned, an expansion stops
+    there.
+    """
+    occurrences = materialized_occurrences(events, start, end)
+    if occurrences is None:
+        occurrences = cached_occurrences(events, start, end)
+    if occurrences is None:
+        if limit is not None:
+            return list(islice(Event.objects.iter_occurrences_between(events, start, end), limit))
+        occurrences = Event.objects.occurrences_between(events, start, end)
+    return occurrences if limit is None else occurrences[:limit]
+
+
+def parse_window(request, default_end_delta):
+    """
+    Returns the (start, end) window of the start and end query parameters,
+    from now to ``default_end_delta`` later for those not given.
+    """
+    window = []
+    now = timezone.now()
+    for name, default in (('start', timedelta()), ('end', timedelta(**default_end_delta))):
+        value = request.query_params.get(name)
+        if not value:
+            window.append(now + default)
+        else:
+            window.append(parse_datetime_value(name, value))
+    return tuple(window)
+
+
+def parse_datetime_value(name, value):
+    """
+    Returns the datetime given as ``value`` of the ``name`` query parameter,
+    in UTC if it has no timezone.
+    """
+    try:
+        value = parser.parse(value)
+    except (ValueError, OverflowError):
+        raise ParseError('%s must be a datetime ex: %s=2024-12-21T00:12:00Z' % (name, name))
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.utc)
+    return value
+
+
+def parse_ids(request, name):
+    """
+    Returns the ids given in the ``name`` query parameter, repeated or comma
+    separated.
+    """
+    try:
+        return [int(value) for values in request.query_params.getlist(name)
+                for value in values.split(',') if value]
+    except ValueError:
+        raise ParseError('%s must be a comma separated list of ids' % name)
+
+
+def parse_names(request, name):
+    """
+    Returns the names given in the ``name`` query parameter, repeated or
+    comma separated, None if it is not given.
+    """
+    values = request.query_params.getlist(name)
+    if not values:
+        return None
+    return [value.strip() for values in values for value in values.split(',') if value.strip()]
+
+
+class SparseFieldsMixin(object):
+    """
+    Serializes only the fields named in the ``fields`` query parameter, or
+    all but those named in ``exclude``, and loads only the columns of the
+    model those fields read.
+    """
+    
+    def get_sparse_fields(self):
+        """ returns the (fields, exclude) of the request, None for those not given """
+        if self.request is None or self.request.method not in SAFE_METHODS:
+            # writes validate and return the whole object
+            return None, None
+        return parse_names(self.request, 'fields'), parse_names(self.request, 'exclude')
+    
+    def get_serializer(self, *args, **kwargs):
+        fields, exclude = self.get_sparse_fields()
+        kwargs.setdefault('fields', fields)
+        kwargs.setdefault('exclude', exclude)
+        return super(SparseFieldsMixin, self).get_serializer(*args, **kwargs)
+    
+    def get_projection(self):
+        """
+        Returns the columns to load only and the columns to defer for the
+        fields of the request, None if the serializer does not serialize the
+        model of the queryset or the request does not pick fields.
+        """
+        fields, exclude = self.get_sparse_fields()
+        model = self.queryset.model
+        serializer_class = self.get_serializer_class()
+        if (fields is None and exclude is None) or serializer_class.Meta.model is not model:
+            return None
+        columns = set(field.name for field in model._meta.concrete_fields)
+        kept, dropped, related = set(), set(), set()
+        for name, field in serializer_class(context=self.get_serializer_context()).fields.items():
+            # fields with the whole object as source, e.g. the url, read the pk only
+            if not field.source_attrs or field.source_attrs[0] not in columns:
+                continue
+            if (fields is None or name in fields) and (exclude is None or name not in exclude):
+                kept.add(field.source_attrs[0])
+                if len(field.source_attrs) > 1:
+                    related.add(field.source_attrs[0])
+            else:
+                dropped.add(field.source_attrs[0])
+        # the paginator reads the position of the last object
+        kept.update(getattr(self.paginator, 'ordering', ()))
+        return kept if fields is not None else None, dropped - kept, related
+    
+    def get_queryset(self):
+        queryset = super(SparseFieldsMixin, self).get_queryset()
+        projection = self.get_projection()
+        if projection is None:
+            return queryset
+        only, defer, related = projection
+        if related:
+            queryset = queryset.select_related(*related)
+        if only is not None:
+            return queryset.only(*only)
+        return queryset.defer(*defer)
+
+
+class CalendarViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows calendars to be viewed or edited.
     """
@@ -25,28 +162,92 @@ class CalendarViewSet(viewsets.ModelViewSet):
     serializer_class = CalendarSerializer
 
 
-class EventViewSet(viewsets.ModelViewSet):
+class EventViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows events to be viewed or edited.
+    
+        List Query Parameters
+        ----------------
+        embed -- embed=occurrences lists the occurrences of each event in place of their link
+        start -- embed the occurrences starting at this datetime ex: start=2024-12-21T00:12:00Z
+        end   -- embed the occurrences ending at or before this datetime ex: end=2024-12-21T00:12:00Z
+        fields  -- serialize only these fields ex: fields=url,title,start,end
+        exclude -- serialize all but these fields ex: exclude=description,rule_params
+        calendar   -- list only the events of these calendars ex: calendar=1,2
+        rule       -- list only the events repeating by these rules ex: rule=3
+        intersects -- list only the events with occurrences in [a, b) ex: intersects=2024-12-01T00:00:00Z,2025-01-01T00:00:00Z
+        limit  -- this many events per page, ordered by start and id ex: limit=100
+        cursor -- the position to resume at, taken from the next link of the previous page
     """
     queryset = Event.objects.all()
     serializer_class = EventSerializer
+    pagination_class = EventKeysetPagination
+    default_end_delta = {'days': 31}
+    embedded_occurrences = None # occurrences of the listed events by event id
+    
+    def filter_queryset(self, queryset):
+        queryset = super(EventViewSet, self).filter_queryset(queryset)
+        calendar_ids = parse_ids(self.request, 'calendar')
+        if calendar_ids:
+            queryset = queryset.filter(calendar__in=calendar_ids)
+        rule_ids = parse_ids(self.request, 'rule')
+        if rule_ids:
+            queryset = queryset.filter(rule__in=rule_ids)
+        intersects = parse_names(self.request, 'intersects')
+        if intersects is not None:
+            if len(intersects) != 2:
+                raise ParseError('intersects must be two datetimes ex: intersects=2024-12-01T00:00:00Z,2025-01-01T00:00:00Z')
+            start, end = [parse_datetime_value('intersects', value) for value in intersects]
+            queryset = queryset.intersecting(start, end, half_open=True)
+        return queryset
+    
+    def get_projection(self):
+        # expanding the embedded occurrences reads most of the columns
+        if self.request.query_params.get('embed') == 'occurrences':
+            return None
+        return super(EventViewSet, self).get_projection()
+    
+    def get_serializer_context(self):
+        context = super(EventViewSet, self).get_serializer_context()
+        if self.embedded_occurrences is not None:
+            context['occurrences'] = self.embedded_occurrences
+        return context
+    
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('embed') != 'occurrences':
+            return super(EventViewSet, self).list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset()).select_related('rule')
+        page = self.paginate_queryset(queryset)
+        events = list(queryset if page is None else page)
+        # the occurrences of the whole page are expanded in one batch
+        start, end = parse_window(request, self.default_end_delta)
+        self.embedded_occurrences = dict((event.pk, []) for event in events)
+        for occurrence in window_occurrences(events, start, end):
+            self.embedded_occurrences[occurrence.event_id].append(occurrence)
+        serializer = self.get_serializer(events, many=True)
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
 
 
-class OccurrenceViewSet(viewsets.ModelViewSet):
+class OccurrenceViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows occurrences to be viewed or edited.
     
         List Query Parameters
         ----------------
-        start -- list occurrences starting at this datetime ex: start=2024-12-21T00:12:00Z
-        end   -- list occurrences ending at or before this datetime ex: end=2024-12-21T00:12:00Z
-        limit -- limit total number of occurrences returned ex:limit=500
+        start  -- list occurrences starting at this datetime ex: start=2024-12-21T00:12:00Z
+        end    -- list occurrences ending at or before this datetime ex: end=2024-12-21T00:12:00Z
+        limit  -- stream the occurrences after start, this many per page ex:limit=500
+        cursor -- the position to resume at, taken from the next link of the previous page
+        fields  -- serialize only these fields ex: fields=start,end,cancelled
+        exclude -- serialize all but these fields ex: exclude=url,methods
     """
     queryset = Occurrence.objects.all()  # @UndefinedVariable
     serializer_class = OccurrenceSerializer
+    pagination_class = OccurrenceCursorPagination
     default_end_delta = {'days': 31}
-    default_limit = 1000
+    position = None # (original_start, id) of the last occurrence of the previous page
     lookup_field = 'lookup' # lookup can be pk or occurrence start datetime
     
     @cached_property
@@ -93,15 +294,17 @@ class OccurrenceViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         if self.end:
-            qs = self.event.get_occurrences(self.start, self.end)
+            # the window is expanded from the slot of the last occurrence
+            # sent, the paginator skips the ties up to the cursor
+            after = self.position[0] if self.position is not None else None
+            qs = self.event.resume_occurrences(self.start, self.end, after)
         else:
-            qs_gen = self.event.occurrences_after(self.start)
-            qs = []
-            for __ in range(self.limit): 
-                try:
-                    qs.append(qs_gen.next())
-                except Exception:
-                    raise
+            # the stream resumes right after the slot of the last occurrence
+            # sent, the paginator skips what is left up to the cursor
+            start = self.start
+            if self.position is not None:
+                start = max(start, self.position[0] + (self.event.end - self.event.start))
+            qs = self.event.occurrences_after(start)
         return qs
     
     def get_serializer_context(self):
@@ -117,7 +320,7 @@ class OccurrenceViewSet(viewsets.ModelViewSet):
             return HttpResponseBadRequest('you can specify an end date or limit but not both')
         if limit:
             self.end = None
-            self.limit = int(limit)
+        self.position = self.paginator.decode_cursor(request)
         if start:
             try:
                 start = parser.parse(start)
@@ -147,9 +350,57 @@ class OccurrenceViewSet(viewsets.ModelViewSet):
 
 
 
-class RuleViewSet(viewsets.ModelViewSet):
+class RuleViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows rules to be viewed or edited.
     """
     queryset = Rule.objects.all()  # @UndefinedVariable
-    serializer_class = RuleSerializer
\ No newline at end of file
+    serializer_class = RuleSerializer
+
+
+class BulkOccurrenceViewSet(SparseFieldsMixin, viewsets.GenericViewSet):
+    """
+    API endpoint that lists the occurrences of many events at once.
+    
+        List Query Parameters
+        ----------------
+        event    -- ids of the events to list the occurrences of ex: event=1,2,3
+        calendar -- ids of the calendars to list the occurrences of the events of ex: calendar=1
+        start    -- list occurrences starting at this datetime ex: start=2024-12-21T00:12:00Z
+        end      -- list occurrences ending at or before this datetime ex: end=2024-12-21T00:12:00Z
+        fields   -- serialize only these fields ex: fields=event,start,end
+        exclude  -- serialize all but these fields ex: exclude=url,methods
+
+    The window is at most max_end_delta long, and requests for more than
+    max_events events or max_occurrences occurrences are refused.
+    """
+    queryset = Event.objects.select_related('rule')
+    serializer_class = OccurrenceSerializer
+    pagination_class = None
+    default_end_delta = {'days': 31}
+    max_end_delta = {'days': 31}
+    max_events = 100
+    max_occurrences = 10000
+    
+    def list(self, request, *args, **kwargs):
+        event_ids = parse_ids(request, 'event')
+        calendar_ids = parse_ids(request, 'calendar')
+        if not event_ids and not calendar_ids:
+            raise ParseError('you must specify event or calendar ids')
+        if len(event_ids) > self.max_events:
+            raise ParseError('at most %d event ids can be listed at once' % self.max_events)
+        start, end = parse_window(request, self.default_end_delta)
+        max_delta = timedelta(**self.max_end_delta)
+        if end - start > max_delta:
+            raise ParseError('the window from start to end can be at most %d days long' % max_delta.days)
+        events = list(self.get_queryset().filter(
+            Q(pk__in=event_ids) | Q(calendar__in=calendar_ids)).intersecting(start, end)[:self.max_events + 1])
+        if len(events) > self.max_events:
+            raise ParseError('the calendars have more than %d events in this window, '
+                             'list them by event ids' % self.max_events)
+        occurrences = window_occurrences(events, start, end, self.max_occurrences + 1)
+        if len(occurrences) > self.max_occurrences:
+            raise ParseError('there are more than %d occurrences in this window, '
+                             'narrow it down' % self.max_occurrences)
+        serializer = self.get_serializer(occurrences, many=True)
+        return Response(serializer.data)
@@ -0,0 +1,69 @@
+"""
+Local-time period boundaries.
+
+Every Year, Month, Week and Day period starts and ends at a local midnight.
+Localizing those midnights is comparatively slow with pytz, so the UTC
+instants of all of the local midnights of a year are computed once per
+(timezone, year) and kept in a small LRU cache. Midnights that do not exist
+or are ambiguous because of a DST transition are resolved the way
+``tzinfo.localize`` resolves them.
+"""
+from __future__ import unicode_literals
+import datetime
+
+import pytz
+
+from schedule.conf.settings import SCHEDULER_BOUNDARY_CACHE_SIZE
+from schedule.recurrence import RRuleCache
+
+boundary_cache = RRuleCache(SCHEDULER_BOUNDARY_CACHE_SIZE)
+
+
+class BoundaryTable(object):
+    """
+    The UTC instants of the local midnights of every day of ``year`` in
+    ``tzinfo``, and of the first midnight of the following year.
+    """
+    def __init__(self, tzinfo, year):
+        self.first = datetime.date(year, 1, 1)
+        days = (datetime.date(year + 1, 1, 1) - self.first).days
+        self._midnights = [
+            tzinfo.localize(datetime.datetime.combine(
+                self.first + datetime.timedelta(days=day), datetime.time.min)).astimezone(pytz.utc)
+            for day in range(days + 1)]
+
+    def midnight(self, date):
+        """
+        Returns the start of ``date``, a day of the year of the table or the
+        first one of the next year.
+        """
+        return self._midnights[(date - self.first).days]
+
+    def day_range(self, date):
+        index = (date - self.first).days
+        return self._midnights[index], self._midnights[index + 1]
+
+    def month_range(self, month):
+        start = datetime.date(self.first.year, month, 1)
+        if month == 12:
+            return self.midnight(start), self._midnights[-1]
+        return self.midnight(start), self.midnight(start.replace(month=month + 1))
+
+    def year_range(self):
+        return self._midnights[0], self._midnights[-1]
+
+
+def get_boundary_table(tzinfo, year):
+    """
+    Returns the cached BoundaryTable of ``tzinfo`` and ``year``.
+    """
+    # the localized variants of a pytz timezone share its zone
+    key = (getattr(tzinfo, 'zone', tzinfo), year)
+    return boundary_cache.get(key, lambda: BoundaryTable(tzinfo, year))
+
+
+def local_midnight(tzinfo, date):
+    """
+    Returns the UTC instant ``date`` starts at in ``tzinfo``.
+    """
+    return get_boundary_table(tzinfo, date.year).midnight(date)
@@ -0,0 +1,221 @@
+"""
+The occurrence chunk cache.
+
+Many users look at the same calendars, so the occurrences of each calendar
+are cached in chunks of one UTC month in the Django cache configured by
+SCHEDULER_OCCURRENCE_CACHE_ALIAS. A chunk holds the occurrences of every
+event of the calendar that touch its month, as Event.objects.
+occurrences_between returns them, plus the persisted occurrences whose
+original slot is in the month, and any window is assembled from the chunks
+of the months it covers. ``cached_occurrences`` returns None when the
+cache is disabled, the caller then expands the events itself.
+
+Chunks are invalidated by the signal handlers in schedule.signals: a change
+to an event drops the months between its effective bounds before and after
+the change, a change to an occurrence the months of its original slot and
+of where it was and is now. Nothing is deleted: every calendar and every
+month of a calendar has a generation counter that is part of the keys of
+its chunks, an invalidation increments those of the months it covers, or
+the one of the calendar for open ended changes, and the chunks cached under
+the previous generations are never read again. A chunk built while an edit
+is being saved is stored under the generation read before it was built, so
+it cannot outlive the invalidation of that edit either.
+"""
+from __future__ import unicode_literals
+from collections import defaultdict
+import datetime
+import time
+
+from django.core.cache import caches
+from django.utils import timezone
+import pytz
+
+from schedule.conf.settings import (SCHEDULER_OCCURRENCE_CACHE, SCHEDULER_OCCURRENCE_CACHE_ALIAS,
+                                    SCHEDULER_OCCURRENCE_CACHE_TIMEOUT)
+from schedule.models import Event, Occurrence
+from schedule.models.events import OCCURRENCE_END
+from schedule.utils import occurrences_in_window, unique_occurrences
+
+KEY_PREFIX = 'schedule:occurrences'
+
+# invalidations over more months than this bump the calendar generation
+# rather than one counter per month
+MAX_MONTH_INVALIDATIONS = 24
+
+
+def get_cache():
+    return caches[SCHEDULER_OCCURRENCE_CACHE_ALIAS]
+
+
+def _generation_key(calendar_id, month=None):
+    if month is None:
+        return '%s:%s:generation' % (KEY_PREFIX, calendar_id)
+    return '%s:%s:%04d-%02d:generation' % (KEY_PREFIX, calendar_id, month[0], month[1])
+
+
+def _chunk_key(calendar_id, month, generations):
+    return '%s:%s:%04d-%02d:%d.%d' % ((KEY_PREFIX, calendar_id) + tuple(month) + tuple(generations))
+
+
+def _new_generation():
+    # counters lost to eviction start over above any value they had
+    return int(time.time() * 1000)
+
+
+def _generations(cache, keys):
+    """
+    Returns the current values of the generation counters of ``keys``,
+    creating the missing ones.
+    """
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, _new_generation(), None)
+            generations[key] = cache.get(key)
+    return generations
+
+
+def _chunk_keys(calendar_id, months):
+    """
+    Returns the keys of the current chunks of ``months`` of a calendar,
+    mapped to their month.
+    """
+    cache = get_cache()
+    calendar_key = _generation_key(calendar_id)
+    month_keys = [_generation_key(calendar_id, month) for month in months]
+    generations = _generations(cache, [calendar_key] + month_keys)
+    return dict((_chunk_key(calendar_id, month, (generations[calendar_key], generations[key])), month)
+                for month, key in zip(months, month_keys))
+
+
+def _to_utc(dt):
+    if timezone.is_aware(dt):
+        return dt.astimezone(pytz.utc)
+    return dt
+
+
+def month_bounds(month, aware=True):
+    """
+    Returns the start and end of ``month``, a (year, month) pair, in UTC.
+    """
+    year, month = month
+    start = datetime.datetime(year, month, 1)
+    end = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+    if aware:
+        return pytz.utc.localize(start), pytz.utc.localize(end)
+    return start, end
+
+
+def months_between(start, end):
+    """
+    Returns the (year, month) pairs of the UTC months from the one of start
+    to the one of end.
+    """
+    start, end = _to_utc(start), _to_utc(end)
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append((year, month))
+        year, month = year + month // 12, month % 12 + 1
+    return months
+
+
+def _row(occ):
+    if occ.pk is None:
+        return (occ.event_id, None, occ.start, occ.end)
+    return (occ.event_id, occ.pk, occ.start, occ.end, occ.original_start, occ.original_end,
+            occ.cancelled, occ.created_on, occ.updated_on)
+
+
+def _occurrence(row, event):
+    if row[1] is None:
+        return event._create_occurrence(row[2], row[3])
+    occ = Occurrence(id=row[1], event=event, start=row[2], end=row[3], original_start=row[4],
+                     original_end=row[5], cancelled=row[6], created_on=row[7], updated_on=row[8])
+    occ._state.adding = False
+    occ._state.db = Occurrence.objects.db
+    return occ
+
+
+def build_chunk(calendar_id, month, aware=True):
+    """
+    Expands the events of a calendar for a month and returns the rows the
+    chunk of the month is cached as.
+    """
+    start, end = month_bounds(month, aware)
+    events = list(Event.objects.filter(calendar_id=calendar_id).select_related('rule').intersecting(start, end))
+    occurrences = Event.objects.occurrences_between(events, start, end)
+    # occurrences moved out of the month are kept with their original slot:
+    # a cancelled one shows up in windows reaching both, which no single
+    # month may cover
+    moved = Occurrence.objects.filter(
+        event__in=events, original_start__lte=end, original_end__gte=start).exclude(
+        pk__in=[occ.pk for occ in occurrences if occ.pk is not None])
+    return [_row(occ) for occ in occurrences] + [_row(occ) for occ in moved]
+
+
+def get_chunks(calendar_id, months, aware=True):
+    """
+    Returns the cached rows of ``months`` of a calendar, building and caching
+    the missing ones.
+    """
+    cache = get_cache()
+    # the generations are read before building, see the module docstring
+    keys = _chunk_keys(calendar_id, months)
+    chunks = cache.get_many(list(keys))
+    missing = dict((key, build_chunk(calendar_id, month, aware))
+                   for key, month in keys.items() if key not in chunks)
+    if missing:
+        cache.set_many(missing, SCHEDULER_OCCURRENCE_CACHE_TIMEOUT)
+        chunks.update(missing)
+    return [chunks[key] for key in sorted(keys, key=keys.get)]
+
+
+def cached_occurrences(events, start, end):
+    """
+    Returns the occurrences of ``events`` between start and end as
+    Event.objects.occurrences_between would, assembled from the cached
+    chunks of their calendars. Returns None if the cache is disabled or an
+    event has no calendar.
+    """
+    if not SCHEDULER_OCCURRENCE_CACHE:
+        return None
+    events_by_calendar = defaultdict(dict)
+    for event in events:
+        if event.pk is None or event.calendar_id is None:
+            return None
+        events_by_calendar[event.calendar_id][event.pk] = event
+    months = months_between(start, end)
+    aware = timezone.is_aware(start)
+    occurrences = []
+    for calendar_id, events_by_id in events_by_calendar.items():
+        for rows in get_chunks(calendar_id, months, aware):
+            occurrences += [_occurrence(row, events_by_id[row[0]]) for row in rows
+                            if row[0] in events_by_id]
+    # occurrences crossing the end of a month are in both chunks
+    occurrences = occurrences_in_window(unique_occurrences(occurrences), start, end)
+    occurrences.sort(key=OCCURRENCE_END)
+    return occurrences
+
+
+def invalidate(calendar_id, start=None, end=None):
+    """
+    Retires the cached chunks of a calendar for the months that overlap
+    start to end. Without start every month goes, without end every month
+    from the one of start on.
+    """
+    cache = get_cache()
+    if start is None or end is None:
+        keys = [_generation_key(calendar_id)]
+    else:
+        # a month ending exactly at start overlaps it too
+        months = months_between(start - datetime.timedelta(microseconds=1), end)
+        keys = [_generation_key(calendar_id, month) for month in months]
+        if len(keys) > MAX_MONTH_INVALIDATIONS:
+            keys = [_generation_key(calendar_id)]
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # nothing was cached under a counter that does not exist
+            cache.add(key, _new_generation(), None)
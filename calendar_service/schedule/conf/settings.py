@@ -35,10 +35,18 @@ CALENDAR_VIEW_PERM = get_config('CALENDAR_VIEW_PERM', False)
 # (e.g. all events on that calendar, those events plus another calendar's events,
 # or the events filtered based on user permissions)
 # Imports have to be placed within the function body to avoid circular imports
+# Called as GET_EVENTS_FUNC(request, calendar, start=None, end=None) by the
+# calendar views, start and end span every period the page can show. Functions
+# taking only (request, calendar) still work, the events they return are then
+# narrowed to the window with EventQuerySet.intersecting.
 GET_EVENTS_FUNC = get_config('GET_EVENTS_FUNC', None)
 if not GET_EVENTS_FUNC:
-    def get_events(request, calendar):
-        return calendar.event_set.prefetch_related('occurrence_set', 'rule')
+    def get_events(request, calendar, start=None, end=None):
+        # persisted occurrences are loaded per period, for the period's window
+        events = calendar.event_set.select_related('rule')
+        if start is not None and end is not None:
+            events = events.intersecting(start, end)
+        return events
 
     GET_EVENTS_FUNC = get_events
 
@@ -48,4 +56,49 @@ OCCURRENCE_CANCEL_REDIRECT = get_config('OCCURRENCE_CANCEL_REDIRECT', None)
 SCHEDULER_PREVNEXT_LIMIT_SECONDS = get_config('SCHEDULER_PREVNEXT_LIMIT_SECONDS', 62208000)  # two years
 
 #This name is used when a new event is created through selecting in fullcalendar
-EVENT_NAME_PLACEHOLDER = get_config('EVENT_NAME_PLACEHOLDER', 'Event Name')
\ No newline at end of file
+EVENT_NAME_PLACEHOLDER = get_config('EVENT_NAME_PLACEHOLDER', 'Event Name')
+
+# Maximum number of compiled rrule objects kept in the process wide cache
+# used by Event.get_rrule_object. 0 disables the cache.
+SCHEDULER_RRULE_CACHE_SIZE = get_config('SCHEDULER_RRULE_CACHE_SIZE', 1024)
+
+# Expand DAILY, WEEKLY, HOURLY, MINUTELY and SECONDLY rules that only use
+# interval and count with numpy instead of dateutil. Has no effect when numpy
+# is not installed.
+SCHEDULER_VECTORIZED_EXPANSION = get_config('SCHEDULER_VECTORIZED_EXPANSION', True)
+
+# Serve occurrences from the materialized occurrence horizon (see
+# schedule.horizon) instead of expanding rules on every request, and keep
+# it up to date when events and occurrences are saved. Saving a rule drops
+# the horizons of its events until the next refresh.
+SCHEDULER_OCCURRENCE_HORIZON = get_config('SCHEDULER_OCCURRENCE_HORIZON', False)
+
+# The horizon covers this many days after, and before, the time it was
+# last refreshed. Refresh it daily with `manage.py refresh_occurrence_horizon`.
+SCHEDULER_OCCURRENCE_HORIZON_DAYS = get_config('SCHEDULER_OCCURRENCE_HORIZON_DAYS', 548)  # 18 months
+SCHEDULER_OCCURRENCE_HORIZON_PAST_DAYS = get_config('SCHEDULER_OCCURRENCE_HORIZON_PAST_DAYS', 62)
+
+# Rules that are not expanded with numpy remember where every Nth occurrence
+# starts, so expanding a window far from the event start resumes from the
+# closest checkpoint instead of iterating from the first occurrence. 0 turns
+# checkpoints off.
+SCHEDULER_RRULE_CHECKPOINT_INTERVAL = get_config('SCHEDULER_RRULE_CHECKPOINT_INTERVAL', 128)
+
+# Number of (timezone, year) tables of local midnights kept by
+# schedule.boundaries for building periods. 0 disables the cache.
+SCHEDULER_BOUNDARY_CACHE_SIZE = get_config('SCHEDULER_BOUNDARY_CACHE_SIZE', 64)
+
+# Serve occurrences from per-calendar chunks of one UTC month kept in the
+# Django cache (see schedule.cache). Saving or deleting events, rules and
+# occurrences drops the chunks of the months they touch.
+SCHEDULER_OCCURRENCE_CACHE = get_config('SCHEDULER_OCCURRENCE_CACHE', False)
+SCHEDULER_OCCURRENCE_CACHE_ALIAS = get_config('SCHEDULER_OCCURRENCE_CACHE_ALIAS', 'default')
+SCHEDULER_OCCURRENCE_CACHE_TIMEOUT = get_config('SCHEDULER_OCCURRENCE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+# After serving a period, warm the occurrence cache for the previous and next
+# ones in background threads. Needs SCHEDULER_OCCURRENCE_CACHE. At most
+# _WORKERS chunks are built at a time and at most _QUEUE_SIZE windows wait,
+# further ones are dropped rather than delaying requests.
+SCHEDULER_PREFETCH = get_config('SCHEDULER_PREFETCH', False)
+SCHEDULER_PREFETCH_WORKERS = get_config('SCHEDULER_PREFETCH_WORKERS', 2)
+SCHEDULER_PREFETCH_QUEUE_SIZE = get_config('SCHEDULER_PREFETCH_QUEUE_SIZE', 64)
@@ -0,0 +1,216 @@
+"""
+The materialized occurrence horizon.
+
+Expanding rules on every request does not scale with read volume, so the
+occurrences of every event are precomputed for a rolling window around now
+and stored as MaterializedOccurrence rows. Readers ask
+``materialized_occurrences`` for a window and fall back to live expansion
+when it returns None, i.e. when the window is not inside the horizon of every
+event involved.
+
+Saving an event rebuilds its horizon, saving or deleting an occurrence only
+replaces the rows of its slot. A rule change drops the horizons of its
+events, they are expanded live until the refresh_occurrence_horizon command
+rebuilds them.
+
+On sqlite the rows are indexed by an R*Tree over [start, end] (created by
+migration 0005 when the rtree module is available), other databases use the
+(start, end) b-tree index of the table.
+"""
+from __future__ import unicode_literals
+import datetime
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+import pytz
+
+from schedule.conf.settings import (SCHEDULER_OCCURRENCE_HORIZON,
+                                    SCHEDULER_OCCURRENCE_HORIZON_DAYS,
+                                    SCHEDULER_OCCURRENCE_HORIZON_PAST_DAYS)
+from schedule.models import MaterializedOccurrence, OccurrenceHorizon
+
+RTREE_TABLE = 'schedule_materializedoccurrence_rtree'
+
+# seconds since the epoch of a datetime column as the sqlite backend stores it
+SQLITE_EPOCH_SQL = "((julianday(%s) - 2440587.5) * 86400.0)"
+
+# stay well below the sqlite limit on query parameters
+CHUNK_SIZE = 500
+
+_rtree_tables = {}
+
+
+def has_rtree():
+    """
+    True if the R*Tree index over materialized occurrences exists in the
+    current database.
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _rtree_tables:
+        _rtree_tables[name] = RTREE_TABLE in connection.introspection.table_names()
+    return _rtree_tables[name]
+
+
+def horizon_window(now=None):
+    """
+    Returns the (start, end) window materialized when refreshing at ``now``.
+    """
+    if now is None:
+        now = timezone.now()
+    return (now - datetime.timedelta(days=SCHEDULER_OCCURRENCE_HORIZON_PAST_DAYS),
+            now + datetime.timedelta(days=SCHEDULER_OCCURRENCE_HORIZON_DAYS))
+
+
+def _epoch(dt):
+    if timezone.is_aware(dt):
+        dt = dt.astimezone(pytz.utc).replace(tzinfo=None)
+    return (dt - datetime.datetime(1970, 1, 1)).total_seconds()
+
+
+def _chunks(items):
+    items = list(items)
+    for i in range(0, len(items), CHUNK_SIZE):
+        yield items[i:i + CHUNK_SIZE]
+
+
+def _materialize(event_id, occ):
+    return MaterializedOccurrence(
+        event_id=event_id,
+        occurrence_id=occ.pk,
+        start=occ.start,
+        end=occ.end,
+        original_start=occ.original_start,
+        original_end=occ.original_end,
+        cancelled=occ.cancelled,
+    )
+
+
+def clear_horizon(event_id):
+    """
+    Drops the materialized occurrences of an event, reads for it go back to
+    live expansion until the next refresh.
+    """
+    clear_horizons([event_id])
+
+
+def clear_horizons(event_ids):
+    """
+    clear_horizon for several events at once.
+    """
+    table = MaterializedOccurrence._meta.db_table
+    for ids in _chunks(event_ids):
+        if has_rtree():
+            cursor = connection.cursor()
+            cursor.execute("DELETE FROM %s WHERE id IN (SELECT id FROM %s WHERE event_id IN (%s))" % (
+                RTREE_TABLE, table, ', '.join(['%s'] * len(ids))), ids)
+        MaterializedOccurrence.objects.filter(event_id__in=ids).delete()
+        OccurrenceHorizon.objects.filter(event_id__in=ids).delete()
+
+
+def refresh_occurrence(occurrence, deleted=False):
+    """
+    Replaces the materialized rows of the slot of ``occurrence`` after it was
+    saved, or before it is deleted, leaving the rest of the horizon of its
+    event as it is.
+    """
+    window = OccurrenceHorizon.objects.filter(event_id=occurrence.event_id).values_list('start', 'end').first()
+    if window is None:
+        return
+    start, end = window
+    event = occurrence.event
+    with transaction.atomic():
+        stale = MaterializedOccurrence.objects.filter(event_id=event.pk).filter(
+            Q(occurrence_id=occurrence.pk) |
+            Q(occurrence__isnull=True, original_start=occurrence.original_start,
+              original_end=occurrence.original_end))
+        stale_ids = list(stale.values_list('pk', flat=True))
+        if stale_ids:
+            if has_rtree():
+                cursor = connection.cursor()
+                cursor.execute("DELETE FROM %s WHERE id IN (%s)" % (
+                    RTREE_TABLE, ', '.join(['%s'] * len(stale_ids))), stale_ids)
+            MaterializedOccurrence.objects.filter(pk__in=stale_ids).delete()
+
+        # the rules of Event.get_occurrences for one slot: without the
+        # occurrence the rule fills it again, a cancelled one only shows up
+        # in place of its original
+        generated = event._generates(occurrence.original_start, occurrence.original_end, start, end)
+        if deleted:
+            row = _materialize(event.pk, event._create_occurrence(
+                occurrence.original_start, occurrence.original_end)) if generated else None
+        elif occurrence.start < end and occurrence.end >= start and (not occurrence.cancelled or generated):
+            row = _materialize(event.pk, occurrence)
+        else:
+            row = None
+        if row is not None:
+            row.save()
+            if has_rtree():
+                cursor = connection.cursor()
+                cursor.execute("INSERT OR REPLACE INTO %s (id, min_ts, max_ts) SELECT id, %s, %s FROM %s WHERE id = %%s" % (
+                    RTREE_TABLE, SQLITE_EPOCH_SQL % 'start', SQLITE_EPOCH_SQL % '"end"',
+                    MaterializedOccurrence._meta.db_table), [row.pk])
+
+
+def refresh_horizon(events, now=None):
+    """
+    Rebuilds the materialized occurrences of ``events`` for the horizon
+    window around ``now``.
+    """
+    start, end = horizon_window(now)
+    table = MaterializedOccurrence._meta.db_table
+    for event in events:
+        with transaction.atomic():
+            clear_horizon(event.pk)
+            MaterializedOccurrence.objects.bulk_create([
+                _materialize(event.pk, occ) for occ in event.get_occurrences(start, end)])
+            OccurrenceHorizon.objects.create(event_id=event.pk, start=start, end=end)
+            if has_rtree():
+                cursor = connection.cursor()
+                cursor.execute("INSERT OR REPLACE INTO %s (id, min_ts, max_ts) SELECT id, %s, %s FROM %s WHERE event_id = %%s" % (
+                    RTREE_TABLE, SQLITE_EPOCH_SQL % 'start', SQLITE_EPOCH_SQL % '"end"', table), [event.pk])
+
+
+def materialized_occurrences(events, start, end):
+    """
+    Returns the occurrences of ``events`` between start and end as
+    Event.get_occurrences would, read from the materialized horizon. Returns
+    None if the horizon is disabled or does not cover the window for every
+    event, the caller then has to expand the events itself.
+    """
+    if not SCHEDULER_OCCURRENCE_HORIZON:
+        return None
+    events_by_id = dict((event.pk, event) for event in events)
+    covered = 0
+    for ids in _chunks(events_by_id):
+        covered += OccurrenceHorizon.objects.filter(
+            event__in=ids, start__lte=start, end__gte=end).count()
+    if covered < len(events_by_id):
+        return None
+
+    # the same rules Event.get_occurrences applies: generated occurrences may
+    # touch the window on both ends, persisted ones must start before its end,
+    # and cancelled ones only show up in place of their original slot
+    in_window = (
+        Q(occurrence__isnull=True, start__lte=end, end__gte=start) |
+        Q(Q(cancelled=False) | Q(original_start__lte=end, original_end__gte=start),
+          occurrence__isnull=False, start__lt=end, end__gte=start)
+    )
+    occurrences = []
+    for ids in _chunks(events_by_id):
+        rows = MaterializedOccurrence.objects.filter(in_window, event__in=ids)
+        if has_rtree():
+            rows = rows.extra(
+                where=["%s.id IN (SELECT id FROM %s WHERE min_ts <= %%s AND max_ts >= %%s)" % (
+                    MaterializedOccurrence._meta.db_table, RTREE_TABLE)],
+                params=[_epoch(end), _epoch(start)])
+        for row in rows.select_related('occurrence').order_by('start'):
+            event = events_by_id[row.event_id]
+            if row.occurrence_id is None:
+                occurrences.append(event._create_occurrence(row.start, row.end))
+            else:
+                row.occurrence.event = event
+                occurrences.append(row.occurrence)
+    return occurrences
@@ -0,0 +1,264 @@
+from __future__ import division
+import datetime
+import gc
+import itertools
+import os
+import sys
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+import pytz
+
+from schedule.models import Event, Occurrence, Rule
+from schedule.recurrence import FixedIntervalRecurrence, SeekableRRule, compile_rrule, numpy
+from schedule.utils import OccurrenceReplacer
+
+
+WINDOWS = (
+    ('month', datetime.timedelta(days=31)),
+    ('year', datetime.timedelta(days=365)),
+)
+FREQUENCIES = ('HOURLY', 'MINUTELY')
+# (rule, window) pairs the occurrence memory footprint is measured on
+FOOTPRINTS = (('HOURLY', 'year'), ('MINUTELY', 'month'))
+# how many years before the expanded month the series of the seek table start
+SERIES_AGES = (1, 5, 20)
+# calendar sizes, in events, the assembly of a week of occurrences is timed for
+EVENT_COUNTS = (1000, 10000)
+# how many occurrences the lazy assembly reads
+FIRST_OCCURRENCES = 10
+
+
+def legacy_occurrence_list(event, start, end):
+    """
+    The pre single-pass implementation of Event._get_occurrence_list, kept
+    here as the baseline for the expansion benchmark.
+    """
+    difference = event.end - event.start
+    occurrences = []
+    if event.end_recurring_period and event.end_recurring_period < end:
+        end = event.end_recurring_period
+    rule = event.get_rrule_object()
+    o_starts = []
+    o_starts.append(rule.between(start, end, inc=True))
+    o_starts.append(rule.between(start - (difference // 2), end - (difference // 2), inc=True))
+    o_starts.append(rule.between(start - difference, end - difference, inc=True))
+    for occ in o_starts:
+        for o_start in occ:
+            occurrence = event._create_occurrence(o_start, o_start + difference)
+            if occurrence not in occurrences:
+                occurrences.append(occurrence)
+    return occurrences
+
+
+def legacy_occurrences_between(events, start, end):
+    """
+    Event.objects.occurrences_between as it was before the k-way merge, the
+    occurrences of all events concatenated and sorted, the baseline for the
+    assembly table.
+    """
+    occ_replacer = OccurrenceReplacer(Event.objects.persisted_occurrences(events, start, end))
+    occurrences = []
+    for event in events:
+        occurrences += occ_replacer.replace(
+            event._get_occurrence_list(start, end), start, end, event_id=event.pk)
+    return sorted(occurrences)
+
+
+def model_occurrence_list(event, start, end):
+    """
+    Event._get_occurrence_list as it was when generated occurrences were
+    unsaved Occurrence model instances, the baseline for the footprint table.
+    """
+    difference = event.end - event.start
+    return [Occurrence(event=event, start=o_start, end=o_start + difference,
+                       original_start=o_start, original_end=o_start + difference)
+            for o_start in event._get_recurrence().between(start - difference, end, inc=True)]
+
+
+def resident_memory():
+    """
+    Returns the resident set size of this process in bytes, None where
+    /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def object_size(obj):
+    """
+    Returns the shallow size of ``obj`` plus that of its instance dict and of
+    a Django model's state object, the memory one occurrence adds on top of
+    the datetimes and event it shares.
+    """
+    size = sys.getsizeof(obj)
+    for part in (getattr(obj, '__dict__', None), getattr(obj, '_state', None)):
+        if part is not None:
+            size += object_size(part)
+    return size
+
+
+def footprint(build):
+    """
+    Builds a list of occurrences with ``build`` and returns the gc tracked
+    objects and bytes each occurrence allocates and the growth of the
+    resident set while the list is alive, in MB.
+    """
+    gc.collect()
+    objects = len(gc.get_objects())
+    rss = resident_memory()
+    occurrences = build()
+    objects = len(gc.get_objects()) - objects
+    if rss is not None:
+        rss = (resident_memory() - rss) / (1024 * 1024)
+    count = len(occurrences)
+    return count, objects / count, object_size(occurrences[0]), rss
+
+
+class Command(BaseCommand):
+    help = ("Times occurrence expansion for high frequency rules over month and year windows, "
+            "measures the memory footprint of generated occurrences, times expanding a month "
+            "of old series, times merging the occurrences of 1k and 10k events, and times the numpy "
+            "engine against dateutil when numpy is installed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3,
+                            help="Best of how many runs to report.")
+        parser.add_argument('--legacy-limit', type=int, default=10000,
+                            help="Skip the quadratic legacy baseline above this many occurrences.")
+
+    def handle(self, *args, **options):
+        # the fixtures are rolled back, nothing is left behind in the database
+        with transaction.atomic():
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        repeat = options['repeat']
+        start = datetime.datetime(2015, 1, 1, tzinfo=pytz.utc)
+        self.stdout.write("%-9s %-6s %8s %12s %12s %8s" % (
+            'rule', 'window', 'occs', 'legacy (s)', 'current (s)', 'speedup'))
+        for frequency in FREQUENCIES:
+            event = Event.objects.create(
+                title='benchmark',
+                start=start,
+                end=start + datetime.timedelta(minutes=30),
+                rule=Rule.objects.create(name=frequency, frequency=frequency),
+            )
+            for name, length in WINDOWS:
+                end = start + length
+                current = min(timeit.repeat(
+                    lambda: event._get_occurrence_list(start, end), number=1, repeat=repeat))
+                count = len(event._get_occurrence_list(start, end))
+                if count <= options['legacy_limit']:
+                    legacy = min(timeit.repeat(
+                        lambda: legacy_occurrence_list(event, start, end), number=1, repeat=repeat))
+                    self.stdout.write("%-9s %-6s %8d %12.4f %12.4f %7.1fx" % (
+                        frequency, name, count, legacy, current, legacy / current))
+                else:
+                    self.stdout.write("%-9s %-6s %8d %12s %12.4f %8s" % (
+                        frequency, name, count, 'skipped', current, '-'))
+        self.write_footprints(start, repeat)
+        self.write_seeks(start, repeat)
+        self.write_assembly(start, repeat)
+        if numpy is None:
+            return
+        self.stdout.write("")
+        self.stdout.write("%-9s %-6s %8s %12s %12s %8s" % (
+            'rule', 'window', 'starts', 'rrule (s)', 'numpy (s)', 'speedup'))
+        for frequency in FREQUENCIES:
+            event = Event.objects.create(
+                title='benchmark',
+                start=start,
+                end=start + datetime.timedelta(minutes=30),
+                rule=Rule.objects.create(name=frequency, frequency=frequency),
+            )
+            rule = compile_rrule(event)
+            recurrence = FixedIntervalRecurrence.from_event(event)
+            for name, length in WINDOWS:
+                end = start + length
+                dateutil_time = min(timeit.repeat(
+                    lambda: rule.between(start, end, inc=True), number=1, repeat=repeat))
+                numpy_time = min(timeit.repeat(
+                    lambda: recurrence.between(start, end, inc=True), number=1, repeat=repeat))
+                self.stdout.write("%-9s %-6s %8d %12.4f %12.4f %7.1fx" % (
+                    frequency, name, len(recurrence.between(start, end, inc=True)),
+                    dateutil_time, numpy_time, dateutil_time / numpy_time))
+
+    def write_footprints(self, start, repeat):
+        self.stdout.write("")
+        self.stdout.write("%-9s %-6s %-9s %8s %9s %9s %10s %10s" % (
+            'rule', 'window', 'type', 'occs', 'objs/occ', 'bytes/occ', 'rss (MB)', 'build (s)'))
+        windows = dict(WINDOWS)
+        for frequency, name in FOOTPRINTS:
+            event = Event.objects.create(
+                title='benchmark',
+                start=start,
+                end=start + datetime.timedelta(minutes=30),
+                rule=Rule.objects.create(name=frequency, frequency=frequency),
+            )
+            end = start + windows[name]
+            for kind, build in (('model', lambda: model_occurrence_list(event, start, end)),
+                                ('slotted', lambda: event._get_occurrence_list(start, end))):
+                count, objects, size, rss = footprint(build)
+                elapsed = min(timeit.repeat(build, number=1, repeat=repeat))
+                self.stdout.write("%-9s %-6s %-9s %8d %9.1f %9d %10s %10.4f" % (
+                    frequency, name, kind, count, objects, size,
+                    '-' if rss is None else '%.1f' % rss, elapsed))
+
+    def write_seeks(self, start, repeat):
+        self.stdout.write("")
+        self.stdout.write("%-17s %5s %12s %12s %8s" % (
+            'rule', 'age', 'rrule (s)', 'seek (s)', 'speedup'))
+        end = start + datetime.timedelta(days=31)
+        for frequency, params in (('HOURLY', 'byhour:8,12,16'), ('DAILY', 'byweekday:0,2,4')):
+            for age in SERIES_AGES:
+                event = Event.objects.create(
+                    title='benchmark',
+                    start=start.replace(year=start.year - age),
+                    end=start.replace(year=start.year - age) + datetime.timedelta(minutes=30),
+                    rule=Rule.objects.create(name=frequency, frequency=frequency, params=params),
+                )
+                rule = compile_rrule(event)
+                seekable = SeekableRRule.from_event(event)
+                seekable.between(start, end, inc=True)  # walks the series once
+                rrule_time = min(timeit.repeat(
+                    lambda: rule.between(start, end, inc=True), number=1, repeat=repeat))
+                seek_time = min(timeit.repeat(
+                    lambda: seekable.between(start, end, inc=True), number=1, repeat=repeat))
+                self.stdout.write("%-17s %4dy %12.4f %12.4f %7.1fx" % (
+                    '%s %s' % (frequency, params.split(':')[1]), age, rrule_time, seek_time,
+                    rrule_time / seek_time))
+
+    def write_assembly(self, start, repeat):
+        self.stdout.write("")
+        self.stdout.write("%-7s %8s %12s %12s %12s" % (
+            'events', 'occs', 'legacy (s)', 'current (s)', 'first %d (s)' % FIRST_OCCURRENCES))
+        rule = Rule.objects.create(name='assembly', frequency='DAILY')
+        end = start + datetime.timedelta(days=7)
+        created = 0
+        for count in EVENT_COUNTS:
+            # spread the events over the day so that their expansions interleave
+            Event.objects.bulk_create([
+                Event(title='benchmark',
+                      start=start + datetime.timedelta(minutes=i % 1440),
+                      end=start + datetime.timedelta(minutes=i % 1440 + 30),
+                      rule=rule)
+                for i in range(created, count)])
+            created = count
+            events = list(Event.objects.filter(rule=rule).select_related('rule'))
+            sorted_time = min(timeit.repeat(
+                lambda: legacy_occurrences_between(events, start, end), number=1, repeat=repeat))
+            current_time = min(timeit.repeat(
+                lambda: Event.objects.occurrences_between(events, start, end), number=1, repeat=repeat))
+            first_time = min(timeit.repeat(
+                lambda: list(itertools.islice(Event.objects.iter_occurrences_between(events, start, end),
+                                              FIRST_OCCURRENCES)),
+                number=1, repeat=repeat))
+            self.stdout.write("%-7d %8d %12.4f %12.4f %12.4f" % (
+                count, len(Event.objects.occurrences_between(events, start, end)),
+                sorted_time, current_time, first_time))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from schedule.models import Event
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the effective bounds of events. Run it once after migrating so that "
+            "events saved before the bounds existed are narrowed by Event.objects.intersecting.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('calendars', nargs='*', metavar='calendar_slug',
+                            help="Only refresh the events of these calendars.")
+        parser.add_argument('--missing', action='store_true', default=False,
+                            help="Only refresh the events whose bounds were never computed.")
+
+    def handle(self, *args, **options):
+        events = Event.objects.select_related('rule')
+        if options['calendars']:
+            events = events.filter(calendar__slug__in=options['calendars'])
+        if options['missing']:
+            events = events.filter(effective_first_start__isnull=True)
+        count = events.count()
+        Event.objects.refresh_effective_bounds(events.iterator())
+        self.stdout.write("Refreshed the bounds of %d events" % count)
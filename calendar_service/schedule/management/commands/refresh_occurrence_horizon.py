@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from schedule.horizon import horizon_window, refresh_horizon
+from schedule.models import Event
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds the materialized occurrence horizon. Run it periodically (e.g. daily) "
+            "so the horizon keeps moving forward with the current date.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('calendars', nargs='*', metavar='calendar_slug',
+                            help="Only refresh the events of these calendars.")
+
+    def handle(self, *args, **options):
+        events = Event.objects.select_related('rule')
+        if options['calendars']:
+            events = events.filter(calendar__slug__in=options['calendars'])
+        start, end = horizon_window()
+        refresh_horizon(events)
+        self.stdout.write("Refreshed %d events from %s to %s" % (events.count(), start, end))
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations, DatabaseError
+
+RTREE_TABLE = 'schedule_materializedoccurrence_rtree'
+
+
+def create_rtree(apps, schema_editor):
+    # the R*Tree index is optional, sqlite may be built without the module
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('CREATE VIRTUAL TABLE %s USING rtree(id, min_ts, max_ts)' % RTREE_TABLE)
+    except DatabaseError:
+        pass
+
+
+def drop_rtree(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS %s' % RTREE_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0004_auto_20151013_1601'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterializedOccurrence',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('start', models.DateTimeField(verbose_name='start')),
+                ('end', models.DateTimeField(verbose_name='end')),
+                ('original_start', models.DateTimeField(verbose_name='original start')),
+                ('original_end', models.DateTimeField(verbose_name='original end')),
+                ('cancelled', models.BooleanField(default=False, verbose_name='cancelled')),
+            ],
+            options={
+                'verbose_name': 'materialized occurrence',
+                'verbose_name_plural': 'materialized occurrences',
+            },
+        ),
+        migrations.CreateModel(
+            name='OccurrenceHorizon',
+            fields=[
+                ('event', models.OneToOneField(primary_key=True, serialize=False, to='schedule.Event', verbose_name='event')),
+                ('start', models.DateTimeField(verbose_name='start')),
+                ('end', models.DateTimeField(verbose_name='end')),
+                ('refreshed_on', models.DateTimeField(auto_now=True, verbose_name='refreshed on')),
+            ],
+            options={
+                'verbose_name': 'occurrence horizon',
+                'verbose_name_plural': 'occurrence horizons',
+            },
+        ),
+        migrations.AddField(
+            model_name='materializedoccurrence',
+            name='event',
+            field=models.ForeignKey(verbose_name='event', to='schedule.Event'),
+        ),
+        migrations.AddField(
+            model_name='materializedoccurrence',
+            name='occurrence',
+            field=models.ForeignKey(verbose_name='occurrence', blank=True, to='schedule.Occurrence', null=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='materializedoccurrence',
+            index_together=set([('start', 'end')]),
+        ),
+        migrations.RunPython(create_rtree, drop_rtree),
+    ]
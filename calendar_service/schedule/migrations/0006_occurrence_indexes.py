@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0005_occurrence_horizon'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='occurrence',
+            index_together=set([('event', 'start', 'end'), ('event', 'original_start')]),
+        ),
+    ]
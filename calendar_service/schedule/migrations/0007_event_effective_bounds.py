@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0006_occurrence_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='effective_first_start',
+            field=models.DateTimeField(db_index=True, verbose_name='effective first start', null=True, editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='effective_last_end',
+            field=models.DateTimeField(db_index=True, verbose_name='effective last end', null=True, editable=False, blank=True),
+        ),
+    ]
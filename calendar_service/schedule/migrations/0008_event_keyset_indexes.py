@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0007_event_effective_bounds'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='event',
+            index_together=set([('start', 'id'), ('calendar', 'start', 'id'), ('rule', 'start', 'id')]),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from schedule.models.calendars import Calendar, CalendarRelation
 from schedule.models.events import *
 from schedule.models.rules import *
+from schedule.models.horizon import MaterializedOccurrence, OccurrenceHorizon
 
 from schedule.signals import *
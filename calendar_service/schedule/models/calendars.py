@@ -185,6 +185,23 @@ class Calendar(with_metaclass(ModelBase, *get_model_bases())):
     def occurrences_after(self, date=None):
         return EventListManager(self.events.all()).occurrences_after(date)
 
+    def iter_occurrences(self, start, end):
+        """
+        Yields the occurrences of this calendar's events between start and end
+        in start order, see Event.iter_occurrences.
+        """
+        return EventListManager(self.events.select_related('rule')).iter_occurrences(start, end)
+
+    def count_occurrences(self, start, end):
+        """
+        Returns how many occurrences this calendar's events have between start
+        and end without creating any, see Event.count_occurrences.
+        """
+        return EventListManager(self.events.select_related('rule')).count_occurrences(start, end)
+
+    def has_occurrences(self, start, end):
+        return EventListManager(self.events.select_related('rule')).has_occurrences(start, end)
+
     def get_absolute_url(self):
         return reverse('calendar_home', kwargs={'calendar_slug': self.slug})
 
@@ -1,12 +1,12 @@
 from __future__ import division, unicode_literals
+from operator import attrgetter
 
-from dateutil import rrule
 from django.conf import settings as django_settings
 from django.contrib.contenttypes import fields
 from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
 from django.db import models
-from django.db.models import Q
+from django.db.models import Max, Min, Q
 from django.db.models.base import ModelBase
 from django.template.defaultfilters import date
 from django.utils import timezone
@@ -18,16 +18,117 @@ from six import with_metaclass
 
 from schedule.models.calendars import Calendar
 from schedule.models.rules import Rule
-from schedule.utils import OccurrenceReplacer
+from schedule.recurrence import (count_between, get_recurrence, get_rrule, iter_after, iter_between,
+                                 last_occurrence_start, rrule_arguments)
+from schedule.utils import OccurrenceReplacer, merge_occurrences
 from schedule.utils import get_model_bases
 from six.moves.builtins import object  # @UnresolvedImport
 
 
 # -*- coding: utf-8 -*-
-class EventManager(models.Manager):
+def persisted_window_q(start, end, difference):
+    """
+    Matches the persisted occurrences of an event with duration
+    ``difference`` that matter when expanding it from start to end: those
+    generated for the window, which replace generated occurrences, and those
+    moved into it. Both are covered by the Occurrence indexes.
+    """
+    return Q(start__lt=end, end__gte=start) | Q(original_start__gte=start - difference, original_start__lte=end)
+
+
+# the order occurrences sort in, see OccurrenceMixin.__lt__
+OCCURRENCE_END = attrgetter('end')
+
+OVERRIDE_ROW_FIELDS = ('original_start', 'start', 'end', 'cancelled')
+
+# ids of the events being deleted, the signal handlers of the occurrences
+# deleted along with them leave these events alone (see schedule.signals)
+DELETING_EVENTS = set()
+
+
+class EventQuerySet(models.QuerySet):
+    def intersecting(self, start, end, half_open=False):
+        """
+        Narrows the events to those that can have occurrences between start
+        and end according to their effective bounds, in [start, end) with
+        half_open rather than touching either end. Events whose bounds were
+        never computed are kept.
+        """
+        if half_open:
+            return self.filter(
+                Q(effective_first_start__isnull=True) | Q(effective_first_start__lt=end),
+                Q(effective_last_end__isnull=True) | Q(effective_last_end__gt=start))
+        return self.filter(
+            Q(effective_first_start__isnull=True) | Q(effective_first_start__lte=end),
+            Q(effective_last_end__isnull=True) | Q(effective_last_end__gte=start))
+
+
+class EventManager(models.Manager.from_queryset(EventQuerySet)):
+    def refresh_effective_bounds(self, events):
+        """
+        Recomputes and stores the effective bounds of ``events``, after a
+        change to their rule or persisted occurrences. Saves nothing else.
+        """
+        for event in events:
+            first_start, last_end = event.get_effective_bounds()
+            self.filter(pk=event.pk).update(effective_first_start=first_start,
+                                            effective_last_end=last_end)
+
     def get_for_object(self, content_object, distinction=None, inherit=True):
         return EventRelation.objects.get_events_for_object(content_object, distinction, inherit)
 
+    def occurrences_between(self, events, start, end):
+        """
+        Returns the occurrences of all of the ``events`` between start and end,
+        the same ones get_occurrences returns for each event, sorted. The
+        persisted occurrences of all events are loaded with a single query.
+        """
+        occurrences = []
+        for occurrence_list in self._expand_between(events, start, end):
+            occurrences += occurrence_list
+        # sorting on precomputed keys compares datetimes instead of calling
+        # __lt__, and merges the runs the expansions already are
+        occurrences.sort(key=OCCURRENCE_END)
+        return occurrences
+
+    def iter_occurrences_between(self, events, start, end):
+        """
+        Lazily yields what occurrences_between returns. The expansions of the
+        events are merged on their ends with a heap, so taking the first few
+        occurrences never sorts them all.
+        """
+        # generated occurrences are already in order, only moved and
+        # additional persisted ones need to find their place
+        return merge_occurrences([sorted(occurrence_list, key=OCCURRENCE_END)
+                                  for occurrence_list in self._expand_between(events, start, end)],
+                                 key=OCCURRENCE_END)
+
+    def _expand_between(self, events, start, end):
+        """
+        Returns the occurrences of each of the ``events`` between start and
+        end, one list per event.
+        """
+        events = list(events)
+        occ_replacer = OccurrenceReplacer(self.persisted_occurrences(events, start, end))
+        return [occ_replacer.replace(event._get_occurrence_list(start, end), start, end, event_id=event.pk)
+                for event in events]
+
+    def persisted_occurrences(self, events, start, end):
+        """
+        Returns the persisted occurrences that matter when expanding ``events``
+        from start to end (see persisted_window_q), with their event set to
+        the one in ``events``.
+        """
+        events_by_id = dict((event.pk, event) for event in events)
+        if not events_by_id:
+            return []
+        difference = max(event.end - event.start for event in events_by_id.values())
+        persisted = list(Occurrence.objects.filter(
+            persisted_window_q(start, end, difference), event__in=list(events_by_id)))
+        for occ in persisted:
+            occ.event = events_by_id[occ.event_id]
+        return persisted
+
 
 @python_2_unicode_compatible
 class Event(with_metaclass(ModelBase, *get_model_bases())):
@@ -48,6 +149,11 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
     end_recurring_period = models.DateTimeField(_("end recurring period"), null=True, blank=True,
                                                 help_text=_("This date is ignored for one time only events."))
     calendar = models.ForeignKey(Calendar, null=True, blank=True, verbose_name=_("calendar"))
+    # denormalized from the above and the persisted occurrences, see get_effective_bounds
+    effective_first_start = models.DateTimeField(_("effective first start"), null=True, blank=True,
+                                                 editable=False, db_index=True)
+    effective_last_end = models.DateTimeField(_("effective last end"), null=True, blank=True,
+                                              editable=False, db_index=True)
 
     objects = EventManager()
 
@@ -55,6 +161,8 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
         verbose_name = _('event')
         verbose_name_plural = _('events')
         app_label = 'schedule'
+        # the api pages through events by (start, id), optionally of a calendar or rule
+        index_together = (('start', 'id'), ('calendar', 'start', 'id'), ('rule', 'start', 'id'))
 
     def __str__(self):
         return ugettext('%(title)s: %(start)s - %(end)s') % {
@@ -78,6 +186,53 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
     def get_absolute_url(self):
         return reverse('event', args=[self.id])
 
+    def save(self, *args, **kwargs):
+        self.effective_first_start, self.effective_last_end = self.get_effective_bounds()
+        super(Event, self).save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        # the pre_delete signals of the occurrences are sent before the one
+        # of the event
+        pk = self.pk
+        DELETING_EVENTS.add(pk)
+        try:
+            super(Event, self).delete(*args, **kwargs)
+        finally:
+            DELETING_EVENTS.discard(pk)
+
+    def get_effective_bounds(self):
+        """
+        Returns when the first occurrence of this event starts and when its
+        last one ends, taking the rule's count and until, the end of the
+        recurring period and the persisted occurrences into account. The end
+        is None for series that go on forever.
+        """
+        first_start, last_end = self.start, self.end
+        if self.rule is not None:
+            # the expansion engine seeks to the end of the series instead of
+            # walking it
+            rule = self._get_recurrence()
+            __, params = rrule_arguments(self)
+            if self.end_recurring_period:
+                last_start = rule.before(self.end_recurring_period, inc=True)
+            elif 'count' in params or 'until' in params:
+                last_start = last_occurrence_start(rule)
+            else:
+                last_start = rule.after(self.start, inc=True)
+                last_end = None
+            # an empty series keeps the bounds of the event itself
+            if last_start is not None:
+                first_start = rule.after(self.start, inc=True)
+                if last_end is not None:
+                    last_end = last_start + (self.end - self.start)
+        if self.pk is not None:
+            moved = self.occurrence_set.aggregate(Min('start'), Max('end'))
+            if moved['start__min'] is not None:
+                first_start = min(first_start, moved['start__min'])
+                if last_end is not None:
+                    last_end = max(last_end, moved['end__max'])
+        return first_start, last_end
+
     def get_occurrences(self, start, end):
         """
         >>> rule = Rule(frequency = "MONTHLY", name = "Monthly")
@@ -97,40 +252,182 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
         []
 `
         """
-        persisted_occurrences = self.occurrence_set.all()
-        occ_replacer = OccurrenceReplacer(persisted_occurrences)
-        occurrences = self._get_occurrence_list(start, end)
-        final_occurrences = []
-        for occ in occurrences:
-            # replace occurrences with their persisted counterparts
-            if occ_replacer.has_occurrence(occ):
-                p_occ = occ_replacer.get_occurrence(occ)
-                # ...but only if they are within this period
-                if p_occ.start < end and p_occ.end >= start:
-                    final_occurrences.append(p_occ)
-            else:
-                final_occurrences.append(occ)
-        # then add persisted occurrences which originated outside of this period but now
-        # fall within it
-        final_occurrences += occ_replacer.get_additional_occurrences(start, end)
-        return final_occurrences
+        occ_replacer = OccurrenceReplacer(self._persisted_occurrences(start, end))
+        return occ_replacer.replace(self._get_occurrence_list(start, end), start, end)
+
+    def iter_occurrences(self, start, end):
+        """
+        Yields the occurrences get_occurrences(start, end) returns, ordered by
+        start and without building the whole list first, so that callers can
+        stop after the first few. Persisted occurrences are loaded up front
+        and merged in as the expansion reaches them.
+        """
+        return self._iter_occurrences(start, end, self._persisted_occurrences(start, end))
+
+    def _iter_occurrences(self, start, end, persisted_occurrences):
+        replaced = set()
+        persisted = []
+        for occ in persisted_occurrences:
+            occ.event = self
+            replaced.add((occ.original_start, occ.original_end))
+            # a cancelled occurrence only shows up in place of its original,
+            # see get_occurrences
+            if occ.start < end and occ.end >= start and (
+                    not occ.cancelled or self._generates(occ.original_start, occ.original_end, start, end)):
+                persisted.append(occ)
+        persisted.sort(key=lambda occ: occ.start)
+        generated = (occ for occ in self._iter_occurrence_list(start, end)
+                     if (occ.original_start, occ.original_end) not in replaced)
+        return merge_occurrences([generated, persisted])
+
+    def resume_occurrences(self, start, end, after=None):
+        """
+        Yields the occurrences get_occurrences(start, end) returns ordered by
+        original start, those whose original start is not before ``after``
+        only. The rule is expanded from the slot starting at ``after`` on, so
+        resuming deep into a long window costs what its first page does.
+        """
+        persisted = self._persisted_occurrences(start, end)
+        generated_start = start
+        if after is not None:
+            persisted = persisted.filter(original_start__gte=after)
+            generated_start = max(start, after + (self.end - self.start))
+        replaced = set()
+        in_window = []
+        for occ in persisted:
+            occ.event = self
+            replaced.add((occ.original_start, occ.original_end))
+            if occ.start < end and occ.end >= start and (
+                    not occ.cancelled or self._generates(occ.original_start, occ.original_end, start, end)):
+                in_window.append(occ)
+        in_window.sort(key=lambda occ: (occ.original_start, occ.pk))
+        # a slot starting before generated_start ends before it, so none of
+        # the slots from ``after`` on are missed
+        generated = (occ for occ in self._iter_occurrence_list(generated_start, end)
+                     if (occ.original_start, occ.original_end) not in replaced)
+        return merge_occurrences([generated, in_window], key=attrgetter('original_start'))
+
+    def _persisted_occurrences(self, start, end):
+        """
+        Returns the persisted occurrences that matter when expanding this
+        event from start to end. Occurrences prefetched with
+        prefetch_related('occurrence_set') are used as they are.
+        """
+        occurrences = self.occurrence_set.all()
+        if occurrences._result_cache is not None:
+            return occurrences
+        return occurrences.filter(persisted_window_q(start, end, self.end - self.start))
+
+    def _generates(self, o_start, o_end, start, end):
+        """
+        Returns True if the occurrence with original start and end o_start and
+        o_end is one of the occurrences generated for start to end.
+        """
+        difference = self.end - self.start
+        if o_end - o_start != difference:
+            return False
+        if self.rule is None:
+            return o_start == self.start and self.start < end and self.end > start
+        if self.end_recurring_period and self.end_recurring_period < end:
+            end = self.end_recurring_period
+        if not start - difference <= o_start <= end:
+            return False
+        return self._get_recurrence().after(o_start, inc=True) == o_start
+
+    def count_occurrences(self, start, end):
+        """
+        Returns len(get_occurrences(start, end)) without creating any
+        occurrences: the rule is counted (directly for fixed interval rules)
+        and then corrected with a single query over the persisted occurrences
+        that were moved or cancelled.
+
+        Persisted occurrences are assumed to originate from the event's
+        current rule.
+        """
+        return self._count_occurrences(start, end, self._override_rows(start, end))
+
+    def has_occurrences(self, start, end):
+        """
+        Returns True if get_occurrences(start, end) is not empty, without
+        creating any occurrences.
+        """
+        return self._has_occurrences(start, end, self._override_rows(start, end))
+
+    def _override_rows(self, start, end):
+        return self.occurrence_set.filter(
+            persisted_window_q(start, end, self.end - self.start)).values_list(*OVERRIDE_ROW_FIELDS)
+
+    def _count_occurrences(self, start, end, rows):
+        removed, added = self._count_overrides(start, end, rows)
+        return self._count_generated(start, end) - removed + added
+
+    def _has_occurrences(self, start, end, rows):
+        removed, added = self._count_overrides(start, end, rows)
+        return added > 0 or self._count_generated(start, end, limit=removed + 1) > removed
+
+    def _count_generated(self, start, end, limit=None):
+        """
+        Returns len(_get_occurrence_list(start, end)), or at most ``limit``.
+        """
+        if self.rule is None:
+            return int(self.start < end and self.end > start)
+        difference = self.end - self.start
+        if self.end_recurring_period and self.end_recurring_period < end:
+            end = self.end_recurring_period
+        return count_between(self._get_recurrence(), start - difference, end, inc=True, limit=limit)
+
+    def _count_overrides(self, start, end, rows):
+        """
+        Returns how many of the generated occurrences between start and end
+        the persisted occurrences in ``rows`` (see OVERRIDE_ROW_FIELDS) remove
+        from the window by moving them out of it, and how many they add to it
+        by moving in from outside.
+        """
+        if self.rule is None:
+            generated = self.start < end and self.end > start
+            first = last = self.start
+        else:
+            generated = True
+            first = start - (self.end - self.start)
+            last = end
+            if self.end_recurring_period and self.end_recurring_period < end:
+                last = self.end_recurring_period
+        removed = added = 0
+        for original_start, o_start, o_end, cancelled in rows:
+            in_window = o_start < end and o_end >= start
+            if generated and first <= original_start <= last:
+                removed += not in_window
+            elif in_window and not cancelled:
+                added += 1
+        return removed, added
 
     def get_rrule_object(self):
+        """
+        Returns the rrule for this event, or None if it does not recur. The
+        rrule comes from a process wide cache and may be shared with other
+        events, so it must not be modified.
+        """
+        if self.rule is not None:
+            return get_rrule(self)
+
+    def _get_recurrence(self):
+        """
+        Returns the object used to expand this event's rule. This is the
+        rrule, or a faster drop-in for rules that are simple arithmetic
+        progressions (see schedule.recurrence).
+        """
         if self.rule is not None:
-            params = self.rule.get_params() or {}
-            params.update(self.rule_params or {})
-            frequency = self.rule.rrule_frequency()
-            return rrule.rrule(frequency, dtstart=self.start, **params)
+            return get_recurrence(self)
 
     def _create_occurrence(self, start, end=None):
         if end is None:
             end = start + (self.end - self.start)
-        return Occurrence(event=self, start=start, end=end, original_start=start, original_end=end)
+        return GeneratedOccurrence(self, start, end)
 
     def get_occurrence(self, date):
         if timezone.is_naive(date) and django_settings.USE_TZ:
             date = timezone.make_aware(date, timezone.utc)
-        rule = self.get_rrule_object()
+        rule = self._get_recurrence()
         if rule:
             next_occurrence = rule.after(date, inc=True)
         else:
@@ -139,7 +436,8 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
             try:
                 return Occurrence.objects.get(event=self, original_start=date)
             except Occurrence.DoesNotExist:
-                return self._create_occurrence(next_occurrence)
+                # a model instance, this is what the occurrence forms edit
+                return self._create_occurrence(next_occurrence).to_occurrence()
 
     def _get_occurrence_list(self, start, end):
         """
@@ -147,21 +445,15 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
         """
         difference = (self.end - self.start)
         if self.rule is not None:
-            occurrences = []
             if self.end_recurring_period and self.end_recurring_period < end:
                 end = self.end_recurring_period
-            rule = self.get_rrule_object()
-            o_starts = []
-            o_starts.append(rule.between(start, end, inc=True))
-            o_starts.append(rule.between(start - (difference // 2), end - (difference // 2), inc=True))
-            o_starts.append(rule.between(start - difference, end - difference, inc=True))
-            for occ in o_starts:
-                for o_start in occ:
-                    o_end = o_start + difference
-                    occurrence = self._create_occurrence(o_start, o_end)
-                    if occurrence not in occurrences:
-                        occurrences.append(occurrence)
-            return occurrences
+            rule = self._get_recurrence()
+            # Walk the rule once, starting early enough to catch occurrences
+            # that began before the window but still run into it. The rule
+            # yields each start once and in order, so the result needs no
+            # de-duplication.
+            return [self._create_occurrence(o_start, o_start + difference)
+                    for o_start in rule.between(start - difference, end, inc=True)]
         else:
             # check if event is in the period
             if self.start < end and self.end > start:
@@ -169,6 +461,21 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
             else:
                 return []
 
+    def _iter_occurrence_list(self, start, end):
+        """
+        The lazy counterpart of _get_occurrence_list, yields the occurrences
+        in start order.
+        """
+        if self.rule is None:
+            if self.start < end and self.end > start:
+                yield self._create_occurrence(self.start)
+            return
+        difference = self.end - self.start
+        if self.end_recurring_period and self.end_recurring_period < end:
+            end = self.end_recurring_period
+        for o_start in iter_between(self._get_recurrence(), start - difference, end, inc=True):
+            yield self._create_occurrence(o_start, o_start + difference)
+
     def _occurrences_after_generator(self, after=None, tzinfo=pytz.utc):
         """
         returns a generator that produces unpresisted occurrences after the
@@ -177,13 +484,14 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
 
         if after is None:
             after = timezone.now()
-        rule = self.get_rrule_object()
+        rule = self._get_recurrence()
         if rule is None:
             if self.end > after:
                 yield self._create_occurrence(self.start, self.end)
             raise StopIteration
-        date_iter = iter(rule)
         difference = self.end - self.start
+        # start at the first occurrence that ends after ``after``
+        date_iter = iter_after(rule, after - difference)
         while True:
             o_start = next(date_iter)
             if self.end_recurring_period and o_start > self.end_recurring_period:
@@ -197,7 +505,11 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
         returns a generator that produces occurrences after the datetime
         ``after``.  Includes all of the persisted Occurrences.
         """
-        occ_replacer = OccurrenceReplacer(self.occurrence_set.all())
+        if after is None:
+            after = timezone.now()
+        # only occurrences generated after ``after`` can be replaced
+        occ_replacer = OccurrenceReplacer(
+            self.occurrence_set.filter(original_start__gt=after - (self.end - self.start)))
         generator = self._occurrences_after_generator(after)
         while True:
             next_occurence = next(generator)
@@ -362,23 +674,12 @@ class EventRelation(with_metaclass(ModelBase, *get_model_bases())):
 
 
 @python_2_unicode_compatible
-class Occurrence(with_metaclass(ModelBase, *get_model_bases())):
-    event = models.ForeignKey(Event, verbose_name=_("event"))
-    start = models.DateTimeField(_("start"))
-    end = models.DateTimeField(_("end"))
-    cancelled = models.BooleanField(_("cancelled"), default=False)
-    original_start = models.DateTimeField(_("original start"))
-    original_end = models.DateTimeField(_("original end"))
-    created_on = models.DateTimeField(_("created on"), auto_now_add=True)
-    updated_on = models.DateTimeField(_("updated on"), auto_now=True)
-
-    class Meta(object):
-        verbose_name = _("occurrence")
-        verbose_name_plural = _("occurrences")
-        app_label = 'schedule'
-        unique_together = ('event', 'start') # the api uses event and start as the primary key
-        
-    objects = models.Manager()
+class OccurrenceMixin(object):
+    '''
+    The read and persistence API shared by Occurrence and GeneratedOccurrence,
+    which is what templates, periods and the api rely on.
+    '''
+    __slots__ = ()
 
     def moved(self):
         return self.original_start != self.start or self.original_end != self.end
@@ -457,5 +758,101 @@ class Occurrence(with_metaclass(ModelBase, *get_model_bases())):
         return self.end < other.end
 
     def __eq__(self, other):
-        return (isinstance(other, Occurrence) and
+        return (isinstance(other, OccurrenceMixin) and
                 self.original_start == other.original_start and self.original_end == other.original_end)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+class Occurrence(with_metaclass(ModelBase, OccurrenceMixin, *get_model_bases())):
+    event = models.ForeignKey(Event, verbose_name=_("event"))
+    start = models.DateTimeField(_("start"))
+    end = models.DateTimeField(_("end"))
+    cancelled = models.BooleanField(_("cancelled"), default=False)
+    original_start = models.DateTimeField(_("original start"))
+    original_end = models.DateTimeField(_("original end"))
+    created_on = models.DateTimeField(_("created on"), auto_now_add=True)
+    updated_on = models.DateTimeField(_("updated on"), auto_now=True)
+
+    class Meta(object):
+        verbose_name = _("occurrence")
+        verbose_name_plural = _("occurrences")
+        app_label = 'schedule'
+        unique_together = ('event', 'start') # the api uses event and start as the primary key
+        index_together = (('event', 'original_start'), ('event', 'start', 'end'))
+        
+    objects = models.Manager()
+
+
+class GeneratedOccurrence(OccurrenceMixin):
+    '''
+    An occurrence expanded from an event's rule that has not been persisted.
+
+    Periods can hold tens of thousands of these, so instead of an unsaved
+    Occurrence model instance this is a slotted object with the same read
+    API. The first save (through cancel, move, uncancel or save itself)
+    creates the Occurrence row, which from then on backs pk, id and the
+    timestamps of this object; ``to_occurrence`` returns it.
+    '''
+    __slots__ = ('event', 'start', 'end', 'original_start', 'original_end', 'cancelled', '_occurrence')
+
+    def __init__(self, event, start, end, original_start=None, original_end=None, cancelled=False):
+        self.event = event
+        self.start = start
+        self.end = end
+        self.original_start = start if original_start is None else original_start
+        self.original_end = end if original_end is None else original_end
+        self.cancelled = cancelled
+        self._occurrence = None
+
+    @property
+    def event_id(self):
+        return self.event.pk
+
+    @property
+    def pk(self):
+        if self._occurrence is not None:
+            return self._occurrence.pk
+
+    id = pk
+
+    @property
+    def created_on(self):
+        if self._occurrence is not None:
+            return self._occurrence.created_on
+
+    @property
+    def updated_on(self):
+        if self._occurrence is not None:
+            return self._occurrence.updated_on
+
+    def to_occurrence(self):
+        """
+        Returns the Occurrence model instance for this occurrence, unsaved
+        unless this occurrence has been saved before.
+        """
+        occurrence = self._occurrence
+        if occurrence is None:
+            occurrence = Occurrence(event=self.event, original_start=self.original_start,
+                                    original_end=self.original_end)
+        occurrence.start = self.start
+        occurrence.end = self.end
+        occurrence.cancelled = self.cancelled
+        return occurrence
+
+    def save(self, *args, **kwargs):
+        occurrence = self.to_occurrence()
+        occurrence.save(*args, **kwargs)
+        self._occurrence = occurrence
+
+    def delete(self):
+        if self._occurrence is not None:
+            self._occurrence.delete()
+            self._occurrence = None
+
+    def __hash__(self):
+        return hash((self.original_start, self.original_end))
+
+    def __repr__(self):
+        return '<GeneratedOccurrence: %s>' % self
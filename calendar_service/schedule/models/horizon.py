@@ -0,0 +1,58 @@
+from __future__ import unicode_literals
+from six.moves.builtins import object  # @UnresolvedImport
+from six import with_metaclass
+
+from django.db import models
+from django.db.models.base import ModelBase
+from django.utils.encoding import python_2_unicode_compatible
+from django.utils.translation import ugettext_lazy as _
+
+from schedule.models.events import Event, Occurrence
+from schedule.utils import get_model_bases
+
+
+@python_2_unicode_compatible
+class MaterializedOccurrence(with_metaclass(ModelBase, *get_model_bases())):
+    '''
+    A precomputed occurrence of an event inside the event's materialized
+    horizon (see OccurrenceHorizon). This is derived data, it is rebuilt from
+    Event.get_occurrences by schedule.horizon and never edited directly.
+
+    occurrence: the persisted Occurrence this row stands for, if any.
+    '''
+    event = models.ForeignKey(Event, verbose_name=_("event"))
+    occurrence = models.ForeignKey(Occurrence, null=True, blank=True, verbose_name=_("occurrence"))
+    start = models.DateTimeField(_("start"))
+    end = models.DateTimeField(_("end"))
+    original_start = models.DateTimeField(_("original start"))
+    original_end = models.DateTimeField(_("original end"))
+    cancelled = models.BooleanField(_("cancelled"), default=False)
+
+    class Meta(object):
+        verbose_name = _("materialized occurrence")
+        verbose_name_plural = _("materialized occurrences")
+        app_label = 'schedule'
+        index_together = (('start', 'end'),)
+
+    def __str__(self):
+        return '%s: %s - %s' % (self.event_id, self.start, self.end)
+
+
+@python_2_unicode_compatible
+class OccurrenceHorizon(with_metaclass(ModelBase, *get_model_bases())):
+    '''
+    The window [start, end) for which the occurrences of an event have been
+    materialized, and when that was last done.
+    '''
+    event = models.OneToOneField(Event, primary_key=True, verbose_name=_("event"))
+    start = models.DateTimeField(_("start"))
+    end = models.DateTimeField(_("end"))
+    refreshed_on = models.DateTimeField(_("refreshed on"), auto_now=True)
+
+    class Meta(object):
+        verbose_name = _("occurrence horizon")
+        verbose_name_plural = _("occurrence horizons")
+        app_label = 'schedule'
+
+    def __str__(self):
+        return '%s: %s - %s' % (self.event_id, self.start, self.end)
@@ -1,5 +1,6 @@
 from __future__ import unicode_literals
 
+from bisect import bisect_left, bisect_right
 import datetime
 
 from django.conf import settings
@@ -11,8 +12,13 @@ from django.utils.translation import ugettext
 import pytz
 
 import calendar as standardlib_calendar
+from schedule.boundaries import get_boundary_table, local_midnight
+from schedule.cache import cached_occurrences
 from schedule.conf.settings import SHOW_CANCELLED_OCCURRENCES
-from schedule.models import Occurrence
+from schedule.horizon import materialized_occurrences
+from schedule.models import Event, Occurrence
+from schedule.models.events import OCCURRENCE_END
+from schedule.utils import occurrences_in_window, shows_in_window, unique_occurrences
 
 
 weekday_names = []
@@ -32,13 +38,131 @@ else:
         weekday_abbrs.append(WEEKDAYS_ABBR[i])
 
 
+class ExpansionContext(object):
+    """
+    Remembers which windows of which events have been expanded while serving
+    a request, so that periods built from one another (prev, next, sub
+    periods and the periods of the templatetags) expand each event at most
+    once.
+
+    Windows of the same events that overlap or touch are coalesced: only the
+    part of a new window that is not covered yet is expanded, and the result
+    is merged into one larger expansion every later window is filtered from.
+    """
+    def __init__(self):
+        self._expansions = {}
+
+    def get_occurrences(self, events, start, end):
+        """
+        Returns the occurrences of ``events`` between start and end, the same
+        ones Event.objects.occurrences_between returns, sorted.
+        """
+        key = id(events)
+        if key not in self._expansions:
+            # keeps ``events`` alive so that its id is not reused
+            self._expansions[key] = (events, list(events), [])
+        events, event_list, windows = self._expansions[key]
+        touching = [window for window in windows if window[0] <= end and window[1] >= start]
+        for window in touching:
+            if window[0] <= start and window[1] >= end:
+                return occurrences_in_window(window[2], start, end)
+
+        # expand the gaps between the windows the new one touches
+        merged = []
+        cursor = start
+        for w_start, w_end, occurrences in sorted(touching, key=lambda window: window[0]):
+            if cursor < w_start:
+                merged += self._expand(event_list, cursor, w_start)
+            merged += occurrences
+            cursor = max(cursor, w_end)
+        if cursor < end:
+            merged += self._expand(event_list, cursor, end)
+
+        # occurrences crossing the edge of a gap come out of both expansions
+        window = (min([start] + [w[0] for w in touching]),
+                  max([end] + [w[1] for w in touching]),
+                  sorted(unique_occurrences(merged), key=OCCURRENCE_END))
+        windows[:] = [w for w in windows if w not in touching] + [window]
+        return occurrences_in_window(window[2], start, end)
+
+    def _expand(self, events, start, end):
+        occurrences = cached_occurrences(events, start, end)
+        if occurrences is None:
+            occurrences = Event.objects.occurrences_between(events, start, end)
+        return occurrences
+
+
+class OccurrenceIndex(object):
+    """
+    The occurrences of a period indexed for the sub-periods sliced out of it.
+
+    Occurrences that last at most a day are kept sorted by start, those
+    overlapping a window then start at most a day before it, so they are
+    found by bisection. The few longer ones are kept aside and checked one by
+    one. A window's occurrences come back in the order of the list the index
+    was built from, cancelled ones only if their original slot is in the
+    window, as with Event.get_occurrences.
+    """
+    def __init__(self, occurrences):
+        self._occurrences = occurrences = list(occurrences)
+        short = []
+        self._long = []
+        for position, occ in enumerate(occurrences):
+            if occ.end - occ.start > datetime.timedelta(days=1):
+                self._long.append((position, occ))
+            else:
+                short.append((occ.start, position, occ))
+        short.sort(key=lambda item: (item[0], item[1]))
+        self._starts = [item[0] for item in short]
+        self._short = [(position, occ) for __, position, occ in short]
+        self._max_duration = max([occ.end - occ.start for __, occ in self._short] or
+                                 [datetime.timedelta(0)])
+
+    def between(self, start, end):
+        """
+        Returns the occurrences that start at or before end and end at or
+        after start.
+        """
+        first = bisect_left(self._starts, start - self._max_duration)
+        last = bisect_right(self._starts, end)
+        found = [item for item in self._short[first:last] if item[1].end >= start]
+        found += [item for item in self._long if item[1].start <= end and item[1].end >= start]
+        found = [item for item in found if shows_in_window(item[1], start, end)]
+        found.sort(key=lambda item: item[0])
+        return [occ for __, occ in found]
+
+    def bucket(self, cells, occurrences=None):
+        """
+        Returns the occurrences of each of ``cells``, consecutive (start, end)
+        windows in UTC, in one pass over ``occurrences``, those of the period
+        the cells are sliced out of, all of the index by default. This is all
+        that differs between the day, week or month grids of one UTC
+        expansion in different timezones.
+        """
+        if occurrences is None:
+            occurrences = self._occurrences
+        starts = [cell[0] for cell in cells]
+        ends = [cell[1] for cell in cells]
+        buckets = [[] for __ in cells]
+        for occ in occurrences:
+            i = bisect_left(ends, occ.start)
+            while i < len(cells) and starts[i] <= occ.end:
+                if shows_in_window(occ, starts[i], ends[i]):
+                    buckets[i].append(occ)
+                i += 1
+        return buckets
+
+
 class Period(object):
     """
     This class represents a period of time. It can return a set of occurrences
     based on its events, and its time period (start and end).
+
+    Periods derived from one another share the ExpansionContext of the first
+    one, pass one in to share it across the periods of a request.
     """
     def __init__(self, events, start, end, parent_persisted_occurrences=None,
-                 occurrence_pool=None, tzinfo=pytz.utc):
+                 occurrence_pool=None, tzinfo=pytz.utc, expansion=None):
 
         self.utc_start = self._normalize_timezone_to_utc(start, tzinfo)
 
@@ -46,7 +170,11 @@ class Period(object):
 
         self.events = events
         self.tzinfo = self._get_tzinfo(tzinfo)
+        # templates read these in loops, convert them once
+        self.start = self._localize(self.utc_start)
+        self.end = self._localize(self.utc_end)
         self.occurrence_pool = occurrence_pool
+        self.expansion = expansion if expansion is not None else ExpansionContext()
         if parent_persisted_occurrences is not None:
             self._persisted_occurrences = parent_persisted_occurrences
 
@@ -74,15 +202,18 @@ class Period(object):
 
     def _get_sorted_occurrences(self):
         occurrences = []
+        if isinstance(self.occurrence_pool, OccurrenceIndex):
+            return self.occurrence_pool.between(self.utc_start, self.utc_end)
         if hasattr(self, "occurrence_pool") and self.occurrence_pool is not None:
             for occurrence in self.occurrence_pool:
-                if occurrence.start <= self.utc_end and occurrence.end >= self.utc_start:
+                if (occurrence.start <= self.utc_end and occurrence.end >= self.utc_start and
+                        shows_in_window(occurrence, self.utc_start, self.utc_end)):
                     occurrences.append(occurrence)
             return occurrences
-        for event in self.events:
-            event_occurrences = event.get_occurrences(self.start, self.end)
-            occurrences += event_occurrences
-        return sorted(occurrences)
+        occurrences = materialized_occurrences(self.events, self.utc_start, self.utc_end)
+        if occurrences is None:
+            return self.expansion.get_occurrences(self.events, self.utc_start, self.utc_end)
+        return sorted(occurrences, key=OCCURRENCE_END)
 
     def cached_get_sorted_occurrences(self):
         if hasattr(self, '_occurrences'):
@@ -92,6 +223,18 @@ class Period(object):
         return occs
     occurrences = property(cached_get_sorted_occurrences)
 
+    @property
+    def occurrence_index(self):
+        """
+        The OccurrenceIndex sub-periods take their occurrences from, built
+        once per period tree.
+        """
+        if isinstance(self.occurrence_pool, OccurrenceIndex):
+            return self.occurrence_pool
+        if not hasattr(self, '_occurrence_index'):
+            self._occurrence_index = OccurrenceIndex(self.occurrences)
+        return self._occurrence_index
+
     def get_persisted_occurrences(self):
         if hasattr(self, '_persisted_occurrenes'):
             return self._persisted_occurrences
@@ -131,76 +274,87 @@ class Period(object):
     def get_occurrences(self):
         return self.occurrences
 
+    def iter_occurrences(self):
+        """
+        Yields the occurrences of get_occurrences in the same order. Unless
+        they are known already the expansions of the events are merged
+        lazily, so reading the first few does not sort all of them.
+        """
+        if hasattr(self, '_occurrences') or self.occurrence_pool is not None:
+            return iter(self.occurrences)
+        occurrences = materialized_occurrences(self.events, self.utc_start, self.utc_end)
+        if occurrences is not None:
+            return iter(sorted(occurrences, key=OCCURRENCE_END))
+        return Event.objects.iter_occurrences_between(self.events, self.utc_start, self.utc_end)
+
     def has_occurrences(self):
         return any(self.classify_occurrence(o) for o in self.occurrences)
 
     def get_time_slot(self, start, end):
         if start >= self.start and end <= self.end:
-            return Period(self.events, start, end)
+            return Period(self.events, start, end, expansion=self.expansion)
         return None
 
     def create_sub_period(self, cls, start=None, tzinfo=None):
         if tzinfo is None:
             tzinfo = self.tzinfo
         start = start or self.start
-        return cls(self.events, start, self.get_persisted_occurrences(), self.occurrences, tzinfo)
+        return cls(self.events, start, self.get_persisted_occurrences(), self.occurrence_index, tzinfo,
+                   expansion=self.expansion)
 
     def get_periods(self, cls, tzinfo=None):
         if tzinfo is None:
             tzinfo = self.tzinfo
-        period = self.create_sub_period(cls)
-        while period.start < self.end:
-            yield self.create_sub_period(cls, period.start, tzinfo)
-            period = next(period)
-
-    @property
-    def start(self):
-        if self.tzinfo is not None:
-            return self.utc_start.astimezone(self.tzinfo)
-        return self.utc_start.replace(tzinfo=None)
-
-    @property
-    def end(self):
+        periods = []
+        start = self.start
+        while start < self.end:
+            # each sub-period starts where the previous one ends
+            period = self.create_sub_period(cls, start, tzinfo)
+            periods.append(period)
+            start = period.end
+        # the occurrences of the sub-periods are all among those of this one
+        buckets = self.occurrence_index.bucket([(p.utc_start, p.utc_end) for p in periods],
+                                               self.occurrences)
+        for period, occurrences in zip(periods, buckets):
+            period._occurrences = occurrences
+        return iter(periods)
+
+    def _localize(self, utc_point):
         if self.tzinfo is not None:
-            return self.utc_end.astimezone(self.tzinfo)
-        return self.utc_end.replace(tzinfo=None)
+            return utc_point.astimezone(self.tzinfo)
+        return utc_point.replace(tzinfo=None)
 
 
 @python_2_unicode_compatible
 class Year(Period):
-    def __init__(self, events, date=None, parent_persisted_occurrences=None, tzinfo=pytz.utc):
+    def __init__(self, events, date=None, parent_persisted_occurrences=None, tzinfo=pytz.utc,
+                 expansion=None):
         self.tzinfo = self._get_tzinfo(tzinfo)
         if date is None:
             date = timezone.now()
         start, end = self._get_year_range(date)
-        super(Year, self).__init__(events, start, end, parent_persisted_occurrences, tzinfo=tzinfo)
+        super(Year, self).__init__(events, start, end, parent_persisted_occurrences, tzinfo=tzinfo,
+                                   expansion=expansion)
 
     def get_months(self):
         return self.get_periods(Month)
 
     def next_year(self):
-        return Year(self.events, self.end, tzinfo=self.tzinfo)
+        return Year(self.events, self.end, tzinfo=self.tzinfo, expansion=self.expansion)
     next = __next__ = next_year
 
     def prev_year(self):
         start = datetime.datetime(self.start.year - 1, self.start.month, self.start.day)
-        return Year(self.events, start, tzinfo=self.tzinfo)
+        return Year(self.events, start, tzinfo=self.tzinfo, expansion=self.expansion)
     prev = prev_year
 
     def _get_year_range(self, year):
-        # If tzinfo is not none get the local start of the year and convert it to utc.
+        # If tzinfo is not none get the utc instants of the local start and end of the year.
+        if self.tzinfo is not None:
+            return get_boundary_table(self.tzinfo, year.year).year_range()
         naive_start = datetime.datetime(year.year, datetime.datetime.min.month, datetime.datetime.min.day)
         naive_end = datetime.datetime(year.year + 1, datetime.datetime.min.month, datetime.datetime.min.day)
-
-        start = naive_start
-        end = naive_end
-        if self.tzinfo is not None:
-            local_start = self.tzinfo.localize(naive_start)
-            local_end = self.tzinfo.localize(naive_end)
-            start = local_start.astimezone(pytz.utc)
-            end = local_end.astimezone(pytz.utc)
-
-        return start, end
+        return naive_start, naive_end
 
     def __str__(self):
         return self.start.year
@@ -213,13 +367,14 @@ class Month(Period):
     and day periods within the date.
     """
     def __init__(self, events, date=None, parent_persisted_occurrences=None,
-                 occurrence_pool=None, tzinfo=pytz.utc):
+                 occurrence_pool=None, tzinfo=pytz.utc, expansion=None):
         self.tzinfo = self._get_tzinfo(tzinfo)
         if date is None:
             date = timezone.now()
         start, end = self._get_month_range(date)
         super(Month, self).__init__(events, start, end,
-                                    parent_persisted_occurrences, occurrence_pool, tzinfo=tzinfo)
+                                    parent_persisted_occurrences, occurrence_pool, tzinfo=tzinfo,
+                                    expansion=expansion)
 
     def get_weeks(self):
         return self.get_periods(Week)
@@ -234,44 +389,37 @@ class Month(Period):
         return self.create_sub_period(Day, date)
 
     def next_month(self):
-        return Month(self.events, self.end, tzinfo=self.tzinfo)
+        return Month(self.events, self.end, tzinfo=self.tzinfo, expansion=self.expansion)
     next = __next__ = next_month
 
     def prev_month(self):
         start = (self.start - datetime.timedelta(days=1)).replace(day=1, tzinfo=self.tzinfo)
-        return Month(self.events, start, tzinfo=self.tzinfo)
+        return Month(self.events, start, tzinfo=self.tzinfo, expansion=self.expansion)
     prev = prev_month
 
     def current_year(self):
-        return Year(self.events, self.start, tzinfo=self.tzinfo)
+        return Year(self.events, self.start, tzinfo=self.tzinfo, expansion=self.expansion)
 
     def prev_year(self):
         start = datetime.datetime.min.replace(year=self.start.year - 1, tzinfo=self.tzinfo)
-        return Year(self.events, start, tzinfo=self.tzinfo)
+        return Year(self.events, start, tzinfo=self.tzinfo, expansion=self.expansion)
 
     def next_year(self):
         start = datetime.datetime.min.replace(year=self.start.year + 1, tzinfo=self.tzinfo)
-        return Year(self.events, start, tzinfo=self.tzinfo)
+        return Year(self.events, start, tzinfo=self.tzinfo, expansion=self.expansion)
 
     def _get_month_range(self, month):
         year = month.year
         month = month.month
-        # If tzinfo is not none get the local start of the month and convert it to utc.
+        # If tzinfo is not none get the utc instants of the local start and end of the month.
+        if self.tzinfo is not None:
+            return get_boundary_table(self.tzinfo, year).month_range(month)
         naive_start = datetime.datetime.min.replace(year=year, month=month)
         if month == 12:
             naive_end = datetime.datetime.min.replace(month=1, year=year + 1, day=1)
         else:
             naive_end = datetime.datetime.min.replace(month=month + 1, year=year, day=1)
-
-        start = naive_start
-        end = naive_end
-        if self.tzinfo is not None:
-            local_start = self.tzinfo.localize(naive_start)
-            local_end = self.tzinfo.localize(naive_end)
-            start = local_start.astimezone(pytz.utc)
-            end = local_end.astimezone(pytz.utc)
-
-        return start, end
+        return naive_start, naive_end
 
     def __str__(self):
         return self.name()
@@ -289,27 +437,29 @@ class Week(Period):
     The Week period that has functions for retrieving Day periods within it
     """
     def __init__(self, events, date=None, parent_persisted_occurrences=None,
-                 occurrence_pool=None, tzinfo=pytz.utc):
+                 occurrence_pool=None, tzinfo=pytz.utc, expansion=None):
         self.tzinfo = self._get_tzinfo(tzinfo)
         if date is None:
             date = timezone.now()
         start, end = self._get_week_range(date)
         super(Week, self).__init__(events, start, end,
-                                   parent_persisted_occurrences, occurrence_pool, tzinfo=tzinfo)
+                                   parent_persisted_occurrences, occurrence_pool, tzinfo=tzinfo,
+                                   expansion=expansion)
 
     def prev_week(self):
-        return Week(self.events, self.start - datetime.timedelta(days=7), tzinfo=self.tzinfo)
+        return Week(self.events, self.start - datetime.timedelta(days=7), tzinfo=self.tzinfo,
+                    expansion=self.expansion)
     prev = prev_week
 
     def next_week(self):
-        return Week(self.events, self.end, tzinfo=self.tzinfo)
+        return Week(self.events, self.end, tzinfo=self.tzinfo, expansion=self.expansion)
     next = __next__ = next_week
 
     def current_month(self):
-        return Month(self.events, self.start, tzinfo=self.tzinfo)
+        return Month(self.events, self.start, tzinfo=self.tzinfo, expansion=self.expansion)
 
     def current_year(self):
-        return Year(self.events, self.start, tzinfo=self.tzinfo)
+        return Year(self.events, self.start, tzinfo=self.tzinfo, expansion=self.expansion)
 
     def get_days(self):
         return self.get_periods(Day)
@@ -333,15 +483,9 @@ class Week(Period):
         naive_end = naive_start + datetime.timedelta(days=7)
 
         if self.tzinfo is not None:
-            local_start = self.tzinfo.localize(naive_start)
-            local_end = self.tzinfo.localize(naive_end)
-            start = local_start.astimezone(pytz.utc)
-            end = local_end.astimezone(pytz.utc)
-        else:
-            start = naive_start
-            end = naive_end
-
-        return start, end
+            return (local_midnight(self.tzinfo, naive_start.date()),
+                    local_midnight(self.tzinfo, naive_end.date()))
+        return naive_start, naive_end
 
     def __str__(self):
         date_format = 'l, %s' % settings.DATE_FORMAT
@@ -354,30 +498,24 @@ class Week(Period):
 @python_2_unicode_compatible
 class Day(Period):
     def __init__(self, events, date=None, parent_persisted_occurrences=None,
-                 occurrence_pool=None, tzinfo=pytz.utc):
+                 occurrence_pool=None, tzinfo=pytz.utc, expansion=None):
         self.tzinfo = self._get_tzinfo(tzinfo)
         if date is None:
             date = timezone.now()
         start, end = self._get_day_range(date)
         super(Day, self).__init__(events, start, end,
-                                  parent_persisted_occurrences, occurrence_pool, tzinfo=tzinfo)
+                                  parent_persisted_occurrences, occurrence_pool, tzinfo=tzinfo,
+                                  expansion=expansion)
 
     def _get_day_range(self, date):
         if isinstance(date, datetime.datetime):
             date = date.date()
 
+        if self.tzinfo is not None:
+            return get_boundary_table(self.tzinfo, date.year).day_range(date)
         naive_start = datetime.datetime.combine(date, datetime.time.min)
         naive_end = datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time.min)
-        if self.tzinfo is not None:
-            local_start = self.tzinfo.localize(naive_start)
-            local_end = self.tzinfo.localize(naive_end)
-            start = local_start.astimezone(pytz.utc)
-            end = local_end.astimezone(pytz.utc)
-        else:
-            start = naive_start
-            end = naive_end
-
-        return start, end
+        return naive_start, naive_end
 
     def __str__(self):
         date_format = 'l, %s' % settings.DATE_FORMAT
@@ -387,18 +525,19 @@ class Day(Period):
         }
 
     def prev_day(self):
-        return Day(self.events, self.start - datetime.timedelta(days=1), tzinfo=self.tzinfo)
+        return Day(self.events, self.start - datetime.timedelta(days=1), tzinfo=self.tzinfo,
+                   expansion=self.expansion)
     prev = prev_day
 
     def next_day(self):
-        return Day(self.events, self.end, tzinfo=self.tzinfo)
+        return Day(self.events, self.end, tzinfo=self.tzinfo, expansion=self.expansion)
     next = __next__ = next_day
 
     def current_year(self):
-        return Year(self.events, self.start, tzinfo=self.tzinfo)
+        return Year(self.events, self.start, tzinfo=self.tzinfo, expansion=self.expansion)
 
     def current_month(self):
-        return Month(self.events, self.start, tzinfo=self.tzinfo)
+        return Month(self.events, self.start, tzinfo=self.tzinfo, expansion=self.expansion)
 
     def current_week(self):
-        return Week(self.events, self.start, tzinfo=self.tzinfo)
+        return Week(self.events, self.start, tzinfo=self.tzinfo, expansion=self.expansion)
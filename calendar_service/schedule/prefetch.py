@@ -0,0 +1,92 @@
+"""
+Speculative prefetching of adjacent periods.
+
+Users page back and forth through periods, so after serving one the views
+ask ``prefetch_window`` to build the occurrence cache chunks (see
+schedule.cache) of the previous and next ones. This happens in a small pool
+of daemon threads that is shared by the whole process: a window whose
+months are already queued is not queued again, and when the queue is full
+the window is dropped instead of making the request wait.
+"""
+from __future__ import unicode_literals
+import logging
+import threading
+
+from django.db import connection
+from six.moves import queue
+
+from schedule import cache
+from schedule.conf.settings import (SCHEDULER_PREFETCH, SCHEDULER_PREFETCH_QUEUE_SIZE,
+                                    SCHEDULER_PREFETCH_WORKERS)
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher(object):
+    """
+    Builds cache chunks in at most ``workers`` background threads, which are
+    started on the first submission.
+    """
+    def __init__(self, workers=SCHEDULER_PREFETCH_WORKERS, max_pending=SCHEDULER_PREFETCH_QUEUE_SIZE):
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def submit(self, calendar_id, months):
+        """
+        Queues building the chunks of ``months`` of a calendar. Returns
+        whether anything was queued.
+        """
+        with self._lock:
+            keys = set((calendar_id, month) for month in months) - self._pending
+            if not keys:
+                return False
+            try:
+                self._queue.put_nowait(keys)
+            except queue.Full:
+                return False
+            self._pending.update(keys)
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name='schedule-prefetch')
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        return True
+
+    def _work(self):
+        while True:
+            self.run_next()
+            # the thread outlives requests, do not hold on to a connection
+            connection.close()
+
+    def run_next(self):
+        """
+        Builds the chunks of the next queued window, waiting for one.
+        """
+        keys = self._queue.get()
+        try:
+            months = {}
+            for calendar_id, month in keys:
+                months.setdefault(calendar_id, []).append(month)
+            for calendar_id, calendar_months in months.items():
+                cache.get_chunks(calendar_id, sorted(calendar_months))
+        except Exception:
+            logger.exception("Prefetching occurrences failed")
+        finally:
+            with self._lock:
+                self._pending.difference_update(keys)
+            self._queue.task_done()
+
+
+prefetcher = Prefetcher()
+
+
+def prefetch_window(calendar_id, start, end):
+    """
+    Warms the occurrence cache of a calendar for start to end in the
+    background, if prefetching and the cache are enabled.
+    """
+    if SCHEDULER_PREFETCH and cache.SCHEDULER_OCCURRENCE_CACHE and calendar_id is not None:
+        prefetcher.submit(calendar_id, cache.months_between(start, end))
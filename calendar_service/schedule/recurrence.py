@@ -0,0 +1,467 @@
+from six.moves.builtins import object
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+import datetime
+import itertools
+import json
+import threading
+
+from dateutil import rrule
+import pytz
+import six
+
+from schedule.conf.settings import (SCHEDULER_RRULE_CACHE_SIZE, SCHEDULER_RRULE_CHECKPOINT_INTERVAL,
+                                    SCHEDULER_VECTORIZED_EXPANSION)
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, without it every rule goes through dateutil
+    numpy = None
+
+VECTORIZED_EXPANSION = numpy is not None and SCHEDULER_VECTORIZED_EXPANSION
+
+# seconds between two occurrences of a rule with interval 1
+FIXED_INTERVAL_SECONDS = {
+    rrule.WEEKLY: 7 * 24 * 60 * 60,
+    rrule.DAILY: 24 * 60 * 60,
+    rrule.HOURLY: 60 * 60,
+    rrule.MINUTELY: 60,
+    rrule.SECONDLY: 1,
+}
+FIXED_INTERVAL_PARAMS = frozenset(['interval', 'count'])
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class RRuleCache(object):
+    """
+    A bounded, process wide LRU cache of compiled ``dateutil.rrule.rrule``
+    objects.
+
+    Entries are keyed by a fingerprint of everything that goes into building
+    the rrule (see ``rrule_fingerprint``), so every event whose rule, rule
+    params and start are identical shares a single compiled object, no matter
+    which Rule row it points to. Editing any of those values produces a new
+    fingerprint, so stale entries are never served; they simply age out.
+    """
+
+    def __init__(self, maxsize=SCHEDULER_RRULE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, factory):
+        """
+        Return the object cached under ``key``, calling ``factory()`` to build
+        and store it on a miss.
+        """
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                pass
+            else:
+                self._entries[key] = value
+                self.hits += 1
+                return value
+            self.misses += 1
+        # build outside of the lock, compiling a rule can be expensive
+        value = factory()
+        if self.maxsize <= 0:
+            return value
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+rrule_cache = RRuleCache()
+
+
+def rrule_fingerprint(event):
+    """
+    Returns a hashable fingerprint of the inputs of ``event``'s rrule: the
+    rule frequency and params, the event rule_params and the event start.
+    """
+    rule = event.rule
+    rule_params = None
+    if event.rule_params:
+        rule_params = json.dumps(event.rule_params, sort_keys=True)
+    return (rule.frequency, rule.params, rule_params, event.start)
+
+
+def rrule_arguments(event):
+    """
+    Returns the frequency and keyword arguments of ``event``'s rrule, dtstart
+    excluded.
+    """
+    params = event.rule.get_params() or {}
+    params.update(event.rule_params or {})
+    return event.rule.rrule_frequency(), params
+
+
+def compile_rrule(event):
+    """
+    Builds a fresh rrule for ``event``. Use ``get_rrule`` to go through the
+    cache.
+    """
+    frequency, params = rrule_arguments(event)
+    return rrule.rrule(frequency, dtstart=event.start, **params)
+
+
+def get_rrule(event):
+    """
+    Returns the (possibly shared) compiled rrule for ``event``. The returned
+    object must be treated as read only.
+    """
+    return rrule_cache.get(rrule_fingerprint(event), lambda: compile_rrule(event))
+
+
+def get_recurrence(event):
+    """
+    Returns the object used to expand ``event``'s rule: a cached
+    FixedIntervalRecurrence when the vectorized engine is enabled and the rule
+    is a plain arithmetic progression, a cached SeekableRRule when
+    checkpoints are enabled, the cached rrule otherwise. All of them provide
+    ``between``, ``after``, ``before`` and iteration.
+    """
+    if VECTORIZED_EXPANSION:
+        recurrence = rrule_cache.get(('fixed',) + rrule_fingerprint(event),
+                                     lambda: FixedIntervalRecurrence.from_event(event))
+        if recurrence is not None:
+            return recurrence
+    if SCHEDULER_RRULE_CHECKPOINT_INTERVAL > 0:
+        return rrule_cache.get(('seekable',) + rrule_fingerprint(event),
+                               lambda: SeekableRRule.from_event(event))
+    return get_rrule(event)
+
+
+def iter_between(recurrence, after, before, inc=False):
+    """
+    Lazily yields the starts ``recurrence.between(after, before, inc)``
+    returns, in order, so the caller can stop early.
+    """
+    if isinstance(recurrence, rrule.rrulebase):
+        return _iter_rrule_between(recurrence, after, before, inc)
+    return recurrence.iter_between(after, before, inc)
+
+
+def iter_after(recurrence, dt, inc=False):
+    """
+    Lazily yields the starts of ``recurrence`` after ``dt``, in order.
+    """
+    if isinstance(recurrence, rrule.rrulebase):
+        return _iter_rrule_after(recurrence, dt, inc)
+    return recurrence.iter_after(dt, inc)
+
+
+def count_between(recurrence, after, before, inc=False, limit=None):
+    """
+    Returns ``len(recurrence.between(after, before, inc))`` without building
+    the datetimes, or at most ``limit``. Fixed interval rules are counted
+    directly, rrules are scanned.
+    """
+    if isinstance(recurrence, FixedIntervalRecurrence):
+        count = recurrence.count_between(after, before, inc)
+        return count if limit is None else min(count, limit)
+    return sum(1 for __ in itertools.islice(iter_between(recurrence, after, before, inc), limit))
+
+
+def last_occurrence_start(recurrence):
+    """
+    Returns the last start of ``recurrence``, which must have a count or an
+    until, None if it has no occurrence at all. Fixed interval rules compute
+    it, seekable rules walk from their last checkpoint, rrules are scanned.
+    """
+    if isinstance(recurrence, rrule.rrulebase):
+        last = None
+        for last in recurrence:
+            pass
+        return last
+    return recurrence.last()
+
+
+def _iter_rrule_between(rule, after, before, inc):
+    for dt in _iter_rrule_after(rule, after, inc):
+        if dt > before or (not inc and dt == before):
+            break
+        yield dt
+
+
+def _iter_rrule_after(rule, after, inc):
+    for dt in rule:
+        if dt > after or (inc and dt == after):
+            yield dt
+
+
+def _to_microseconds(naive):
+    delta = naive - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _has_fixed_offset(tzinfo):
+    # pytz attaches a fixed offset tzinfo to each localized datetime, which
+    # is also what rrule copies onto every occurrence
+    return tzinfo is None or isinstance(tzinfo, (pytz.tzinfo.BaseTzInfo, type(pytz.utc)))
+
+
+class FixedIntervalRecurrence(object):
+    """
+    Expands DAILY, WEEKLY, HOURLY, MINUTELY and SECONDLY rules that use no
+    params other than interval and count. Such rules are arithmetic
+    progressions, so the occurrence starts are computed as int64 epoch arrays
+    with numpy instead of being iterated one at a time.
+
+    The output is identical to ``dateutil.rrule``: like rrule this works on
+    the wall clock time of dtstart without microseconds, and attaches the
+    tzinfo of dtstart to every occurrence. Use ``from_event`` to get an
+    instance, it returns None for rules that need dateutil.
+    """
+    chunk_size = 1024
+
+    def __init__(self, dtstart, step, count=None):
+        self.tzinfo = dtstart.tzinfo
+        self.offset = dtstart.utcoffset()
+        self.base = _to_microseconds(dtstart.replace(microsecond=0, tzinfo=None)) // 1000000
+        self.step = step
+        # rrule treats a count of 0 as no count at all
+        self.count = count or None
+
+    @classmethod
+    def from_event(cls, event):
+        frequency = event.rule.rrule_frequency()
+        if frequency not in FIXED_INTERVAL_SECONDS or not _has_fixed_offset(event.start.tzinfo):
+            return None
+        params = event.rule.get_params() or {}
+        params.update(event.rule_params or {})
+        if not set(params) <= FIXED_INTERVAL_PARAMS:
+            return None
+        interval = params.get('interval', 1)
+        count = params.get('count')
+        if not isinstance(interval, six.integer_types) or interval < 1:
+            return None
+        if count is not None and not isinstance(count, six.integer_types):
+            return None
+        return cls(event.start, FIXED_INTERVAL_SECONDS[frequency] * interval, count)
+
+    def _position(self, dt):
+        """
+        Returns ``dt`` in microseconds on the wall clock of dtstart.
+        """
+        if (dt.tzinfo is None) != (self.tzinfo is None):
+            raise TypeError("can't compare offset-naive and offset-aware datetimes")
+        if self.tzinfo is not None:
+            dt = dt.replace(tzinfo=None) - dt.utcoffset() + self.offset
+        return _to_microseconds(dt) - self.base * 1000000
+
+    def _first_index(self, dt, inc):
+        step = self.step * 1000000
+        position = self._position(dt)
+        if inc:
+            return max(-(-position // step), 0)
+        return max(position // step + 1, 0)
+
+    def _index_range(self, after, before, inc):
+        first = self._first_index(after, inc)
+        position = self._position(before)
+        step = self.step * 1000000
+        if inc:
+            last = position // step + 1
+        else:
+            last = -(-position // step)
+        if self.count is not None:
+            last = min(last, self.count)
+        return first, max(first, last)
+
+    def starts(self, first, last):
+        """
+        Returns the starts of occurrences ``first`` to ``last`` (exclusive) as
+        an int64 array of wall clock epoch seconds.
+        """
+        return numpy.arange(first, last, dtype=numpy.int64) * self.step + self.base
+
+    def starts_between(self, after, before, inc=False):
+        return self.starts(*self._index_range(after, before, inc))
+
+    def to_datetimes(self, starts):
+        naive = starts.astype('datetime64[s]').astype(object)
+        if self.tzinfo is None:
+            return list(naive)
+        tzinfo = self.tzinfo
+        return [dt.replace(tzinfo=tzinfo) for dt in naive]
+
+    def between(self, after, before, inc=False):
+        return self.to_datetimes(self.starts_between(after, before, inc))
+
+    def count_between(self, after, before, inc=False):
+        first, last = self._index_range(after, before, inc)
+        return last - first
+
+    def iter_between(self, after, before, inc=False):
+        first, last = self._index_range(after, before, inc)
+        while first < last:
+            chunk_end = min(first + self.chunk_size, last)
+            for dt in self.to_datetimes(self.starts(first, chunk_end)):
+                yield dt
+            first = chunk_end
+
+    def iter_after(self, dt, inc=False):
+        return self._iter_from(self._first_index(dt, inc))
+
+    def after(self, dt, inc=False):
+        first = self._first_index(dt, inc)
+        if self.count is not None and first >= self.count:
+            return None
+        return self.to_datetimes(self.starts(first, first + 1))[0]
+
+    def before(self, dt, inc=False):
+        step = self.step * 1000000
+        position = self._position(dt)
+        if inc:
+            last = position // step
+        else:
+            last = -(-position // step) - 1
+        if self.count is not None:
+            last = min(last, self.count - 1)
+        if last < 0:
+            return None
+        return self.to_datetimes(self.starts(last, last + 1))[0]
+
+    def last(self):
+        return self.to_datetimes(self.starts(self.count - 1, self.count))[0]
+
+    def __iter__(self):
+        return self._iter_from(0)
+
+    def _iter_from(self, first):
+        while self.count is None or first < self.count:
+            last = first + self.chunk_size
+            if self.count is not None:
+                last = min(last, self.count)
+            for dt in self.to_datetimes(self.starts(first, last)):
+                yield dt
+            first = last
+
+
+class SeekableRRule(object):
+    """
+    An rrule that can start expanding close to a window instead of at its
+    first occurrence.
+
+    While iterating it records a checkpoint (the start and position of the
+    occurrence) every ``interval`` occurrences. Seeking resumes from the
+    closest checkpoint at or before the target, with an rrule that has the
+    checkpoint as dtstart and a count reduced by its position. That rrule
+    yields the same occurrences as the original from there on, because
+    every parameter rrule derives from dtstart (the weekday, day of month,
+    month and time) has the same value at each of its occurrences. Windows
+    far from dtstart therefore cost about ``interval`` iterations once the
+    series has been walked to them once.
+    """
+
+    def __init__(self, frequency, dtstart, params, interval=SCHEDULER_RRULE_CHECKPOINT_INTERVAL):
+        self.frequency = frequency
+        self.params = params
+        self.count = params.get('count') or None
+        self.interval = interval
+        self.rule = rrule.rrule(frequency, dtstart=dtstart, **params)
+        # checkpoint starts and their positions, index 0 is the rule itself
+        self._starts = [None]
+        self._positions = [0]
+        self._rules = {0: self.rule}
+        self._exhausted = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_event(cls, event):
+        frequency, params = rrule_arguments(event)
+        return cls(frequency, event.start, params)
+
+    def _rule(self, checkpoint):
+        rule = self._rules.get(checkpoint)
+        if rule is None:
+            params = dict(self.params)
+            if self.count is not None:
+                params['count'] = self.count - self._positions[checkpoint]
+            rule = rrule.rrule(self.frequency, dtstart=self._starts[checkpoint], **params)
+            self._rules[checkpoint] = rule
+        return rule
+
+    def _seek(self, dt, inc=True):
+        """
+        Returns the rule to iterate to get the occurrences from ``dt`` on,
+        from after ``dt`` without inc, recording checkpoints up to ``dt`` as
+        needed. Without ``dt`` that is the rule from the last checkpoint.
+        """
+        with self._lock:
+            if not self._exhausted and (len(self._starts) == 1 or dt is None or self._starts[-1] < dt):
+                self._extend(dt)
+            if dt is None:
+                return self._rule(len(self._starts) - 1)
+            bisect = bisect_right if inc else bisect_left
+            checkpoint = max(bisect(self._starts, dt, 1) - 1, 0)
+            return self._rule(checkpoint)
+
+    def _extend(self, dt):
+        checkpoint = len(self._starts) - 1
+        position = self._positions[checkpoint]
+        for offset, start in enumerate(self._rule(checkpoint)):
+            if offset and (position + offset) % self.interval == 0:
+                self._starts.append(start)
+                self._positions.append(position + offset)
+                if dt is not None and start > dt:
+                    return
+        self._exhausted = True
+
+    def iter_after(self, dt, inc=False):
+        return _iter_rrule_after(self._seek(dt), dt, inc)
+
+    def iter_between(self, after, before, inc=False):
+        return _iter_rrule_between(self._seek(after), after, before, inc)
+
+    def between(self, after, before, inc=False):
+        return list(self.iter_between(after, before, inc))
+
+    def after(self, dt, inc=False):
+        for start in self.iter_after(dt, inc):
+            return start
+
+    def before(self, dt, inc=False):
+        last = None
+        for start in self._seek(dt, inc):
+            if start > dt or (not inc and start == dt):
+                break
+            last = start
+        return last
+
+    def last(self):
+        # only rules with a count or an until come to an end
+        last = None
+        for last in self._seek(None):
+            pass
+        return last
+
+    def __iter__(self):
+        return iter(self.rule)
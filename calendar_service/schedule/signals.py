@@ -1,6 +1,8 @@
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 
-from schedule.models import Event, Calendar
+from schedule import cache, horizon
+from schedule.models import Event, Calendar, Occurrence, Rule
+from schedule.models.events import DELETING_EVENTS
 
 
 def optional_calendar(sender, **kwargs):
@@ -19,3 +21,115 @@ def optional_calendar(sender, **kwargs):
     return True
 
 pre_save.connect(optional_calendar)
+
+
+def refresh_event_horizon(sender, instance, **kwargs):
+    if horizon.SCHEDULER_OCCURRENCE_HORIZON:
+        horizon.refresh_horizon([instance])
+
+
+def mark_deleting_event(sender, instance, **kwargs):
+    # for events deleted through a queryset, the post_delete signals of their
+    # occurrences come after this
+    DELETING_EVENTS.add(instance.pk)
+
+
+def unmark_deleting_event(sender, instance, **kwargs):
+    DELETING_EVENTS.discard(instance.pk)
+
+
+def clear_event_horizon(sender, instance, **kwargs):
+    # the cascade removes the rows but not their R*Tree entries
+    if horizon.SCHEDULER_OCCURRENCE_HORIZON:
+        horizon.clear_horizon(instance.pk)
+
+
+def clear_rule_horizon(sender, instance, **kwargs):
+    # a rule can be shared by many events, their horizons are rebuilt by the
+    # refresh_occurrence_horizon command rather than on this save
+    if horizon.SCHEDULER_OCCURRENCE_HORIZON:
+        horizon.clear_horizons(list(instance.event_set.values_list('pk', flat=True)))
+
+
+def refresh_occurrence_horizon(sender, instance, **kwargs):
+    if horizon.SCHEDULER_OCCURRENCE_HORIZON:
+        horizon.refresh_occurrence(instance)
+
+
+def clear_occurrence_horizon(sender, instance, **kwargs):
+    # before the cascade removes the row of the occurrence, when the event
+    # itself is being deleted its horizon goes with it anyway
+    if horizon.SCHEDULER_OCCURRENCE_HORIZON and instance.event_id not in DELETING_EVENTS:
+        horizon.refresh_occurrence(instance, deleted=True)
+
+
+def refresh_rule_bounds(sender, instance, **kwargs):
+    Event.objects.refresh_effective_bounds(instance.event_set.select_related('rule'))
+
+
+def refresh_occurrence_bounds(sender, instance, **kwargs):
+    # a moved occurrence can stretch the bounds of its event
+    if instance.event_id in DELETING_EVENTS:
+        return
+    Event.objects.refresh_effective_bounds(
+        Event.objects.filter(pk=instance.event_id).select_related('rule'))
+
+
+def invalidate_event_chunks(sender, instance, **kwargs):
+    if cache.SCHEDULER_OCCURRENCE_CACHE and instance.calendar_id is not None:
+        cache.invalidate(instance.calendar_id, instance.effective_first_start, instance.effective_last_end)
+
+
+def invalidate_previous_event_chunks(sender, instance, **kwargs):
+    # the months the event covered before the change, possibly in another calendar
+    if cache.SCHEDULER_OCCURRENCE_CACHE and instance.pk is not None:
+        for calendar_id, first_start, last_end in Event.objects.filter(pk=instance.pk).values_list(
+                'calendar_id', 'effective_first_start', 'effective_last_end'):
+            if calendar_id is not None:
+                cache.invalidate(calendar_id, first_start, last_end)
+
+
+def invalidate_rule_chunks(sender, instance, **kwargs):
+    # runs before the bounds are refreshed, a new rule may reach any month
+    # after the first occurrence of its events
+    if cache.SCHEDULER_OCCURRENCE_CACHE:
+        for calendar_id, start, first_start in instance.event_set.values_list(
+                'calendar_id', 'start', 'effective_first_start'):
+            if calendar_id is not None:
+                cache.invalidate(calendar_id, first_start and min(start, first_start))
+
+
+def invalidate_occurrence_chunks(sender, instance, **kwargs):
+    # the chunks of a deleted event are invalidated by its own handler
+    if cache.SCHEDULER_OCCURRENCE_CACHE and instance.event_id not in DELETING_EVENTS:
+        calendar_id = Event.objects.filter(pk=instance.event_id).values_list('calendar_id', flat=True).first()
+        if calendar_id is not None:
+            cache.invalidate(calendar_id, instance.original_start, instance.original_end)
+            cache.invalidate(calendar_id, instance.start, instance.end)
+
+
+def invalidate_previous_occurrence_chunks(sender, instance, **kwargs):
+    # where a moved occurrence was before this change
+    if cache.SCHEDULER_OCCURRENCE_CACHE and instance.pk is not None:
+        for calendar_id, start, end in Occurrence.objects.filter(pk=instance.pk).values_list(
+                'event__calendar_id', 'start', 'end'):
+            if calendar_id is not None:
+                cache.invalidate(calendar_id, start, end)
+
+post_save.connect(refresh_event_horizon, sender=Event)
+pre_delete.connect(mark_deleting_event, sender=Event)
+post_delete.connect(unmark_deleting_event, sender=Event)
+pre_delete.connect(clear_event_horizon, sender=Event)
+post_save.connect(clear_rule_horizon, sender=Rule)
+post_save.connect(refresh_occurrence_horizon, sender=Occurrence)
+pre_delete.connect(clear_occurrence_horizon, sender=Occurrence)
+post_save.connect(invalidate_rule_chunks, sender=Rule)
+post_save.connect(refresh_rule_bounds, sender=Rule)
+post_save.connect(refresh_occurrence_bounds, sender=Occurrence)
+post_delete.connect(refresh_occurrence_bounds, sender=Occurrence)
+pre_save.connect(invalidate_previous_event_chunks, sender=Event)
+post_save.connect(invalidate_event_chunks, sender=Event)
+post_delete.connect(invalidate_event_chunks, sender=Event)
+pre_save.connect(invalidate_previous_occurrence_chunks, sender=Occurrence)
+post_save.connect(invalidate_occurrence_chunks, sender=Occurrence)
+post_delete.connect(invalidate_occurrence_chunks, sender=Occurrence)
@@ -0,0 +1,49 @@
+import datetime
+
+from django.test import TestCase
+import pytz
+
+from schedule.boundaries import boundary_cache, get_boundary_table, local_midnight
+from schedule.models import Event
+from schedule.periods import Day, Month, Week, Year
+
+
+class TestBoundaryTable(TestCase):
+
+    def localized(self, tzinfo, date):
+        return tzinfo.localize(datetime.datetime.combine(date, datetime.time.min)).astimezone(pytz.utc)
+
+    def test_midnights(self):
+        # New York changes at 2am, Sao Paulo skipped midnight in 2015
+        for name in ('America/New_York', 'America/Sao_Paulo', 'Australia/Lord_Howe', 'UTC'):
+            tzinfo = pytz.timezone(name)
+            date = datetime.date(2015, 1, 1)
+            while date.year == 2015:
+                self.assertEqual(local_midnight(tzinfo, date), self.localized(tzinfo, date))
+                date += datetime.timedelta(days=1)
+            self.assertEqual(get_boundary_table(tzinfo, 2015).year_range(),
+                             (self.localized(tzinfo, datetime.date(2015, 1, 1)),
+                              self.localized(tzinfo, datetime.date(2016, 1, 1))))
+
+    def test_cached_per_zone(self):
+        tzinfo = pytz.timezone('Europe/Amsterdam')
+        table = get_boundary_table(tzinfo, 2015)
+        variant = datetime.datetime(2015, 7, 1, tzinfo=pytz.utc).astimezone(tzinfo).tzinfo
+        self.assertIs(get_boundary_table(variant, 2015), table)
+        self.assertIsNot(get_boundary_table(tzinfo, 2016), table)
+        self.assertIn(('Europe/Amsterdam', 2015), boundary_cache._entries)
+
+    def test_periods(self):
+        tzinfo = pytz.timezone('America/Sao_Paulo')
+        date = datetime.datetime(2015, 10, 18, 12)
+        day = Day(Event.objects.none(), date, tzinfo=tzinfo)
+        self.assertEqual(day.utc_start, self.localized(tzinfo, date.date()))
+        self.assertEqual(day.start, day.utc_start.astimezone(tzinfo))
+        week = Week(Event.objects.none(), date, tzinfo=tzinfo)
+        self.assertEqual(week.utc_end - week.utc_start, datetime.timedelta(days=7, hours=-1))
+        month = Month(Event.objects.none(), datetime.datetime(2015, 12, 5), tzinfo=tzinfo)
+        self.assertEqual((month.utc_start, month.utc_end),
+                         (self.localized(tzinfo, datetime.date(2015, 12, 1)),
+                          self.localized(tzinfo, datetime.date(2016, 1, 1))))
+        year = Year(Event.objects.none(), date, tzinfo=tzinfo)
+        self.assertEqual(year.end, next(year).start)
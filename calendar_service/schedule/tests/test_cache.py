@@ -0,0 +1,139 @@
+import datetime
+
+from django.test import TestCase
+import pytz
+
+from schedule import cache
+from schedule.cache import cached_occurrences, get_cache, months_between
+from schedule.models import Calendar, Event, Rule
+from schedule.periods import Month
+
+
+class TestOccurrenceCache(TestCase):
+
+    def setUp(self):
+        self.enabled = cache.SCHEDULER_OCCURRENCE_CACHE
+        cache.SCHEDULER_OCCURRENCE_CACHE = True
+        get_cache().clear()
+        self.calendar = Calendar.objects.create(name="MyCal", slug="mycal")
+        self.start = datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc)
+        self.weekly = Event.objects.create(
+            title='Weekly', start=self.start, end=self.start + datetime.timedelta(hours=2),
+            rule=Rule.objects.create(frequency="WEEKLY"), calendar=self.calendar)
+        self.single = Event.objects.create(
+            title='Single', start=self.start + datetime.timedelta(days=40),
+            end=self.start + datetime.timedelta(days=40, hours=1), calendar=self.calendar)
+        self.events = [self.weekly, self.single]
+        self.window = (datetime.datetime(2008, 1, 20, tzinfo=pytz.utc),
+                       datetime.datetime(2008, 4, 10, tzinfo=pytz.utc))
+
+    def tearDown(self):
+        cache.SCHEDULER_OCCURRENCE_CACHE = self.enabled
+        get_cache().clear()
+
+    def cached_months(self):
+        keys = cache._chunk_keys(self.calendar.pk, months_between(
+            datetime.datetime(2007, 1, 1, tzinfo=pytz.utc), datetime.datetime(2009, 1, 1, tzinfo=pytz.utc)))
+        return set(keys[key] for key in get_cache().get_many(list(keys)))
+
+    def assertSameOccurrences(self, first, second):
+        self.assertEqual(
+            [(o.event_id, o.start, o.end, o.cancelled, o.pk) for o in first],
+            [(o.event_id, o.start, o.end, o.cancelled, o.pk) for o in second])
+
+    def test_chunks(self):
+        start, end = self.window
+        occurrences = cached_occurrences(self.events, start, end)
+        self.assertSameOccurrences(occurrences, Event.objects.occurrences_between(self.events, start, end))
+        self.assertEqual(self.cached_months(), set(months_between(start, end)))
+        with self.assertNumQueries(0):
+            cached_occurrences([self.weekly], start + datetime.timedelta(days=10), end)
+        cache.SCHEDULER_OCCURRENCE_CACHE = False
+        self.assertIsNone(cached_occurrences(self.events, start, end))
+
+    def test_persisted_occurrences(self):
+        start, end = self.window
+        cached_occurrences(self.events, start, end)
+        occurrence = self.weekly.get_occurrences(start, start + datetime.timedelta(days=7))[0]
+        occurrence.move(occurrence.start + datetime.timedelta(days=30), occurrence.end + datetime.timedelta(days=30))
+        # the original slot was in January and it moved to February
+        self.assertEqual(self.cached_months(), set([(2008, 3), (2008, 4)]))
+        occurrences = cached_occurrences(self.events, start, end)
+        self.assertSameOccurrences(occurrences, Event.objects.occurrences_between(self.events, start, end))
+        self.assertIn(occurrence.pk, [o.pk for o in occurrences])
+
+        occurrence.cancel()
+        self.assertEqual(self.cached_months(), set([(2008, 3), (2008, 4)]))
+        occurrence.delete()
+        self.assertSameOccurrences(cached_occurrences(self.events, start, end),
+                                   Event.objects.occurrences_between(self.events, start, end))
+
+    def test_moved_cancelled_occurrence(self):
+        start, end = self.window
+        # the slot of January 26th moves to February 15th and is cancelled
+        slot = datetime.datetime(2008, 1, 26, 8, 0, tzinfo=pytz.utc)
+        occurrence = self.weekly.get_occurrences(slot, slot + datetime.timedelta(hours=2))[0]
+        occurrence.move(occurrence.start + datetime.timedelta(days=20), occurrence.end + datetime.timedelta(days=20))
+        occurrence.cancel()
+        windows = [self.window, (datetime.datetime(2008, 1, 15, tzinfo=pytz.utc),
+                                 datetime.datetime(2008, 2, 20, tzinfo=pytz.utc)),
+                   (datetime.datetime(2008, 2, 1, tzinfo=pytz.utc), datetime.datetime(2008, 3, 1, tzinfo=pytz.utc))]
+        for start, end in windows:
+            self.assertSameOccurrences(cached_occurrences(self.events, start, end),
+                                       Event.objects.occurrences_between(self.events, start, end))
+        self.assertIn(occurrence.pk, [o.pk for o in cached_occurrences(self.events, *windows[1])])
+
+    def test_event_changes(self):
+        start, end = self.window
+        cached_occurrences(self.events, start, end)
+        self.single.start += datetime.timedelta(days=30)
+        self.single.end += datetime.timedelta(days=30)
+        self.single.save()
+        self.assertEqual(self.cached_months(), set([(2008, 1), (2008, 4)]))
+        self.weekly.end_recurring_period = datetime.datetime(2008, 3, 1, tzinfo=pytz.utc)
+        self.weekly.save()
+        self.assertEqual(self.cached_months(), set())
+        occurrences = cached_occurrences(self.events, start, end)
+        self.assertSameOccurrences(occurrences, Event.objects.occurrences_between(self.events, start, end))
+
+        cached_occurrences(self.events, start, end)
+        self.weekly.rule.params = 'interval:2'
+        self.weekly.rule.save()
+        self.weekly = Event.objects.get(pk=self.weekly.pk)
+        self.assertEqual(self.cached_months(), set())
+        self.assertSameOccurrences(cached_occurrences([self.weekly], start, end),
+                                   self.weekly.get_occurrences(start, end))
+
+    def test_stale_build(self):
+        start, end = self.window
+        month = (2008, 2)
+        # a chunk built before an edit is saved but only stored after
+        keys = cache._chunk_keys(self.calendar.pk, [month])
+        self.single.delete()
+        get_cache().set_many(dict((key, []) for key in keys), None)
+        self.assertNotIn(month, self.cached_months())
+        self.assertSameOccurrences(cached_occurrences([self.weekly], start, end),
+                                   Event.objects.occurrences_between([self.weekly], start, end))
+        self.assertIn(month, self.cached_months())
+
+    def test_period(self):
+        cached_occurrences(self.events, *self.window)
+        month = Month(Event.objects.select_related('rule'), datetime.datetime(2008, 2, 1, tzinfo=pytz.utc))
+        with self.assertNumQueries(1):
+            occurrences = month.get_occurrences()
+        self.assertSameOccurrences(occurrences, Event.objects.occurrences_between(
+            self.events, month.start, month.end))
+
+    def test_timezones_share_chunks(self):
+        cached_occurrences(self.events, *self.window)
+        months = self.cached_months()
+        for name in ('America/Los_Angeles', 'Asia/Tokyo', 'Australia/Adelaide'):
+            tzinfo = pytz.timezone(name)
+            month = Month(Event.objects.select_related('rule'), datetime.datetime(2008, 2, 1), tzinfo=tzinfo)
+            with self.assertNumQueries(1):
+                days = [day.get_occurrences() for day in month.get_days()]
+            self.assertEqual(self.cached_months(), months)
+            cache.SCHEDULER_OCCURRENCE_CACHE = False
+            month = Month(Event.objects.select_related('rule'), datetime.datetime(2008, 2, 1), tzinfo=tzinfo)
+            self.assertEqual(days, [day.get_occurrences() for day in month.get_days()])
+            cache.SCHEDULER_OCCURRENCE_CACHE = True
@@ -1,6 +1,8 @@
 import datetime
 from django.core.urlresolvers import reverse
+from django.core.management import call_command
 from django.test.utils import override_settings
+from django.utils.six import StringIO
 import pytz
 
 from django.test import TestCase
@@ -146,6 +148,27 @@ class TestEvent(TestCase):
         self.assertEqual(["%s to %s" %(o.start, o.end) for o in occurrences],
                 ['2008-01-12 08:00:00+00:00 to 2008-01-12 09:00:00+00:00', '2008-01-19 08:00:00+00:00 to 2008-01-19 09:00:00+00:00'])
 
+    def test_recurring_event_get_occurrences_short_window(self):
+        cal = Calendar(name="MyCal")
+        cal.save()
+        rule = Rule(frequency="HOURLY")
+        rule.save()
+        recurring_event = self.__create_recurring_event(
+                                    'Long hourly event',
+                                    datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+                                    datetime.datetime(2008, 1, 5, 12, 0, tzinfo=pytz.utc),
+                                    datetime.datetime(2008, 5, 5, 0, 0, tzinfo=pytz.utc),
+                                    rule,
+                                    cal
+                )
+        recurring_event.save()
+        # a window shorter than half the duration still sees every
+        # occurrence running through it, once and in order
+        occurrences = recurring_event.get_occurrences(
+                                    start=datetime.datetime(2008, 1, 6, 12, 0, tzinfo=pytz.utc),
+                                    end=datetime.datetime(2008, 1, 6, 12, 30, tzinfo=pytz.utc))
+        self.assertEqual([o.start.hour for o in occurrences], [8, 9, 10, 11, 12])
+
     def test_recurring_event_get_occurrences_after(self):
 
         cal = Calendar(name="MyCal")
@@ -319,6 +342,72 @@ class TestEvent(TestCase):
         pass
 
 
+class TestEffectiveBounds(TestCase):
+
+    def setUp(self):
+        self.cal = Calendar.objects.create(name="MyCal")
+        self.start = datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc)
+        self.hour = datetime.timedelta(hours=1)
+
+    def create_event(self, rule=None, **kwargs):
+        return Event.objects.create(title='Event', start=self.start, end=self.start + self.hour,
+                                    rule=rule, calendar=self.cal, **kwargs)
+
+    def assertBounds(self, event, first_start, last_end):
+        event = Event.objects.get(pk=event.pk)
+        self.assertEqual((event.effective_first_start, event.effective_last_end), (first_start, last_end))
+
+    def test_bounds(self):
+        self.assertBounds(self.create_event(), self.start, self.start + self.hour)
+        self.assertBounds(self.create_event(Rule.objects.create(frequency="WEEKLY")), self.start, None)
+        self.assertBounds(self.create_event(Rule.objects.create(frequency="DAILY", params="count:3")),
+                          self.start, self.start + datetime.timedelta(days=2) + self.hour)
+        self.assertBounds(self.create_event(Rule.objects.create(frequency="WEEKLY"),
+                                            end_recurring_period=self.start + datetime.timedelta(days=20)),
+                          self.start, self.start + datetime.timedelta(days=14) + self.hour)
+        self.assertBounds(self.create_event(Rule.objects.create(frequency="MONTHLY", params="count:300")),
+                          self.start, datetime.datetime(2032, 12, 5, 9, 0, tzinfo=pytz.utc))
+        # a year of minutes is seeked to, not walked
+        self.assertBounds(self.create_event(Rule.objects.create(frequency="MINUTELY"),
+                                            end_recurring_period=self.start + datetime.timedelta(days=365)),
+                          self.start, self.start + datetime.timedelta(days=365) + self.hour)
+
+    def test_changes(self):
+        rule = Rule.objects.create(frequency="DAILY", params="count:3")
+        event = self.create_event(rule)
+        last = event.get_occurrences(self.start, self.start + datetime.timedelta(days=3))[-1]
+        last.move(last.start + datetime.timedelta(days=10), last.end + datetime.timedelta(days=10))
+        self.assertBounds(event, self.start, self.start + datetime.timedelta(days=12) + self.hour)
+        last.delete()
+        self.assertBounds(event, self.start, self.start + datetime.timedelta(days=2) + self.hour)
+        rule.params = "count:5"
+        rule.save()
+        self.assertBounds(event, self.start, self.start + datetime.timedelta(days=4) + self.hour)
+
+    def test_intersecting(self):
+        daily = self.create_event(Rule.objects.create(frequency="DAILY", params="count:3"))
+        weekly = self.create_event(Rule.objects.create(frequency="WEEKLY"))
+        single = self.create_event()
+        start = self.start + datetime.timedelta(days=5)
+        self.assertEqual(list(Event.objects.intersecting(start, start + self.hour)), [weekly])
+        self.assertEqual(set(Event.objects.intersecting(self.start - self.hour, self.start)),
+                         set([daily, weekly, single]))
+        # half open windows leave out what only touches their ends
+        self.assertEqual(list(Event.objects.intersecting(self.start - self.hour, self.start, half_open=True)), [])
+        self.assertEqual(set(Event.objects.intersecting(self.start, self.start + self.hour, half_open=True)),
+                         set([daily, weekly, single]))
+        self.assertEqual(list(Event.objects.intersecting(self.start + self.hour, start, half_open=True)),
+                         [daily, weekly])
+        Event.objects.filter(pk=daily.pk).update(effective_first_start=None, effective_last_end=None)
+        self.assertEqual(set(self.cal.event_set.intersecting(start, start + self.hour)), set([daily, weekly]))
+
+    def test_refresh_command(self):
+        daily = self.create_event(Rule.objects.create(frequency="DAILY", params="count:3"))
+        Event.objects.update(effective_first_start=None, effective_last_end=None)
+        call_command('refresh_event_bounds', '--missing', stdout=StringIO())
+        self.assertBounds(daily, self.start, self.start + datetime.timedelta(days=2) + self.hour)
+
+
 class TestEventRelationManager(TestCase):
 
     def test_get_events_for_object(self):
@@ -0,0 +1,158 @@
+import datetime
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from schedule import cache, horizon
+from schedule.horizon import materialized_occurrences, refresh_horizon
+from schedule.models import Event, Rule, Calendar, MaterializedOccurrence, OccurrenceHorizon
+from schedule.periods import Period
+
+
+class TestOccurrenceHorizon(TestCase):
+
+    def setUp(self):
+        self.enabled = horizon.SCHEDULER_OCCURRENCE_HORIZON
+        horizon.SCHEDULER_OCCURRENCE_HORIZON = True
+        self.calendar = Calendar.objects.create(name="MyCal", slug="mycal")
+        today = timezone.now().replace(hour=8, minute=0, second=0, microsecond=0)
+        self.daily = Event.objects.create(
+            title='Daily',
+            start=today - datetime.timedelta(days=10),
+            end=today - datetime.timedelta(days=10, hours=-1),
+            rule=Rule.objects.create(frequency="DAILY"),
+            calendar=self.calendar,
+        )
+        self.weekly = Event.objects.create(
+            title='Weekly',
+            start=today,
+            end=today + datetime.timedelta(hours=2),
+            end_recurring_period=today + datetime.timedelta(days=60),
+            rule=Rule.objects.create(frequency="WEEKLY"),
+            calendar=self.calendar,
+        )
+        self.single = Event.objects.create(
+            title='Single',
+            start=today + datetime.timedelta(days=3),
+            end=today + datetime.timedelta(days=3, hours=1),
+            calendar=self.calendar,
+        )
+        self.events = [self.daily, self.weekly, self.single]
+        self.start = today - datetime.timedelta(days=2, hours=3)
+        self.end = today + datetime.timedelta(days=30)
+
+    def tearDown(self):
+        horizon.SCHEDULER_OCCURRENCE_HORIZON = self.enabled
+
+    def live_occurrences(self, start, end):
+        occurrences = []
+        for event in self.events:
+            occurrences += event.get_occurrences(start, end)
+        return sorted(occurrences)
+
+    def assertSameOccurrences(self, first, second):
+        self.assertEqual(
+            [(o.event_id, o.start, o.end, o.cancelled, o.pk) for o in sorted(first)],
+            [(o.event_id, o.start, o.end, o.cancelled, o.pk) for o in sorted(second)])
+
+    def test_materialized_on_save(self):
+        self.assertEqual(OccurrenceHorizon.objects.count(), 3)
+        self.assertTrue(MaterializedOccurrence.objects.filter(event=self.daily).exists())
+        occurrences = materialized_occurrences(self.events, self.start, self.end)
+        self.assertSameOccurrences(occurrences, self.live_occurrences(self.start, self.end))
+
+    def test_boundaries(self):
+        # windows ending exactly on a start or starting exactly on an end
+        start = self.weekly.start + datetime.timedelta(hours=2)
+        end = self.weekly.start + datetime.timedelta(days=7)
+        occurrences = materialized_occurrences(self.events, start, end)
+        self.assertSameOccurrences(occurrences, self.live_occurrences(start, end))
+
+    def test_persisted_occurrences(self):
+        occurrences = self.weekly.get_occurrences(self.start, self.end)
+        moved = occurrences[1]
+        moved.move(moved.start + datetime.timedelta(days=1), moved.end + datetime.timedelta(days=1))
+        occurrences[2].cancel()
+        materialized = materialized_occurrences(self.events, self.start, self.end)
+        self.assertSameOccurrences(materialized, self.live_occurrences(self.start, self.end))
+        self.assertIn(moved.pk, [o.pk for o in materialized])
+
+        # only the rows of the slot are replaced, the horizon stays
+        horizon_ids = set(MaterializedOccurrence.objects.filter(
+            event=self.weekly, occurrence__isnull=True).values_list('pk', flat=True))
+        occurrences[2].delete()
+        materialized = materialized_occurrences([self.weekly], self.start, self.end)
+        self.assertSameOccurrences(materialized, self.weekly.get_occurrences(self.start, self.end))
+        self.assertTrue(horizon_ids < set(MaterializedOccurrence.objects.filter(
+            event=self.weekly, occurrence__isnull=True).values_list('pk', flat=True)))
+        self.test_rtree()
+
+    def test_event_changes(self):
+        self.daily.end_recurring_period = self.daily.start + datetime.timedelta(days=12)
+        self.daily.save()
+        occurrences = materialized_occurrences([self.daily], self.start, self.end)
+        self.assertEqual(len(occurrences), 5)
+        self.assertSameOccurrences(occurrences, self.daily.get_occurrences(self.start, self.end))
+
+        self.daily.rule.frequency = "WEEKLY"
+        self.daily.rule.save()
+        self.daily = Event.objects.get(pk=self.daily.pk)
+        # the horizons of the events of a rule are left to the next refresh
+        self.assertIsNone(materialized_occurrences([self.daily], self.start, self.end))
+        self.assertFalse(MaterializedOccurrence.objects.filter(event=self.daily).exists())
+        refresh_horizon([self.daily])
+        occurrences = materialized_occurrences([self.daily], self.start, self.end)
+        self.assertSameOccurrences(occurrences, self.daily.get_occurrences(self.start, self.end))
+
+    def test_outside_of_horizon(self):
+        end = self.end + datetime.timedelta(days=horizon.SCHEDULER_OCCURRENCE_HORIZON_DAYS)
+        self.assertIsNone(materialized_occurrences(self.events, self.start, end))
+        horizon.SCHEDULER_OCCURRENCE_HORIZON = False
+        self.assertIsNone(materialized_occurrences(self.events, self.start, self.end))
+
+    def test_period(self):
+        period = Period(Event.objects.all(), self.start, self.end)
+        self.assertSameOccurrences(period.get_occurrences(), self.live_occurrences(self.start, self.end))
+
+    def test_delete_event(self):
+        self.daily.get_occurrences(self.start, self.end)[0].cancel()
+        self.daily.delete()
+        self.assertFalse(MaterializedOccurrence.objects.filter(event_id=self.daily.pk).exists())
+        self.test_rtree()
+        refresh_horizon(Event.objects.all())
+        self.assertEqual(OccurrenceHorizon.objects.count(), 2)
+
+    def test_delete_event_queries(self):
+        # the occurrences deleted along with an event cost no queries of their own
+        cache_enabled = cache.SCHEDULER_OCCURRENCE_CACHE
+        cache.SCHEDULER_OCCURRENCE_CACHE = True
+        try:
+            queries = []
+            for event, count in ((self.daily, 1), (self.weekly, 4)):
+                for occurrence in event.get_occurrences(self.start, self.end)[:count]:
+                    occurrence.cancel()
+                with CaptureQueriesContext(connection) as context:
+                    Event.objects.get(pk=event.pk).delete()
+                queries.append(len(context.captured_queries))
+                self.assertFalse(MaterializedOccurrence.objects.filter(event_id=event.pk).exists())
+            self.assertEqual(queries[0], queries[1])
+            self.test_rtree()
+        finally:
+            cache.SCHEDULER_OCCURRENCE_CACHE = cache_enabled
+
+    def test_refresh_command(self):
+        OccurrenceHorizon.objects.all().delete()
+        call_command('refresh_occurrence_horizon', 'mycal', stdout=StringIO())
+        self.assertEqual(OccurrenceHorizon.objects.count(), 3)
+
+    def test_rtree(self):
+        if connection.vendor != 'sqlite':
+            return
+        self.assertTrue(horizon.has_rtree())
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM %s" % horizon.RTREE_TABLE)
+        self.assertEqual(cursor.fetchone()[0], MaterializedOccurrence.objects.count())
@@ -1,10 +1,11 @@
 import datetime
 import pytz
 
+from django.db.models.signals import post_init
 from django.test import TestCase
 
 from schedule.models import Event, Rule, Calendar
-from schedule.models.events import Occurrence
+from schedule.models.events import GeneratedOccurrence, Occurrence
 from schedule.periods import Period
 
 
@@ -89,3 +90,122 @@ class TestOccurrence(TestCase):
 
 
 
+
+    def test_generated_occurrences_are_lightweight(self):
+        occurrence = self.recurring_event.get_occurrences(start=self.start, end=self.end)[0]
+        self.assertIsInstance(occurrence, GeneratedOccurrence)
+        self.assertFalse(hasattr(occurrence, '__dict__'))
+        self.assertIsNone(occurrence.pk)
+        self.assertEqual(occurrence.event_id, self.recurring_event.pk)
+        self.assertEqual(occurrence.get_lookups(), {'event_id': self.recurring_event.pk, 'start': occurrence.start})
+        self.assertEqual(occurrence, occurrence.to_occurrence())
+
+    def test_generated_occurrence_is_persisted_once(self):
+        occurrence = self.recurring_event.get_occurrences(start=self.start, end=self.end)[0]
+        occurrence.cancel()
+        pk = occurrence.pk
+        self.assertTrue(pk)
+        occurrence.move(occurrence.start + datetime.timedelta(hours=1), occurrence.end)
+        occurrence.uncancel()
+        persisted = Occurrence.objects.get(event=self.recurring_event)
+        self.assertEqual(persisted.pk, pk)
+        self.assertEqual(persisted.start, occurrence.start)
+        self.assertFalse(persisted.cancelled)
+        self.assertIsNotNone(occurrence.created_on)
+        self.assertIs(occurrence.to_occurrence().pk, pk)
+
+    def test_get_occurrence_returns_model(self):
+        occurrence = self.recurring_event.get_occurrence(datetime.datetime(2008, 1, 12, 8, 0, tzinfo=pytz.utc))
+        self.assertIsInstance(occurrence, Occurrence)
+        self.assertIsNone(occurrence.pk)
+
+    def test_iter_occurrences(self):
+        occurrences = self.recurring_event.get_occurrences(start=self.start, end=self.end)
+        occurrences[0].move(occurrences[0].start + datetime.timedelta(days=10),
+                            occurrences[0].end + datetime.timedelta(days=10))
+        occurrences[1].cancel()
+        # moved into the window from before it, and cancelled outside of it
+        outside = self.recurring_event.get_occurrences(
+            start=datetime.datetime(2008, 1, 5, 0, 0, tzinfo=pytz.utc), end=self.start)
+        outside[0].move(outside[0].start + datetime.timedelta(days=15),
+                        outside[0].end + datetime.timedelta(days=15))
+        later = self.recurring_event.get_occurrences(
+            start=self.end, end=datetime.datetime(2008, 2, 10, 0, 0, tzinfo=pytz.utc))
+        later[0].move(self.start, self.start + datetime.timedelta(hours=1))
+        later[0].cancel()
+        expected = sorted(self.recurring_event.get_occurrences(start=self.start, end=self.end),
+                          key=lambda occ: occ.start)
+        iterated = list(self.recurring_event.iter_occurrences(self.start, self.end))
+        self.assertEqual([(o.start, o.end, o.cancelled, o.pk) for o in iterated],
+                         [(o.start, o.end, o.cancelled, o.pk) for o in expected])
+
+    def test_iter_occurrences_stops_early(self):
+        self.recurring_event.end_recurring_period = None
+        occurrences = self.recurring_event.iter_occurrences(
+            self.start, datetime.datetime(9999, 1, 1, tzinfo=pytz.utc))
+        self.assertEqual(next(occurrences).start, datetime.datetime(2008, 1, 12, 8, 0, tzinfo=pytz.utc))
+        self.assertEqual(next(occurrences).start, datetime.datetime(2008, 1, 19, 8, 0, tzinfo=pytz.utc))
+
+    def test_count_occurrences(self):
+        occurrences = self.recurring_event.get_occurrences(start=self.start, end=self.end)
+        occurrences[0].move(occurrences[0].start - datetime.timedelta(days=10),
+                            occurrences[0].end - datetime.timedelta(days=10))
+        occurrences[1].cancel()
+        later = self.recurring_event.get_occurrences(
+            start=self.end, end=datetime.datetime(2008, 2, 10, 0, 0, tzinfo=pytz.utc))
+        later[0].move(self.start, self.start + datetime.timedelta(hours=1))
+        monthly = Event.objects.create(rule=Rule.objects.create(frequency="MONTHLY"),
+                                       **dict(self.data, start=self.start, end=self.end))
+        single = Event.objects.create(**self.data)
+        windows = [
+            (self.start, self.end),
+            (datetime.datetime(2008, 1, 1, tzinfo=pytz.utc), datetime.datetime(2008, 12, 1, tzinfo=pytz.utc)),
+            (datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc), datetime.datetime(2008, 1, 6, tzinfo=pytz.utc)),
+            (datetime.datetime(2009, 1, 1, tzinfo=pytz.utc), datetime.datetime(2009, 2, 1, tzinfo=pytz.utc)),
+        ]
+        create_occurrence = Event._create_occurrence
+        for start, end in windows:
+            for event in (self.recurring_event, monthly, single):
+                expected = len(event.get_occurrences(start, end))
+                Event._create_occurrence = None
+                try:
+                    with self.assertNumQueries(1):
+                        self.assertEqual(event.count_occurrences(start, end), expected)
+                    with self.assertNumQueries(1):
+                        self.assertEqual(event.has_occurrences(start, end), expected > 0)
+                finally:
+                    Event._create_occurrence = create_occurrence
+            expected = len(list(self.recurring_event.calendar.iter_occurrences(start, end)))
+            with self.assertNumQueries(2):
+                self.assertEqual(self.recurring_event.calendar.count_occurrences(start, end), expected)
+
+    def test_persisted_occurrences_are_loaded_for_the_window(self):
+        for occurrence in self.recurring_event.get_occurrences(
+                datetime.datetime(2008, 2, 1, tzinfo=pytz.utc), datetime.datetime(2008, 5, 1, tzinfo=pytz.utc)):
+            occurrence.cancel()
+        occurrences = self.recurring_event.get_occurrences(start=self.start, end=self.end)
+        occurrences[0].cancel()
+        # moved into the window from far outside of it
+        later = self.recurring_event.get_occurrence(datetime.datetime(2008, 5, 3, 8, 0, tzinfo=pytz.utc))
+        later.move(self.start, self.start + datetime.timedelta(hours=1))
+        loaded = []
+
+        def count_loaded(sender, instance, **kwargs):
+            loaded.append(instance)
+
+        post_init.connect(count_loaded, sender=Occurrence)
+        try:
+            with self.assertNumQueries(1):
+                occurrences = self.recurring_event.get_occurrences(start=self.start, end=self.end)
+            self.assertEqual(len(loaded), 2)
+            self.assertEqual([o.cancelled for o in occurrences], [True, False, False, False])
+            del loaded[:]
+            with self.assertNumQueries(1):
+                self.assertEqual(len(list(self.recurring_event.iter_occurrences(self.start, self.end))), 4)
+            self.assertEqual(len(loaded), 2)
+            del loaded[:]
+            occurrences = self.recurring_event.occurrences_after(datetime.datetime(2008, 4, 20, tzinfo=pytz.utc))
+            self.assertTrue(next(occurrences).cancelled)
+            self.assertEqual(len(loaded), 2)
+        finally:
+            post_init.disconnect(count_loaded, sender=Occurrence)
@@ -1,6 +1,7 @@
 from six.moves.builtins import zip
 from six.moves.builtins import range
 import datetime
+import itertools
 import pytz
 
 from django.test import TestCase
@@ -8,7 +9,7 @@ from django.conf import settings
 
 from django.conf import settings
 from schedule.models import Event, Rule, Calendar
-from schedule.periods import Period, Month, Day, Year, Week
+from schedule.periods import ExpansionContext, OccurrenceIndex, Period, Month, Day, Year, Week
 
 class TestPeriod(TestCase):
 
@@ -255,6 +256,160 @@ class TestOccurrencePool(TestCase):
         self.assertEqual(parent_period.occurrences, period.occurrences)
 
 
+class TestOccurrenceIndex(TestCase):
+
+    def setUp(self):
+        cal = Calendar.objects.create(name="MyCal")
+        start = datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc)
+        for hours, frequency in ((1, "DAILY"), (5, "HOURLY"), (24 * 3, "WEEKLY"), (24 * 40, None)):
+            Event.objects.create(
+                title='%d hours' % hours,
+                start=start,
+                end=start + datetime.timedelta(hours=hours),
+                rule=Rule.objects.create(frequency=frequency) if frequency else None,
+                calendar=cal)
+        self.month = Month(Event.objects.all(), start)
+
+    def test_between(self):
+        index = OccurrenceIndex(self.month.occurrences)
+        start = self.month.start - datetime.timedelta(days=2)
+        while start < self.month.end:
+            end = start + datetime.timedelta(hours=7)
+            self.assertEqual(
+                index.between(start, end),
+                [o for o in self.month.occurrences if o.start <= end and o.end >= start])
+            start += datetime.timedelta(hours=5)
+
+    def test_bucket(self):
+        for name in ('UTC', 'America/Los_Angeles', 'Asia/Kolkata'):
+            month = Month(Event.objects.all(), self.month.start, tzinfo=pytz.timezone(name))
+            days = [Day(month.events, month.start + datetime.timedelta(days=i), tzinfo=month.tzinfo)
+                    for i in range(31)]
+            index = OccurrenceIndex(month.occurrences)
+            self.assertEqual(index.bucket([(day.utc_start, day.utc_end) for day in days]),
+                             [index.between(day.utc_start, day.utc_end) for day in days])
+
+    def test_bucket_occurrences(self):
+        index = self.month.occurrence_index
+        week = next(self.month.get_weeks())
+        cells = [(day.utc_start, day.utc_end) for day in week.get_days()]
+        buckets = index.bucket(cells, week.occurrences)
+        self.assertEqual(buckets, index.bucket(cells))
+        self.assertTrue(all(occ in week.occurrences for bucket in buckets for occ in bucket))
+
+    def test_sub_periods(self):
+        index = self.month.occurrence_index
+        for week in self.month.get_weeks():
+            self.assertIs(week.occurrence_pool, index)
+            for day in week.get_days():
+                self.assertIs(day.occurrence_index, index)
+                if day.end > self.month.end:
+                    continue
+                self.assertEqual(
+                    self.partials(day), self.partials(Day(Event.objects.all(), day.start)))
+
+    def partials(self, period):
+        return sorted((p['occurrence'].event_id, p['occurrence'].start, p['class'])
+                      for p in period.get_occurrence_partials())
+
+
+class TestBatchedOccurrences(TestCase):
+
+    def setUp(self):
+        cal = Calendar.objects.create(name="MyCal")
+        start = datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc)
+        for i, frequency in enumerate(("WEEKLY", "DAILY", "MONTHLY", None)):
+            event = Event.objects.create(
+                title='Event %d' % i,
+                start=start + datetime.timedelta(hours=i),
+                end=start + datetime.timedelta(hours=i + 1),
+                rule=Rule.objects.create(frequency=frequency) if frequency else None,
+                calendar=cal)
+            occurrences = event.get_occurrences(start, start + datetime.timedelta(days=40))
+            occurrences[0].move(occurrences[0].start + datetime.timedelta(days=20),
+                                occurrences[0].end + datetime.timedelta(days=20))
+            if len(occurrences) > 1:
+                occurrences[1].cancel()
+        self.start = datetime.datetime(2008, 1, 1, tzinfo=pytz.utc)
+        self.end = datetime.datetime(2008, 2, 1, tzinfo=pytz.utc)
+
+    def test_occurrences_between(self):
+        events = list(Event.objects.select_related('rule'))
+        expected = []
+        for event in events:
+            expected += event.get_occurrences(self.start, self.end)
+        with self.assertNumQueries(1):
+            occurrences = Event.objects.occurrences_between(events, self.start, self.end)
+        self.assertEqual([(o.event_id, o.start, o.end, o.cancelled, o.pk) for o in occurrences],
+                         [(o.event_id, o.start, o.end, o.cancelled, o.pk) for o in sorted(expected)])
+
+    def test_iter_occurrences(self):
+        events = list(Event.objects.select_related('rule'))
+        expected = []
+        for event in events:
+            expected += event.get_occurrences(self.start, self.end)
+        self.assertSameOccurrences(
+            Event.objects.iter_occurrences_between(events, self.start, self.end), sorted(expected))
+        period = Period(Event.objects.select_related('rule'), self.start, self.end)
+        first = list(itertools.islice(period.iter_occurrences(), 5))
+        self.assertSameOccurrences(first, period.get_occurrences()[:5])
+        self.assertSameOccurrences(period.iter_occurrences(), period.get_occurrences())
+
+    def test_period_queries(self):
+        period = Month(Event.objects.select_related('rule'), self.start)
+        with self.assertNumQueries(2):
+            period.get_occurrence_partials()
+
+    def assertSameOccurrences(self, first, second):
+        self.assertEqual([(o.event_id, o.start, o.end, o.cancelled, o.pk) for o in first],
+                         [(o.event_id, o.start, o.end, o.cancelled, o.pk) for o in second])
+
+    def test_expansion_context(self):
+        month = Month(Event.objects.select_related('rule'), self.start)
+        with self.assertNumQueries(2):
+            month.get_occurrences()
+        # prev and next only expand the part of their window not covered yet
+        for period in (month.prev(), next(month), month.current_year()):
+            self.assertIs(period.expansion, month.expansion)
+            with self.assertNumQueries(1):
+                occurrences = period.get_occurrences()
+            self.assertSameOccurrences(occurrences, Event.objects.occurrences_between(
+                Event.objects.all(), period.start, period.end))
+        # the coalesced window serves every period inside of it
+        for period in (month.prev(), next(next(month)), Week(month.events, self.end, expansion=month.expansion)):
+            with self.assertNumQueries(0):
+                period.get_occurrences()
+
+    def test_moved_cancelled_occurrence(self):
+        daily = Event.objects.get(title='Event 1')
+        start = daily.start + datetime.timedelta(days=26)
+        moved = daily.get_occurrences(start, start + (daily.end - daily.start))[0]
+        moved.move(moved.start + datetime.timedelta(days=15), moved.end + datetime.timedelta(days=15))
+        moved.cancel()
+        events = Event.objects.select_related('rule')
+        february = Month(events, self.end)
+        expected = Event.objects.occurrences_between([daily], february.start, february.end)
+        self.assertNotIn(moved.pk, [o.pk for o in expected])
+        # a window covering both the original slot and where it moved to is
+        # expanded first
+        Period(events, self.start, february.end, expansion=february.expansion).get_occurrences()
+        self.assertSameOccurrences([o for o in february.get_occurrences() if o.event_id == daily.pk], expected)
+        year = Month(Event.objects.select_related('rule'), self.end).current_year()
+        year.get_occurrences()
+        february = next(month for month in year.get_months() if month.start.month == 2)
+        self.assertSameOccurrences([o for o in february.get_occurrences() if o.event_id == daily.pk], expected)
+
+    def test_shared_expansion_context(self):
+        expansion = ExpansionContext()
+        events = Event.objects.select_related('rule')
+        Month(events, self.start, expansion=expansion).get_occurrences()
+        with self.assertNumQueries(0):
+            Day(events, self.start + datetime.timedelta(days=4), expansion=expansion).get_occurrences()
+            Period(events, self.start, self.end, expansion=expansion).get_occurrences()
+        with self.assertNumQueries(2):
+            Month(Event.objects.select_related('rule'), self.start).get_occurrences()
+
+
 class TestAwareDay(TestCase):
     def setUp(self):
         self.timezone = pytz.timezone('Europe/Amsterdam')
@@ -0,0 +1,66 @@
+import datetime
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+import pytz
+
+from schedule import cache, prefetch
+from schedule.cache import get_cache, months_between
+from schedule.models import Calendar, Event, Rule
+from schedule.prefetch import Prefetcher, prefetch_window
+
+
+class TestPrefetch(TestCase):
+
+    def setUp(self):
+        self.settings = (cache.SCHEDULER_OCCURRENCE_CACHE, prefetch.SCHEDULER_PREFETCH, prefetch.prefetcher)
+        cache.SCHEDULER_OCCURRENCE_CACHE = True
+        prefetch.SCHEDULER_PREFETCH = True
+        # no threads, the tests run the queued windows themselves
+        prefetch.prefetcher = self.prefetcher = Prefetcher(workers=0, max_pending=2)
+        get_cache().clear()
+        self.calendar = Calendar.objects.create(name="MyCal", slug="mycal")
+        start = datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc)
+        Event.objects.create(title='Weekly', start=start, end=start + datetime.timedelta(hours=1),
+                             rule=Rule.objects.create(frequency="WEEKLY"), calendar=self.calendar)
+        self.start = datetime.datetime(2008, 2, 1, tzinfo=pytz.utc)
+        self.end = datetime.datetime(2008, 3, 1, tzinfo=pytz.utc)
+
+    def tearDown(self):
+        cache.SCHEDULER_OCCURRENCE_CACHE, prefetch.SCHEDULER_PREFETCH, prefetch.prefetcher = self.settings
+        get_cache().clear()
+
+    def cached_months(self):
+        keys = cache._chunk_keys(self.calendar.pk, months_between(
+            datetime.datetime(2007, 1, 1, tzinfo=pytz.utc), datetime.datetime(2009, 1, 1, tzinfo=pytz.utc)))
+        return set(keys[key] for key in get_cache().get_many(list(keys)))
+
+    def test_prefetch(self):
+        prefetch_window(self.calendar.pk, self.start, self.end)
+        self.assertEqual(self.cached_months(), set())
+        self.prefetcher.run_next()
+        self.assertEqual(self.cached_months(), set(months_between(self.start, self.end)))
+        self.assertEqual(self.prefetcher._pending, set())
+
+    def test_deduplication(self):
+        months = months_between(self.start, self.end)
+        self.assertTrue(self.prefetcher.submit(self.calendar.pk, months))
+        self.assertFalse(self.prefetcher.submit(self.calendar.pk, months[:1]))
+        self.assertTrue(self.prefetcher.submit(self.calendar.pk, [(2008, 4)]))
+        # the queue is full, the window is dropped
+        self.assertFalse(self.prefetcher.submit(self.calendar.pk, [(2008, 5)]))
+        self.prefetcher.run_next()
+        self.assertTrue(self.prefetcher.submit(self.calendar.pk, months))
+
+    def test_disabled(self):
+        prefetch.SCHEDULER_PREFETCH = False
+        prefetch_window(self.calendar.pk, self.start, self.end)
+        self.assertTrue(self.prefetcher._queue.empty())
+
+    def test_views(self):
+        self.client.get(reverse('month_calendar', kwargs={'calendar_slug': self.calendar.slug}),
+                        {'year': 2008, 'month': 2})
+        self.prefetcher.run_next()
+        self.prefetcher.run_next()
+        self.assertTrue(self.prefetcher._queue.empty())
+        self.assertTrue(set([(2008, 1), (2008, 3)]) <= self.cached_months())
@@ -0,0 +1,191 @@
+import datetime
+import itertools
+import pytz
+import unittest
+
+from django.test import TestCase
+
+from schedule.models import Event, Rule, Calendar
+from schedule.recurrence import (RRuleCache, rrule_cache, FixedIntervalRecurrence, SeekableRRule,
+                                 compile_rrule, iter_after, iter_between, last_occurrence_start, numpy)
+
+
+class TestRRuleCache(TestCase):
+
+    def setUp(self):
+        rrule_cache.clear()
+        self.cal = Calendar.objects.create(name="MyCal")
+        self.start = datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc)
+
+    def __create_event(self, rule, **kwargs):
+        data = {
+            'title': 'Recurring event',
+            'start': self.start,
+            'end': self.start + datetime.timedelta(hours=1),
+            'rule': rule,
+            'calendar': self.cal,
+        }
+        data.update(kwargs)
+        return Event.objects.create(**data)
+
+    def test_rrule_is_reused(self):
+        event = self.__create_event(Rule.objects.create(frequency="WEEKLY"))
+        # saving the event already expanded its rule for the effective bounds
+        rrule_cache.clear()
+        first = event.get_rrule_object()
+        second = event.get_rrule_object()
+        self.assertTrue(first is second)
+        self.assertEqual(rrule_cache.hits, 1)
+        self.assertEqual(rrule_cache.misses, 1)
+
+    def test_shared_by_rules_with_identical_params(self):
+        event1 = self.__create_event(Rule.objects.create(frequency="DAILY", params="count:5"))
+        event2 = self.__create_event(Rule.objects.create(frequency="DAILY", params="count:5"))
+        self.assertTrue(event1.get_rrule_object() is event2.get_rrule_object())
+
+    def test_changes_produce_a_new_rrule(self):
+        event = self.__create_event(Rule.objects.create(frequency="DAILY"))
+        rrule_cache.clear()
+        first = event.get_rrule_object()
+        event.rule_params = {'count': 3}
+        self.assertEqual(len(list(event.get_rrule_object())), 3)
+        event.start += datetime.timedelta(days=1)
+        self.assertFalse(first is event.get_rrule_object())
+        self.assertEqual(rrule_cache.misses, 3)
+
+    def test_eviction(self):
+        cache = RRuleCache(maxsize=2)
+        for key in range(3):
+            cache.get(key, lambda: object())
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+        cache.get(2, lambda: object())
+        self.assertEqual(cache.stats()['hits'], 1)
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestFixedIntervalRecurrence(TestCase):
+
+    def setUp(self):
+        self.amsterdam = pytz.timezone('Europe/Amsterdam')
+
+    def __event(self, frequency, start, params=None, rule_params=None):
+        rule = Rule.objects.create(frequency=frequency, params=params)
+        return Event(start=start, end=start + datetime.timedelta(hours=1),
+                     rule=rule, rule_params=rule_params)
+
+    def assertSameAsRRule(self, event, after, before):
+        recurrence = FixedIntervalRecurrence.from_event(event)
+        rule = compile_rrule(event)
+        self.assertTrue(recurrence is not None)
+        for inc in (True, False):
+            expected = rule.between(after, before, inc=inc)
+            actual = recurrence.between(after, before, inc=inc)
+            self.assertEqual(actual, expected)
+            self.assertEqual([dt.tzinfo for dt in actual], [dt.tzinfo for dt in expected])
+            self.assertEqual(recurrence.after(after, inc=inc), rule.after(after, inc=inc))
+            for dt in (after, before) + tuple(expected[:1]):
+                self.assertEqual(recurrence.before(dt, inc=inc), rule.before(dt, inc=inc))
+            self.assertEqual(list(iter_between(recurrence, after, before, inc)), expected)
+            self.assertEqual(list(iter_between(rule, after, before, inc)), expected)
+        self.assertEqual(list(itertools.islice(recurrence, 50)), list(itertools.islice(rule, 50)))
+        if recurrence.count is not None:
+            self.assertEqual(last_occurrence_start(recurrence), list(rule)[-1])
+
+    def test_matches_rrule(self):
+        starts = [
+            datetime.datetime(2008, 1, 5, 8, 0, 0, 1234, tzinfo=pytz.utc),
+            self.amsterdam.localize(datetime.datetime(2015, 3, 28, 8, 30)),
+            datetime.datetime(2008, 1, 5, 8, 0, 17),
+        ]
+        units = {
+            'WEEKLY': datetime.timedelta(weeks=1),
+            'DAILY': datetime.timedelta(days=1),
+            'HOURLY': datetime.timedelta(hours=1),
+            'MINUTELY': datetime.timedelta(minutes=1),
+            'SECONDLY': datetime.timedelta(seconds=1),
+        }
+        for frequency, unit in units.items():
+            windows = [
+                (unit * -3, unit * 40),
+                (unit * 400 + datetime.timedelta(seconds=1), unit * 431 + datetime.timedelta(microseconds=5)),
+            ]
+            for params in (None, 'interval:3', 'count:20', 'interval:2;count:7'):
+                for start in starts:
+                    for after, before in windows:
+                        event = self.__event(frequency, start, params)
+                        if start.tzinfo is None:
+                            after_dt, before_dt = start + after, start + before
+                        else:
+                            after_dt = (start + after).astimezone(pytz.timezone('US/Eastern'))
+                            before_dt = start + before
+                        self.assertSameAsRRule(event, after_dt, before_dt)
+
+    def test_boundaries(self):
+        start = datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc)
+        event = self.__event('DAILY', start)
+        self.assertSameAsRRule(event, start, start + datetime.timedelta(days=3))
+
+    def test_complex_rules_fall_back_to_rrule(self):
+        start = datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc)
+        self.assertEqual(FixedIntervalRecurrence.from_event(self.__event('MONTHLY', start)), None)
+        self.assertEqual(FixedIntervalRecurrence.from_event(self.__event('WEEKLY', start, 'byweekday:1,3')), None)
+        self.assertEqual(
+            FixedIntervalRecurrence.from_event(self.__event('DAILY', start, rule_params={'byhour': [8, 9]})),
+            None)
+
+
+class TestSeekableRRule(TestCase):
+
+    def __event(self, frequency, start, params=None):
+        rule = Rule.objects.create(frequency=frequency, params=params)
+        return Event(start=start, end=start + datetime.timedelta(hours=1), rule=rule)
+
+    def assertSameAsRRule(self, event, windows):
+        rule = compile_rrule(event)
+        seekable = SeekableRRule.from_event(event)
+        seekable.interval = 7
+        for after, before in windows:
+            for inc in (True, False):
+                self.assertEqual(seekable.between(after, before, inc=inc), rule.between(after, before, inc=inc))
+                self.assertEqual(seekable.after(after, inc=inc), rule.after(after, inc=inc))
+                for dt in (before, after) + tuple(rule.between(after, before, inc=True)[-1:]):
+                    self.assertEqual(seekable.before(dt, inc=inc), rule.before(dt, inc=inc))
+                self.assertEqual(list(itertools.islice(iter_after(seekable, after, inc), 20)),
+                                 list(itertools.islice(iter_after(rule, after, inc), 20)))
+        self.assertEqual(list(itertools.islice(seekable, 50)), list(itertools.islice(rule, 50)))
+        if seekable.count is not None:
+            self.assertEqual(last_occurrence_start(seekable), list(rule)[-1])
+            self.assertEqual(last_occurrence_start(rule), list(rule)[-1])
+
+    def test_matches_rrule(self):
+        rules = [
+            ('MONTHLY', datetime.datetime(2012, 1, 31, 8, 0, tzinfo=pytz.utc), None),
+            ('YEARLY', datetime.datetime(2012, 2, 29, 8, 0, tzinfo=pytz.utc), None),
+            ('YEARLY', datetime.datetime(2012, 1, 15, 8, 0, tzinfo=pytz.utc), 'bymonth:3,6;interval:2'),
+            ('WEEKLY', datetime.datetime(2012, 1, 5, 8, 0, tzinfo=pytz.utc), 'byweekday:0,4;interval:2'),
+            ('MONTHLY', datetime.datetime(2012, 1, 5, 8, 0, tzinfo=pytz.utc), 'byweekday:0,1,2,3,4;bysetpos:-1'),
+            ('HOURLY', datetime.datetime(2012, 1, 5, 8, 30, tzinfo=pytz.utc), 'interval:5;byhour:0,10,20'),
+            ('DAILY', datetime.datetime(2012, 1, 5, 8, 0, tzinfo=pytz.utc), 'interval:3;byweekday:1,3;count:300'),
+            ('DAILY', pytz.timezone('Europe/Amsterdam').localize(datetime.datetime(2012, 3, 20, 8, 0)),
+             'byhour:8,20'),
+        ]
+        windows = [
+            (datetime.datetime(2014, 5, 1, tzinfo=pytz.utc), datetime.datetime(2014, 7, 1, tzinfo=pytz.utc)),
+            (datetime.datetime(2012, 1, 1, tzinfo=pytz.utc), datetime.datetime(2012, 3, 1, tzinfo=pytz.utc)),
+            (datetime.datetime(2019, 5, 1, tzinfo=pytz.utc), datetime.datetime(2020, 5, 1, tzinfo=pytz.utc)),
+            (datetime.datetime(2013, 12, 31, tzinfo=pytz.utc), datetime.datetime(2014, 1, 2, tzinfo=pytz.utc)),
+        ]
+        for frequency, start, params in rules:
+            self.assertSameAsRRule(self.__event(frequency, start, params), windows)
+
+    def test_resumes_close_to_the_window(self):
+        event = self.__event('MONTHLY', datetime.datetime(1990, 1, 31, 8, 0, tzinfo=pytz.utc))
+        seekable = SeekableRRule.from_event(event)
+        seekable.interval = 12
+        start = datetime.datetime(2015, 3, 1, tzinfo=pytz.utc)
+        seekable.between(start, start + datetime.timedelta(days=31))
+        resumed = seekable._seek(start)
+        # twelve occurrences of the 31st span less than two years
+        self.assertTrue(start - datetime.timedelta(days=731) <= resumed._dtstart <= start)
+        self.assertEqual(seekable.after(start), datetime.datetime(2015, 3, 31, 8, 0, tzinfo=pytz.utc))
@@ -5,8 +5,8 @@ import datetime
 from django.test import TestCase
 from django.utils import timezone
 
-from schedule.models import Event, Rule, Calendar
-from schedule.utils import EventListManager
+from schedule.models import Event, Rule, Calendar, Occurrence
+from schedule.utils import EventListManager, OccurrenceReplacer
 
 
 class TestEventListManager(TestCase):
@@ -49,3 +49,87 @@ class TestEventListManager(TestCase):
         self.assertEqual(next(occurrences).event, self.event1)
         occurrences = eml.occurrences_after()
         self.assertEqual(list(occurrences), [])
+
+    def test_occurrences_after_skips_finished_events(self):
+        old = Event.objects.create(
+            title='Old Event',
+            start=datetime.datetime(2008, 1, 1, 8, 0, tzinfo=self.default_tzinfo),
+            end=datetime.datetime(2008, 1, 1, 9, 0, tzinfo=self.default_tzinfo),
+            calendar=self.event1.calendar)
+        after = datetime.datetime(2009, 4, 1, 0, 0, tzinfo=self.default_tzinfo)
+        eml = EventListManager(Event.objects.all())
+        self.assertNotIn(old, eml._unfinished_events(after))
+        occurrences = list(eml.occurrences_after(after))
+        self.assertEqual(occurrences, list(EventListManager([self.event1, self.event2]).occurrences_after(after)))
+        self.assertEqual(len(occurrences), 27 + 34)
+
+    def test_occurrences_after_reads_overrides_in_chunks(self):
+        after = datetime.datetime(2009, 4, 1, 0, 0, tzinfo=self.default_tzinfo)
+        late = self.event1.get_occurrences(datetime.datetime(2009, 9, 1, tzinfo=self.default_tzinfo),
+                                           datetime.datetime(2009, 9, 3, tzinfo=self.default_tzinfo))[0]
+        late.cancel()
+        eml = EventListManager([self.event1, self.event2])
+        occurrences = eml.occurrences_after(after)
+        # the first read covers a week
+        with self.assertNumQueries(1):
+            next(occurrences)
+        occurrences = list(occurrences)
+        self.assertEqual([occ.pk for occ in occurrences if occ.cancelled], [late.pk])
+
+    def test_iter_occurrences(self):
+        start = datetime.datetime(2009, 4, 28, 0, 0, tzinfo=self.default_tzinfo)
+        end = datetime.datetime(2009, 5, 10, 0, 0, tzinfo=self.default_tzinfo)
+        self.event2.get_occurrences(start, end)[1].cancel()
+        eml = EventListManager([self.event1, self.event2])
+        occurrences = list(eml.iter_occurrences(start, end))
+        self.assertEqual(occurrences,
+                         sorted(self.event1.get_occurrences(start, end) + self.event2.get_occurrences(start, end),
+                                key=lambda occ: occ.start))
+        self.assertEqual([occ.start for occ in occurrences], sorted(occ.start for occ in occurrences))
+        self.assertTrue(occurrences[2].cancelled)
+        self.assertEqual(occurrences, list(self.event1.calendar.iter_occurrences(start, end)))
+
+
+class TestOccurrenceReplacer(TestCase):
+    def setUp(self):
+        cal = Calendar.objects.create(name="MyCal")
+        self.start = datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc)
+        self.event = Event.objects.create(
+            title='Daily', start=self.start, end=self.start + datetime.timedelta(hours=1),
+            rule=Rule.objects.create(frequency="DAILY"), calendar=cal)
+        occurrences = self.event.get_occurrences(self.start, self.start + datetime.timedelta(days=20))
+        # move every other occurrence by a varying amount, and cancel some
+        for i, occurrence in enumerate(occurrences[::2]):
+            occurrence.move(occurrence.start + datetime.timedelta(hours=5 * i),
+                            occurrence.end + datetime.timedelta(hours=6 * i))
+            if i % 3 == 0:
+                occurrence.cancel()
+        self.persisted = list(Occurrence.objects.all())
+
+    def test_keys_on_event_ids(self):
+        with self.assertNumQueries(0):
+            replacer = OccurrenceReplacer(self.persisted)
+            generated = self.event._create_occurrence(self.start)
+            self.assertTrue(replacer.has_occurrence(generated))
+            self.assertEqual(replacer.get_occurrence(generated).pk, self.persisted[0].pk)
+
+    def test_additional_occurrences(self):
+        replacer = OccurrenceReplacer(self.persisted)
+        for days in range(-2, 25):
+            start = self.start + datetime.timedelta(days=days, hours=days)
+            for length in (datetime.timedelta(hours=1), datetime.timedelta(days=3)):
+                end = start + length
+                expected = [occ for occ in self.persisted
+                            if occ.start < end and occ.end >= start and not occ.cancelled]
+                self.assertEqual(
+                    sorted(occ.pk for occ in replacer.get_additional_occurrences(start, end)),
+                    sorted(occ.pk for occ in expected))
+
+    def test_reusable_across_windows(self):
+        replacer = OccurrenceReplacer(self.persisted)
+        for days in range(0, 20, 2):
+            start = self.start + datetime.timedelta(days=days)
+            end = start + datetime.timedelta(days=2)
+            self.assertEqual(
+                replacer.replace(self.event._get_occurrence_list(start, end), start, end),
+                self.event.get_occurrences(start, end))
@@ -9,7 +9,8 @@ from schedule.models.calendars import Calendar
 from schedule.models.events import Event
 from schedule.models.rules import Rule
 
-from schedule.views import check_next_url, coerce_date_dict
+from schedule import views
+from schedule.views import accepts_window, check_next_url, coerce_date_dict
 
 
 class TestViews(TestCase):
@@ -36,8 +37,34 @@ class TestViews(TestCase):
 
         self.client.login(username="admin", password="admin")
 
+    def test_two_argument_get_events(self):
+        # GET_EVENTS_FUNC as documented before it was given the window
+        def get_events(request, calendar):
+            return calendar.event_set.all()
+        get_events_func = views.GET_EVENTS_FUNC
+        views.GET_EVENTS_FUNC = get_events
+        try:
+            url = reverse('month_calendar', kwargs={'calendar_slug': self.calendar.slug})
+            response = self.client.get(url, {'year': 2008, 'month': 2})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.context['periods']['month'].get_occurrences())
+            start = datetime.datetime(2009, 1, 1, tzinfo=pytz.utc)
+            self.assertFalse(views.get_events(None, self.calendar, start, start + datetime.timedelta(days=31)))
+            self.assertEqual(list(views.get_events(None, self.calendar, self.event.start, self.event.end)),
+                             [self.event])
+        finally:
+            views.GET_EVENTS_FUNC = get_events_func
+
 
 class TestViewUtils(TestCase):
+    def test_accepts_window(self):
+        class GetEvents(object):
+            def __call__(self, request, calendar, **kwargs):
+                pass
+        self.assertTrue(accepts_window(lambda request, calendar, start=None, end=None: None))
+        self.assertTrue(accepts_window(GetEvents()))
+        self.assertFalse(accepts_window(lambda request, calendar: None))
+
     def test_check_next_url(self):
         url = "http://thauber.com"
         self.assertTrue(check_next_url(url) is None)
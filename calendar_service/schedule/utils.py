@@ -1,11 +1,15 @@
 from six.moves.builtins import object
+from bisect import bisect_left
+import datetime
 from functools import wraps
+from operator import attrgetter
 import pytz
 import heapq
 from annoying.functions import get_object_or_None
 from django.contrib.contenttypes.models import ContentType
 from django.http import HttpResponseRedirect
 from django.conf import settings
+from django.db.models.query import QuerySet
 from django.utils import timezone
 from django.utils.module_loading import import_string
 from schedule.conf.settings import (
@@ -13,6 +17,10 @@ from schedule.conf.settings import (
         CHECK_CALENDAR_PERM_FUNC,
         CALENDAR_VIEW_PERM)
 
+# how many days of persisted occurrences occurrences_after reads at first,
+# every further read covers twice as many
+OVERRIDE_CHUNK_DAYS = 7
+
 
 class EventListManager(object):
     """
@@ -30,34 +38,194 @@ class EventListManager(object):
         events.  This function produces a generator that yields the
         the most recent occurrence after the date ``after`` from any of the
         events in ``self.events``
+
+        Events that are over are skipped, the generator of an event is only
+        created once the merge gets close to its first occurrence, and the
+        persisted occurrences are read in chunks of growing length ahead of
+        the occurrences yielded, so nothing here grows with the history of
+        the events.
         """
         from schedule.models import Occurrence
 
         if after is None:
             after = timezone.now()
-        occ_replacer = OccurrenceReplacer(
-            Occurrence.objects.filter(event__in=self.events))
-        generators = [event._occurrences_after_generator(after) for event in self.events]
-        occurrences = []
+        events = [event for event in self._unfinished_events(after)
+                  if event.rule_id is None or not event.end_recurring_period or
+                  event.end_recurring_period + (event.end - event.start) > after]
+        if not events:
+            return
+        # only occurrences generated after ``after`` can be replaced
+        difference = max(event.end - event.start for event in events)
+        occ_replacer = OccurrenceReplacer([])
+        loaded_until = after - difference
+        chunk = OVERRIDE_CHUNK_DAYS
 
-        for generator in generators:
-            try:
-                heapq.heappush(occurrences, (next(generator), generator))
-            except StopIteration:
-                pass
-
-        while True:
-            if len(occurrences) == 0:
-                raise StopIteration
+        # no occurrence of an event ends before the event or ``after``
+        pending = sorted(events, key=lambda event: max(event.end, after), reverse=True)
+        occurrences = []
+        while pending or occurrences:
+            # start the events that can come before the next occurrence
+            while pending and (not occurrences or
+                               max(pending[-1].end, after) <= occurrences[0][0].end):
+                generator = pending.pop()._occurrences_after_generator(after)
+                try:
+                    heapq.heappush(occurrences, (next(generator), generator))
+                except StopIteration:
+                    pass
+            if not occurrences:
+                continue
 
             generator = occurrences[0][1]
-
             try:
                 next_occurence = heapq.heapreplace(occurrences, (next(generator), generator))[0]
             except StopIteration:
                 next_occurence = heapq.heappop(occurrences)[0]
+            # occurrences come out by end and start before it, so the persisted
+            # ones that started up to here are all that can replace this one
+            while loaded_until < next_occurence.end:
+                chunk_end = max(loaded_until + datetime.timedelta(days=chunk), next_occurence.end)
+                occ_replacer.extend(Occurrence.objects.filter(
+                    event__in=events, original_start__gt=loaded_until, original_start__lte=chunk_end))
+                loaded_until = chunk_end
+                chunk *= 2
             yield occ_replacer.get_occurrence(next_occurence)
 
+    def _unfinished_events(self, after):
+        """
+        Returns the events without the ones that ended before ``after`` and
+        do not repeat, filtered by the database when the events are a
+        queryset. There, series whose effective end is past are dropped too.
+        """
+        if isinstance(self.events, QuerySet):
+            return list(self.events.exclude(rule__isnull=True, end__lte=after).exclude(
+                effective_last_end__lte=after))
+        return [event for event in self.events if event.rule_id is not None or event.end > after]
+
+    def get_occurrences(self, start, end):
+        """
+        Returns the occurrences of all of the events between start and end,
+        see EventManager.occurrences_between.
+        """
+        from schedule.models import Event
+
+        return Event.objects.occurrences_between(self.events, start, end)
+
+    def iter_occurrences(self, start, end):
+        """
+        Yields the occurrences of all of the events between start and end in
+        start order, see Event.iter_occurrences. The persisted occurrences of
+        all events are loaded with a single query.
+        """
+        from schedule.models import Event
+
+        events = list(self.events)
+        persisted = dict((event.pk, []) for event in events)
+        for occ in Event.objects.persisted_occurrences(events, start, end):
+            persisted[occ.event_id].append(occ)
+        return merge_occurrences([event._iter_occurrences(start, end, persisted[event.pk])
+                                  for event in events])
+
+    def count_occurrences(self, start, end):
+        """
+        Returns how many occurrences the events have between start and end
+        without creating any, see Event.count_occurrences.
+        """
+        events, rows = self._override_rows(start, end)
+        return sum(event._count_occurrences(start, end, rows[event.pk]) for event in events)
+
+    def has_occurrences(self, start, end):
+        """
+        Returns True if any of the events has an occurrence between start and
+        end, without creating any.
+        """
+        events, rows = self._override_rows(start, end)
+        return any(event._has_occurrences(start, end, rows[event.pk]) for event in events)
+
+    def _override_rows(self, start, end):
+        """
+        Loads the rows Event._count_overrides needs for all of the events
+        with a single query, grouped by event id.
+        """
+        from schedule.models import Occurrence
+        from schedule.models.events import OVERRIDE_ROW_FIELDS, persisted_window_q
+
+        events = list(self.events)
+        rows = dict((event.pk, []) for event in events)
+        if events:
+            difference = max(event.end - event.start for event in events)
+            persisted = Occurrence.objects.filter(
+                persisted_window_q(start, end, difference), event__in=events)
+            for row in persisted.values_list('event_id', *OVERRIDE_ROW_FIELDS):
+                rows[row[0]].append(row[1:])
+        return events, rows
+
+
+def merge_occurrences(iterables, key=attrgetter('start')):
+    """
+    Lazily merges iterables of occurrences that are each ordered by ``key``,
+    the start by default, into a single iterator ordered by ``key``. Ties are
+    yielded in the order of the iterables, like sorting their concatenation.
+    """
+    heap = []
+    for index, iterable in enumerate(iterables):
+        iterator = iter(iterable)
+        for occ in iterator:
+            heap.append((key(occ), index, occ, iterator))
+            break
+    heapq.heapify(heap)
+    while heap:
+        __, index, occ, iterator = heap[0]
+        yield occ
+        for next_occ in iterator:
+            heapq.heapreplace(heap, (key(next_occ), index, next_occ, iterator))
+            break
+        else:
+            heapq.heappop(heap)
+
+
+def unique_occurrences(occurrences):
+    """
+    Returns ``occurrences`` without the duplicates that come out of
+    expanding overlapping windows, keeping persisted occurrences over
+    generated ones.
+    """
+    unique = {}
+    for occ in occurrences:
+        key = OccurrenceReplacer._key(occ)
+        if key not in unique or unique[key].pk is None:
+            unique[key] = occ
+    return list(unique.values())
+
+
+def shows_in_window(occ, start, end):
+    """
+    False for a cancelled persisted occurrence whose original slot is not
+    one of those generated for start to end: it only shows up in place of
+    its original, see Event.get_occurrences. The times of ``occ`` are not
+    checked.
+    """
+    return occ.pk is None or not occ.cancelled or occ.event._generates(
+        occ.original_start, occ.original_end, start, end)
+
+
+def occurrences_in_window(occurrences, start, end):
+    """
+    Returns the ``occurrences``, expanded for a window covering start to end,
+    that Event.get_occurrences would return for start to end.
+    """
+    in_window = []
+    for occ in occurrences:
+        if occ.pk is not None:
+            # the original slot need not be in the window ``occ`` was expanded for
+            included = occ.start < end and occ.end >= start and shows_in_window(occ, start, end)
+        elif occ.event.rule_id is None:
+            included = occ.start < end and occ.end > start
+        else:
+            included = occ.start <= end and occ.end >= start
+        if included:
+            in_window.append(occ)
+    return in_window
+
 
 class OccurrenceReplacer(object):
     """
@@ -65,30 +233,77 @@ class OccurrenceReplacer(object):
     before passing it forward is to make sure all of the occurrences that
     have been stored in the datebase replace, in the list you are returning,
     the generated ones that are equivalent.  This class makes this easier.
+
+    Persisted occurrences are looked up by event id, original start and
+    original end, and the ones that are not cancelled are kept sorted by
+    start, so that finding those moved into a window is a bisection. Nothing
+    is consumed by a lookup, so one replacer can serve any number of
+    windows, e.g. all sub-periods of a period.
     """
 
     def __init__(self, persisted_occurrences):
-        lookup = [((occ.event, occ.original_start, occ.original_end), occ) for
-                  occ in persisted_occurrences]
-        self.lookup = dict(lookup)
+        self.lookup = {}
+        self.extend(persisted_occurrences)
+
+    def extend(self, persisted_occurrences):
+        """
+        Adds more persisted occurrences, e.g. the next chunk of a series
+        that is read as it is iterated.
+        """
+        self.lookup.update((self._key(occ), occ) for occ in persisted_occurrences)
+        active = sorted((occ for occ in self.lookup.values() if not occ.cancelled),
+                        key=lambda occ: occ.start)
+        self._starts = [occ.start for occ in active]
+        self._active = active
+        # an occurrence in a window starts at most this long before it
+        self._max_duration = max([occ.end - occ.start for occ in active] or [datetime.timedelta(0)])
+
+    @staticmethod
+    def _key(occ):
+        return (occ.event_id, occ.original_start, occ.original_end)
 
     def get_occurrence(self, occ):
         """
-        Return a persisted occurrences matching the occ and remove it from lookup since it
-        has already been matched
+        Return the persisted occurrence matching occ, or occ itself if it was
+        not persisted.
         """
-        return self.lookup.pop(
-            (occ.event, occ.original_start, occ.original_end),
-            occ)
+        return self.lookup.get(self._key(occ), occ)
 
     def has_occurrence(self, occ):
-        return (occ.event, occ.original_start, occ.original_end) in self.lookup
+        return self._key(occ) in self.lookup
+
+    def get_additional_occurrences(self, start, end, matched=(), event_id=None):
+        """
+        Return persisted occurrences which are now in the period, except those
+        whose pk is in ``matched`` (the ones that replaced generated
+        occurrences of the period), optionally only those of the event with id
+        ``event_id``.
+        """
+        first = bisect_left(self._starts, start - self._max_duration)
+        last = bisect_left(self._starts, end)
+        return [occ for occ in self._active[first:last]
+                if occ.end >= start and occ.pk not in matched and
+                (event_id is None or occ.event_id == event_id)]
 
-    def get_additional_occurrences(self, start, end):
+    def replace(self, occurrences, start, end, event_id=None):
         """
-        Return persisted occurrences which are now in the period
+        Returns the generated ``occurrences`` of the period start to end with
+        the persisted ones that replace them, followed by the persisted
+        occurrences (of the event with id ``event_id`` if given) which
+        originated outside of the period but now fall within it.
         """
-        return [occ for _, occ in list(self.lookup.items()) if (occ.start < end and occ.end >= start and not occ.cancelled)]
+        final_occurrences = []
+        matched = set()
+        for occ in occurrences:
+            p_occ = self.lookup.get(self._key(occ))
+            if p_occ is None:
+                final_occurrences.append(occ)
+                continue
+            matched.add(p_occ.pk)
+            # ...but only if they are within this period
+            if p_occ.start < end and p_occ.end >= start:
+                final_occurrences.append(p_occ)
+        return final_occurrences + self.get_additional_occurrences(start, end, matched, event_id)
 
 
 def check_event_permissions(function):
@@ -1,12 +1,12 @@
 from future import standard_library
 standard_library.install_aliases()
+import inspect
 import json
 import pytz
 import datetime
 import dateutil.parser
 from urllib.parse import quote
 
-from django.db.models import Q
 from django.core.urlresolvers import reverse
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
@@ -19,12 +19,45 @@ from django.views.generic.edit import (
 
 from schedule.conf.settings import (GET_EVENTS_FUNC, OCCURRENCE_CANCEL_REDIRECT,
                                     EVENT_NAME_PLACEHOLDER)
+from schedule.cache import cached_occurrences
 from schedule.forms import EventForm, OccurrenceForm
+from schedule.horizon import materialized_occurrences
 from schedule.models import Calendar, Occurrence, Event
-from schedule.periods import weekday_names
+from schedule.periods import ExpansionContext, weekday_names
+from schedule.prefetch import prefetch_window
 from schedule.utils import check_event_permissions, check_calendar_permissions, coerce_date_dict
 
 
+def accepts_window(func):
+    """
+    True if ``func`` takes the start and end keyword arguments, False for
+    the two argument GET_EVENTS_FUNC(request, calendar) of older settings.
+    """
+    try:
+        spec = inspect.getargspec(func)
+    except TypeError:
+        # not a plain function, try the method a callable object is called by
+        try:
+            spec = inspect.getargspec(func.__call__)
+        except (TypeError, AttributeError):
+            return False
+    return spec.keywords is not None or ('start' in spec.args and 'end' in spec.args)
+
+
+def get_events(request, calendar, start, end):
+    """
+    Returns GET_EVENTS_FUNC(request, calendar) narrowed to the events that
+    can have occurrences between start and end, passing the window on to
+    functions that take it.
+    """
+    if accepts_window(GET_EVENTS_FUNC):
+        return GET_EVENTS_FUNC(request, calendar, start=start, end=end)
+    events = GET_EVENTS_FUNC(request, calendar)
+    if hasattr(events, 'intersecting'):
+        events = events.intersecting(start, end)
+    return events
+
+
 class CalendarViewPermissionMixin(object):
     @classmethod
     def as_view(cls, **initkwargs):
@@ -105,18 +138,26 @@ class CalendarByPeriodsView(CalendarMixin, DetailView):
                 raise Http404
         else:
             date = timezone.now()
-        event_list = GET_EVENTS_FUNC(request, calendar)
-
         if 'django_timezone' in self.request.session:
             local_timezone = pytz.timezone(request.session['django_timezone'])
         else:
             local_timezone = timezone.get_default_timezone()
+        start, end = self.get_window(periods, date, local_timezone)
+        event_list = get_events(request, calendar, start, end)
         period_objects = {}
+        # the periods of the page and those the templates derive from them
+        # expand each event at most once
+        expansion = ExpansionContext()
         for period in periods:
             if period.__name__.lower() == 'year':
-                period_objects[period.__name__.lower()] = period(event_list, date, None, local_timezone)
+                period_objects[period.__name__.lower()] = period(
+                    event_list, date, None, local_timezone, expansion=expansion)
             else:
-                period_objects[period.__name__.lower()] = period(event_list, date, None, None, local_timezone)
+                period_objects[period.__name__.lower()] = period(
+                    event_list, date, None, None, local_timezone, expansion=expansion)
+        for period in period_objects.values():
+            for adjacent in (period.prev(), next(period)):
+                prefetch_window(calendar.pk, adjacent.start, adjacent.end)
 
         context.update({
             'date': date,
@@ -127,6 +168,21 @@ class CalendarByPeriodsView(CalendarMixin, DetailView):
         })
         return context
 
+    def get_window(self, periods, date, tzinfo):
+        """
+        Returns the start and end of the time the periods of the page and the
+        previous and next ones the templates navigate to cover.
+        """
+        bounds = []
+        for period in periods:
+            # only the boundaries of these are used, they need no events
+            if period.__name__.lower() == 'year':
+                period = period(None, date, None, tzinfo)
+            else:
+                period = period(None, date, None, None, tzinfo)
+            bounds += [period.prev().start, next(period).end]
+        return min(bounds), max(bounds)
+
 
 class OccurrenceMixin(CalendarViewPermissionMixin, TemplateKwargMixin):
     model = Occurrence
@@ -299,25 +355,31 @@ def api_occurrences(request):
         i = Occurrence.objects.latest('id').id + 1
     else:
         i = 1
-    event_list = calendar.events.filter(start__lte=end).filter(
-        Q(end_recurring_period__gte=start) | Q(end_recurring_period__isnull=True) )
-    for event in event_list:
-        occurrences = event.get_occurrences(start, end)
-        for occurrence in occurrences:
-            if occurrence.id:
-                occurrence_id = occurrence.id
-                existed = True
-            else:
-                occurrence_id = i + occurrence.event.id
-                existed = False
-            response_data.append({
-                "id": occurrence_id,
-                "title": occurrence.title,
-                "start": occurrence.start.isoformat(),
-                "end": occurrence.end.isoformat(),
-                "existed" : existed,
-                "event_id" : occurrence.event.id,
-            })
+    # the start also narrows the events whose bounds were not backfilled yet
+    event_list = calendar.events.select_related('rule').filter(start__lte=end).intersecting(start, end)
+    occurrences = materialized_occurrences(event_list, start, end)
+    if occurrences is None:
+        occurrences = cached_occurrences(event_list, start, end)
+    if occurrences is None:
+        occurrences = Event.objects.occurrences_between(event_list, start, end)
+    # the next fetch is likely the range before or after this one
+    prefetch_window(calendar.pk, start - (end - start), start)
+    prefetch_window(calendar.pk, end, end + (end - start))
+    for occurrence in occurrences:
+        if occurrence.id:
+            occurrence_id = occurrence.id
+            existed = True
+        else:
+            occurrence_id = i + occurrence.event.id
+            existed = False
+        response_data.append({
+            "id": occurrence_id,
+            "title": occurrence.title,
+            "start": occurrence.start.isoformat(),
+            "end": occurrence.end.isoformat(),
+            "existed" : existed,
+            "event_id" : occurrence.event.id,
+        })
     return HttpResponse(json.dumps(response_data), content_type="application/json")
 
 def api_move_or_resize_by_code(request):